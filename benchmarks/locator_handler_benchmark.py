@@ -0,0 +1,121 @@
+"""
+Micro-benchmark of LocatorHandler.find_by_locator against the previous if/elif implementation
+
+Run from the project root:
+
+    PYTHONPATH=. python benchmarks/locator_handler_benchmark.py
+"""
+import timeit
+
+from coyote_framework.webdriver.webdriverwrapper.support import locator as loc
+from coyote_framework.webdriver.webdriverwrapper.support.LocatorHandler import LocatorHandler
+
+__author__ = 'justin@shapeways.com'
+
+
+ITERATIONS = 200000
+
+LOCATORS = [
+    loc.Locator('css', '.hello-world', 'hello world title'),
+    loc.Locator('xpath', '//div[@class="row"]/a', 'row link'),
+    loc.Locator('name', 'fname', 'first name input'),
+    'css=.submit-button',
+    'xpath=//form//input',
+    '#unhide',
+]
+
+
+class NullSearchObject(object):
+    """Stands in for a WebDriver so that only locator handling is measured"""
+
+    def _find(self, *args):
+        return []
+
+    find_element = find_elements = _find
+    find_element_by_css_selector = find_elements_by_css_selector = _find
+    find_element_by_id = find_elements_by_id = _find
+    find_element_by_xpath = find_elements_by_xpath = _find
+    find_element_by_class_name = find_elements_by_class_name = _find
+    find_element_by_link_text = find_elements_by_link_text = _find
+    find_element_by_partial_link_text = find_elements_by_partial_link_text = _find
+    find_element_by_name = find_elements_by_name = _find
+    find_element_by_tag_name = find_elements_by_tag_name = _find
+
+
+def legacy_find_by_locator(webdriver_or_element, locator, find_all_elements=False):
+    """The previous LocatorHandler.find_by_locator, which re-parsed the locator on every call"""
+    if isinstance(locator, loc.Locator):
+        locator = '{by}={locator}'.format(by=locator.by, locator=locator.locator)
+
+    if (locator.count('css=') > 0 or locator.count('css_selector=')) and len(locator.split('=', 1)) > 1:
+        if find_all_elements:
+            return webdriver_or_element.find_elements_by_css_selector(locator.split('=', 1)[-1])
+        else:
+            return webdriver_or_element.find_element_by_css_selector(locator.split('=', 1)[-1])
+    elif locator.count('id=') > 0 and len(locator.split('=')) > 1:
+        if find_all_elements:
+            return webdriver_or_element.find_elements_by_id(locator.split('=', 1)[-1])
+        else:
+            return webdriver_or_element.find_element_by_id(locator.split('=', 1)[-1])
+    elif locator.count('xpath=') > 0 and len(locator.split('=')) > 1:
+        if find_all_elements:
+            return webdriver_or_element.find_elements_by_xpath(locator.split('=', 1)[-1])
+        else:
+            return webdriver_or_element.find_element_by_xpath(locator.split('=', 1)[-1])
+    elif locator.count('class_name=') > 0 and len(locator.split('=')) > 1:
+        if find_all_elements:
+            return webdriver_or_element.find_elements_by_class_name(locator.split('=', 1)[-1])
+        else:
+            return webdriver_or_element.find_element_by_class_name(locator.split('=', 1)[-1])
+    elif locator.count('link_text=') > 0 and len(locator.split('=')) > 1:
+        if find_all_elements:
+            return webdriver_or_element.find_elements_by_link_text(locator.split('=', 1)[-1])
+        else:
+            return webdriver_or_element.find_element_by_link_text(locator.split('=', 1)[-1])
+    elif locator.count('partial_link_text=') > 0 and len(locator.split('=')) > 1:
+        if find_all_elements:
+            return webdriver_or_element.find_elements_by_partial_link_text(locator.split('=', 1)[-1])
+        else:
+            return webdriver_or_element.find_element_by_partial_link_text(locator.split('=', 1)[-1])
+    elif locator.count('name=') > 0 and len(locator.split('=')) > 1:
+        if find_all_elements:
+            return webdriver_or_element.find_elements_by_name(locator.split('=', 1)[-1])
+        else:
+            return webdriver_or_element.find_element_by_name(locator.split('=', 1)[-1])
+    elif locator.count('tag_name=') > 0 and len(locator.split('=')) > 1:
+        if find_all_elements:
+            return webdriver_or_element.find_elements_by_tag_name(locator.split('=', 1)[-1])
+        else:
+            return webdriver_or_element.find_element_by_tag_name(locator.split('=', 1)[-1])
+    else:
+        if find_all_elements:
+            return webdriver_or_element.find_elements_by_css_selector(locator)
+        else:
+            return webdriver_or_element.find_element_by_css_selector(locator)
+
+
+def run(find_function, iterations=ITERATIONS):
+    """Times iterations of find_function over every benchmark locator
+
+    @return: Best-of-three time in seconds
+    """
+    search_object = NullSearchObject()
+
+    def finds():
+        for locator in LOCATORS:
+            find_function(search_object, locator, True)
+
+    return min(timeit.repeat(finds, number=iterations // len(LOCATORS), repeat=3))
+
+
+def main():
+    legacy = run(legacy_find_by_locator)
+    compiled = run(LocatorHandler.find_by_locator)
+
+    print 'legacy find_by_locator:   {:.3f}s for {} finds'.format(legacy, ITERATIONS)
+    print 'compiled find_by_locator: {:.3f}s for {} finds'.format(compiled, ITERATIONS)
+    print 'speedup: {:.2f}x'.format(legacy / compiled)
+
+
+if __name__ == '__main__':
+    main()
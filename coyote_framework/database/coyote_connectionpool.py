@@ -0,0 +1,309 @@
+"""
+Connection pool module -- reuses database connections instead of opening one per query
+"""
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+__author__ = 'justin@shapeways.com'
+
+
+ROUND_ROBIN = 'round_robin'
+LEAST_LOADED = 'least_loaded'
+
+
+class ConnectionPoolTimeout(Exception):
+    """Raised when no connection could be checked out before the timeout"""
+
+
+def ping(connection):
+    """Default health check: MySQLdb connections are pinged, others (e.g. sqlite) run a trivial query
+
+    @return: True if the connection still works
+    """
+    try:
+        if hasattr(connection, 'ping'):
+            connection.ping()
+        else:
+            connection.cursor().execute('SELECT 1')
+        return True
+    except Exception:
+        return False
+
+
+class ConnectionPool(object):
+    """Thread safe pool of connections to one database
+
+        >>> pool = ConnectionPool(lambda: MySQLdb.connect(**settings), max_size=5, idle_timeout=300)
+        >>> with pool.connection() as db:
+        >>>     cursor = db.cursor()
+        >>>     cursor.execute(sql)
+
+    Idle connections are closed after idle_timeout seconds, and health checked before they are reused if they were
+    idle for more than health_check_after seconds. A connection is discarded instead of reused if the block using it
+    raised anything other than a database error of the query itself
+    """
+    def __init__(self, connect, max_size=5, idle_timeout=300, health_check=ping, health_check_after=30,
+                 checkout_timeout=30, reusable_errors=()):
+        """
+        @type connect: types.FunctionType
+        @param connect: opens a new connection
+        @type max_size: int
+        @param max_size: maximum number of connections, checked out or idle
+        @type idle_timeout: float
+        @param idle_timeout: seconds after which an idle connection is closed
+        @type health_check: types.FunctionType
+        @param health_check: called with a connection; falsy if the connection is broken
+        @type health_check_after: float
+        @param health_check_after: seconds a connection must have been idle before it is health checked
+        @type checkout_timeout: float
+        @param checkout_timeout: seconds to wait for a connection when all of them are checked out
+        @type reusable_errors: tuple
+        @param reusable_errors: exceptions raised by a block that leave its connection usable (e.g. a failed query)
+        """
+        if max_size < 1:
+            raise ValueError('Connection pools need a max_size of at least 1')
+
+        self.connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check = health_check
+        self.health_check_after = health_check_after
+        self.checkout_timeout = checkout_timeout
+        self.reusable_errors = reusable_errors
+        self.idle = []  # (connection, time it was released), most recently used last
+        self.size = 0  # connections open, checked out or idle
+        self.opened = 0  # connections opened over the life of the pool
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout=None):
+        """Checks out a healthy connection, opening a new one if none is idle and the pool is not full
+
+        @type timeout: float
+        @param timeout: seconds to wait for a connection when all of them are checked out; defaults to checkout_timeout
+        @return: the connection; give it back with release()
+        """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.time() + timeout
+        while True:
+            with self._condition:
+                connection, released = self._take_idle_or_reserve(deadline, timeout)
+
+            if connection is None:
+                break
+            if time.time() - released < self.health_check_after or self.health_check(connection):
+                return connection
+            self._discard(connection)
+
+        # a slot is reserved; connect outside of the lock
+        connection = None
+        try:
+            connection = self.connect()
+            return connection
+        finally:
+            with self._condition:
+                if connection is None:
+                    self.size -= 1
+                    self._condition.notify()
+                else:
+                    self.opened += 1
+
+    def _take_idle_or_reserve(self, deadline, timeout):
+        """Must hold the lock; returns an idle connection and when it was released, or (None, None) after reserving a
+        slot for a new connection"""
+        while True:
+            self._close_expired()
+            if self.idle:
+                return self.idle.pop()
+
+            if self.size < self.max_size:
+                self.size += 1
+                return None, None
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise ConnectionPoolTimeout('No connection became available within {} seconds'.format(timeout))
+            self._condition.wait(remaining)
+
+    def _close_expired(self):
+        """Must hold the lock; closes the connections idle for longer than idle_timeout (the oldest are first)"""
+        expired_before = time.time() - self.idle_timeout
+        while self.idle and self.idle[0][1] < expired_before:
+            connection, _ = self.idle.pop(0)
+            self.size -= 1
+            self._close(connection)
+
+    def release(self, connection, discard=False):
+        """Gives a connection back to the pool, rolling back anything left uncommitted
+
+        @param connection: a connection from acquire()
+        @type discard: bool
+        @param discard: close the connection instead of reusing it
+        """
+        if not discard:
+            try:
+                connection.rollback()
+            except Exception, e:
+                logging.getLogger(__name__).info('Could not roll back connection, closing it instead: {}'.format(e))
+                discard = True
+
+        if discard:
+            self._discard(connection)
+        else:
+            with self._condition:
+                self.idle.append((connection, time.time()))
+                self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context checking out a connection, and giving it back when the block exits"""
+        connection = self.acquire()
+        discard = False
+        try:
+            yield connection
+        except Exception, e:
+            discard = not isinstance(e, self.reusable_errors)
+            raise
+        finally:
+            self.release(connection, discard=discard)
+
+    def close(self):
+        """Closes the idle connections; checked out connections are still given back (and reused) as usual"""
+        with self._condition:
+            idle, self.idle = self.idle, []
+            self.size -= len(idle)
+            self._condition.notify_all()
+        for connection, _ in idle:
+            self._close(connection)
+
+    @property
+    def in_use(self):
+        """
+        @rtype: int
+        @return: number of connections checked out (or being opened)
+        """
+        return self.size - len(self.idle)
+
+    def _discard(self, connection):
+        with self._condition:
+            self.size -= 1
+            self._condition.notify()
+        self._close(connection)
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception, e:
+            logging.getLogger(__name__).info('Could not close pooled connection ({})'.format(e))
+
+
+class ReplicaSet(object):
+    """The connection pools of a database's read replicas, choosing which replica serves each read
+
+        >>> replicas = ReplicaSet([replica1_pool, replica2_pool], selection=LEAST_LOADED)
+        >>> pool = replicas.choose()
+
+    ROUND_ROBIN takes the replicas in turn; LEAST_LOADED takes the replica with the fewest connections in use (in turn,
+    among equally loaded replicas). Replicas marked unhealthy are skipped for `cooldown` seconds
+    """
+    def __init__(self, pools, selection=ROUND_ROBIN, checkout_timeout=1, cooldown=30):
+        """
+        @type pools: list
+        @param pools: ConnectionPools of the replicas
+        @type selection: str
+        @param selection: ROUND_ROBIN or LEAST_LOADED
+        @type checkout_timeout: float
+        @param checkout_timeout: seconds a read waits for a busy replica before it reads elsewhere
+        @type cooldown: float
+        @param cooldown: seconds a replica that could not be reached is skipped
+        """
+        if not pools:
+            raise ValueError('A replica set needs at least one replica')
+        if selection not in (ROUND_ROBIN, LEAST_LOADED):
+            raise ValueError('Unknown replica selection "{}"'.format(selection))
+        self.pools = list(pools)
+        self.selection = selection
+        self.checkout_timeout = checkout_timeout
+        self.cooldown = cooldown
+        self._unhealthy_until = {}  # pool to the time it may be tried again
+        self._turns = itertools.count()
+        self._lock = threading.Lock()
+
+    def choose(self):
+        """
+        @rtype: ConnectionPool
+        @return: the pool of the replica to read from, or None if every replica is cooling down
+        """
+        now = time.time()
+        with self._lock:
+            turn = next(self._turns)
+            for pool, until in self._unhealthy_until.items():
+                if until <= now:
+                    del self._unhealthy_until[pool]
+            healthy = [pool for pool in self.pools if pool not in self._unhealthy_until]
+        if not healthy:
+            return None
+
+        count = len(healthy)
+        if self.selection == ROUND_ROBIN:
+            return healthy[turn % count]
+        rotated = [healthy[(turn + offset) % count] for offset in range(count)]
+        return min(rotated, key=lambda pool: pool.in_use)
+
+    def mark_unhealthy(self, pool):
+        """Skips a replica for the next `cooldown` seconds, e.g. because it could not be reached
+
+        @type pool: ConnectionPool
+        """
+        with self._lock:
+            self._unhealthy_until[pool] = time.time() + self.cooldown
+
+
+class PooledConnection(object):
+    """A checked out connection, which goes back to its pool when closed (or garbage collected) instead of closing
+
+    Cursors made from it keep it checked out for as long as they are used
+    """
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name == '_connection':
+            raise AttributeError(name)
+        return getattr(self._connection, name)
+
+    def cursor(self, *args, **kwargs):
+        return PooledCursor(self, self._connection.cursor(*args, **kwargs))
+
+    def close(self, discard=False):
+        """Gives the connection back to the pool
+
+        @type discard: bool
+        @param discard: close the connection instead of reusing it
+        """
+        connection, self._connection = self.__dict__.get('_connection'), None
+        if connection is not None:
+            self._pool.release(connection, discard=discard)
+
+    def __del__(self):
+        self.close()
+
+
+class PooledCursor(object):
+    """Cursor of a PooledConnection, keeping the connection checked out while the cursor is in use"""
+
+    def __init__(self, connection, cursor):
+        self.connection = connection
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name == '_cursor':
+            raise AttributeError(name)
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
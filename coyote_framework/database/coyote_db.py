@@ -1,11 +1,20 @@
+import atexit
 import inspect
 import datetime
+import logging
+import os
+import random
 import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
 
 import MySQLdb
 import MySQLdb.cursors
 from _mysql_exceptions import OperationalError
 from coyote_framework.config.database_config import DatabaseConfig
+from coyote_framework.database.coyote_connectionpool import ConnectionPool, ConnectionPoolTimeout, PooledConnection, \
+    ReplicaSet, ROUND_ROBIN
 from dateutil import parser
 from coyote_framework.mixins.stringconversion import get_delimited_string_from_list
 from ConfigParser import NoOptionError
@@ -29,16 +38,179 @@ class NOTSET(object):
     """
 
 
+# Connection pool settings, used when the database's config section does not set them
+POOL_DEFAULTS = {
+    'pool_max_size': 5,
+    'pool_idle_timeout': 300,
+}
+
+# Read replica settings, used when the database's config section does not set them
+REPLICA_DEFAULTS = {
+    'read_replicas': '',
+    'replica_selection': ROUND_ROBIN,
+    'replica_checkout_timeout': 1,
+    'replica_cooldown': 30,
+}
+
+# Query comment settings, used when the database config does not set them
+QUERY_COMMENT_DEFAULTS = {
+    'query_comments': True,
+    'query_comment_sample_rate': 1.0,
+}
+
+# Modules whose frames are skipped when looking for the code that made a query; add downstream wrappers of CoyoteDb
+# with CoyoteDb.skip_query_comment_modules
+QUERY_COMMENT_SKIP_MODULES = set([__name__])
+
+
 class CoyoteDb(object):
 
+    __pools = {}  # target database to its ConnectionPool
+    __pools_lock = threading.Lock()
+    __pools_pid = os.getpid()  # process the pools belong to; forked children open their own connections
+    __inherited_pools = []  # pools of the parent process, kept referenced so their connections are never closed here
+    __replica_sets = {}  # target database to the ReplicaSet of its read replicas, or None if it has none
+    __query_comments = {}  # call site (code object, line number) to its query comment
+    __query_comment_settings = None  # (enabled, sample rate), read from the config on first use
+
     @staticmethod
     def __get_db_cursor(target_database=None):
         db = CoyoteDb.__get_db_write_instance(target_database=target_database)
         return db.cursor()
 
+    @staticmethod
+    def __forget_inherited_pools():
+        """Drops the pools inherited from the parent process after a fork (e.g. by run_parallel), so that processes
+        never share a connection; the inherited connections are left open, since the parent still uses them
+        """
+        if CoyoteDb.__pools_pid != os.getpid():
+            CoyoteDb.__pools_pid = os.getpid()
+            CoyoteDb.__inherited_pools.extend(CoyoteDb.__pools.values())
+            CoyoteDb.__pools = {}
+            CoyoteDb.__replica_sets = {}
+            CoyoteDb.__pools_lock = threading.Lock()  # the parent's may have been held by another thread
+
+    @staticmethod
+    def __get_pool(target_database=None):
+        """Gets the connection pool of a database in this process, creating it (and reading its config) on first use
+
+        @rtype: ConnectionPool
+        """
+        CoyoteDb.__forget_inherited_pools()
+        pool = CoyoteDb.__pools.get(target_database)
+        if pool is None:
+            with CoyoteDb.__pools_lock:
+                pool = CoyoteDb.__pools.get(target_database)
+                if pool is None:
+                    db_config = DatabaseConfig(target_database=target_database)
+
+                    def setting(key):
+                        try:
+                            return float(db_config.get(key))
+                        except NoOptionError:
+                            return POOL_DEFAULTS[key]
+
+                    pool = ConnectionPool(
+                        lambda: CoyoteDb.__connect(db_config),
+                        max_size=int(setting('pool_max_size')),
+                        idle_timeout=setting('pool_idle_timeout'),
+                        reusable_errors=(MySQLdb.DatabaseError, sqlite3.DatabaseError)
+                    )
+                    CoyoteDb.__pools[target_database] = pool
+        return pool
+
+    @staticmethod
+    def __get_replica_set(target_database=None):
+        """Gets the read replicas of a database, from the config sections listed by its read_replicas setting; each
+        replica is pooled like any other database
+
+        @rtype: ReplicaSet
+        @return: the replicas, or None if the database has none
+        """
+        CoyoteDb.__forget_inherited_pools()
+        if target_database not in CoyoteDb.__replica_sets:
+            db_config = DatabaseConfig(target_database=target_database)
+
+            def setting(key):
+                try:
+                    return db_config.get(key)
+                except NoOptionError:
+                    return REPLICA_DEFAULTS[key]
+
+            sections = [section.strip() for section in setting('read_replicas').split(',') if section.strip()]
+            replicas = None
+            if sections:
+                replicas = ReplicaSet([CoyoteDb.__get_pool(section) for section in sections],
+                                      selection=setting('replica_selection'),
+                                      checkout_timeout=float(setting('replica_checkout_timeout')),
+                                      cooldown=float(setting('replica_cooldown')))
+            with CoyoteDb.__pools_lock:
+                CoyoteDb.__replica_sets.setdefault(target_database, replicas)
+        return CoyoteDb.__replica_sets[target_database]
+
+    @staticmethod
+    @contextmanager
+    def connection(target_database=None):
+        """Context checking out a pooled connection to the database, and giving it back when the block exits
+
+            >>> with CoyoteDb.connection() as db:
+            >>>     cursor = db.cursor()
+            >>>     cursor.execute(sql)
+            >>>     db.commit()
+
+        Anything left uncommitted is rolled back when the connection is given back
+        """
+        with CoyoteDb.__get_pool(target_database).connection() as db:
+            yield db
+
+    @staticmethod
+    def close_connections():
+        """Closes the idle connections of every pool of this process"""
+        CoyoteDb.__forget_inherited_pools()
+        with CoyoteDb.__pools_lock:
+            pools = CoyoteDb.__pools.values()
+        for pool in pools:
+            pool.close()
+
     @staticmethod
     def __get_db_write_instance(target_database=None):
-        db_config = DatabaseConfig(target_database=target_database)
+        """Checks out a pooled connection; it goes back to the pool once it (and its cursors) are closed or no longer
+        referenced
+
+        @rtype: PooledConnection
+        """
+        pool = CoyoteDb.__get_pool(target_database)
+        return PooledConnection(pool, pool.acquire())
+
+    @staticmethod
+    def __get_db_read_instance(target_database=None):
+        """Checks out a pooled connection to one of the database's read replicas, or to the database itself if it has
+        no replicas, the chosen replica is busy for longer than replica_checkout_timeout, or it can not be reached (in
+        which case it is skipped for replica_cooldown seconds)
+
+        @rtype: PooledConnection
+        """
+        replicas = CoyoteDb.__get_replica_set(target_database)
+        pool = replicas.choose() if replicas is not None else None
+        if pool is not None:
+            try:
+                return PooledConnection(pool, pool.acquire(timeout=replicas.checkout_timeout))
+            except ConnectionPoolTimeout, e:
+                logging.getLogger(__name__).info(
+                    'Read replica is busy, reading from the primary instead: {}'.format(e))
+            except Exception, e:
+                replicas.mark_unhealthy(pool)
+                logging.getLogger(__name__).warning(
+                    'Could not connect to a read replica, reading from the primary for the next {} seconds: {}'.format(
+                        replicas.cooldown, e))
+        return CoyoteDb.__get_db_write_instance(target_database=target_database)
+
+    @staticmethod
+    def __connect(db_config):
+        """Opens a new connection to the database of the config
+
+        @type db_config: DatabaseConfig
+        """
         db_type = db_config.get('database_type')
         if db_type == 'mysql':
             db_host = db_config.get('mysql_host')
@@ -57,7 +229,7 @@ class CoyoteDb(object):
             return db
         elif db_type == 'sqlite':
             db_filename = db_config.get('sqlite_file_location')
-            db = sqlite3.connect(db_filename)
+            db = sqlite3.connect(db_filename, check_same_thread=False)  # the pool hands it to one thread at a time
 
             def dict_factory(cursor, row):
                 d = {}
@@ -71,39 +243,81 @@ class CoyoteDb(object):
             raise NoOptionError('database_type', 'database')
 
     @staticmethod
-    def __add_query_comment(sql):
+    def __get_query_comment_settings():
         """
-        Adds a comment line to the query to be executed containing the line number of the calling
-        function.  This is useful for debugging slow queries, as the comment will show in the slow
-        query log
+        @rtype: tuple
+        @return: whether queries are commented, and the fraction of them that is
+        """
+        if CoyoteDb.__query_comment_settings is None:
+            db_config = DatabaseConfig()
+            try:
+                enabled = db_config.getbool('query_comments')
+            except NoOptionError:
+                enabled = QUERY_COMMENT_DEFAULTS['query_comments']
+            try:
+                sample_rate = db_config.getfloat('query_comment_sample_rate')
+            except NoOptionError:
+                sample_rate = QUERY_COMMENT_DEFAULTS['query_comment_sample_rate']
+            CoyoteDb.__query_comment_settings = (enabled, sample_rate)
+        return CoyoteDb.__query_comment_settings
+
+    @staticmethod
+    def skip_query_comment_modules(*module_names):
+        """Makes query comments point past the given modules, e.g. a subclass of CoyoteDb, to the code calling them
 
-        @type sql: str
-        @param sql: sql needing comment
-        @return:
+            >>> CoyoteDb.skip_query_comment_modules(__name__)
+
+        @type module_names: str
+        @param module_names: __name__ of each module to skip
         """
-        # Inspect the call stack for the originating call
-        file_name = ''
-        line_number = ''
-        caller_frames = inspect.getouterframes(inspect.currentframe())
-        for frame in caller_frames:
-            if "ShapewaysDb" not in frame[1]:
-                file_name = frame[1]
-                line_number = str(frame[2])
-                break
+        QUERY_COMMENT_SKIP_MODULES.update(module_names)
 
-        comment = "/*COYOTE: Q_SRC: {file}:{line} */\n".format(file=file_name, line=line_number)
-        return comment + sql,
+    @staticmethod
+    def __add_query_comment(args):
+        """
+        Adds a comment line to the query to be executed containing the file and line number of the
+        code that called into CoyoteDb (or a module added by skip_query_comment_modules).  This is
+        useful for debugging slow queries, as the comment will show in the slow query log
+
+        The comment is built once per call site; the query_comments and query_comment_sample_rate
+        database settings turn it off, or add it to only a fraction of the queries
+
+        @type args: tuple
+        @param args: arguments of cursor.execute, the sql first
+        @return: the arguments, with the comment added to the sql
+        """
+        enabled, sample_rate = CoyoteDb.__get_query_comment_settings()
+        if not enabled or (sample_rate < 1 and random.random() >= sample_rate):
+            return args
+
+        # Walk the call stack up to the originating call, outside of this module and the skipped ones
+        frame = sys._getframe(1)
+        while frame.f_back is not None and frame.f_globals.get('__name__') in QUERY_COMMENT_SKIP_MODULES:
+            frame = frame.f_back
+
+        call_site = (frame.f_code, frame.f_lineno)
+        comment = CoyoteDb.__query_comments.get(call_site)
+        if comment is None:
+            comment = "/*COYOTE: Q_SRC: {file}:{line} */\n".format(file=frame.f_code.co_filename, line=frame.f_lineno)
+            CoyoteDb.__query_comments[call_site] = comment
+        return (comment + args[0],) + tuple(args[1:])
 
 
     @staticmethod
     def get_single_record(*args, **kwargs):
-        db, cursor = CoyoteDb.execute(*args, **kwargs)
-        return cursor.fetchone()
+        db, cursor = CoyoteDb.execute_read_only(*args, **kwargs)
+        try:
+            return cursor.fetchone()
+        finally:
+            db.close()
 
     @staticmethod
     def get_all_records(*args, **kwargs):
-        db, cursor = CoyoteDb.execute(*args, **kwargs)
-        return cursor.fetchall()
+        db, cursor = CoyoteDb.execute_read_only(*args, **kwargs)
+        try:
+            return cursor.fetchall()
+        finally:
+            db.close()
 
     @staticmethod
     def get_single_instance(sql, class_type, *args, **kwargs):
@@ -276,40 +490,54 @@ class CoyoteDb(object):
     def execute(*args, **kwargs):
         """Executes the sql statement, but does not commit. Returns the cursor to commit
 
+        The connection is pooled: closing it (or dropping every reference to it and its cursor) gives it back to the
+        pool, rolling back anything left uncommitted
+
         @return: DB and cursor instance following sql execution
         """
-
-        # Inspect the call stack for the originating call
-        args = CoyoteDb.__add_query_comment(args[0])
         db = CoyoteDb.__get_db_write_instance(target_database=kwargs.pop('target_database', None))
-        filtered_kwargs = {k: v for k, v in kwargs.iteritems() if k != 'target_database'}
-
-        # Execute the query
-        cursor = db.cursor()
-        try:
-            cursor.execute(*args, **filtered_kwargs)
-        except OperationalError, e:
-            raise OperationalError('{} when executing: {}'.format(e.args, args[0]))
-        return db, cursor
+        return CoyoteDb.__execute(db, args, kwargs)
 
     @staticmethod
     def execute_read_only(*args, **kwargs):
-        # TODO: consolidate with execute
-        """Executes the sql statement, but does not commit. Returns the cursor to commit
+        """Executes a read only sql statement on one of the database's read replicas (set by the read_replicas config
+        setting), falling back to the database itself if it has none or the replica is busy or can not be reached
+
+        Replicas may lag behind the primary; pass use_primary=True to read something that was just written
 
         @return: DB and cursor instance following sql execution
         """
+        target_database = kwargs.pop('target_database', None)
+        if kwargs.pop('use_primary', False):
+            db = CoyoteDb.__get_db_write_instance(target_database=target_database)
+        else:
+            db = CoyoteDb.__get_db_read_instance(target_database=target_database)
+        return CoyoteDb.__execute(db, args, kwargs)
 
-        # Inspect the call stack for the originating call
-        args = CoyoteDb.__add_query_comment(args[0])
+    @staticmethod
+    def __execute(db, args, kwargs):
+        """Executes the sql statement on a checked out connection
+
+        The connection goes back to the pool if the statement fails, rather than when the traceback (which keeps it
+        checked out) is garbage collected
 
-        # Execute the query
-        db = CoyoteDb.__get_db_read_instance()
-        cursor = db.cursor()
+        @type db: PooledConnection
+        @return: DB and cursor instance following sql execution
+        """
         try:
+            # Inspect the call stack for the originating call
+            args = CoyoteDb.__add_query_comment(args)
+
+            # Execute the query
+            cursor = db.cursor()
             cursor.execute(*args, **kwargs)
         except OperationalError, e:
+            db.close(discard=True)  # the connection may be broken
             raise OperationalError('{} when executing: {}'.format(e.args, args[0]))
+        except Exception:
+            error = sys.exc_info()
+            db.close()
+            raise error[0], error[1], error[2]
         return db, cursor
 
     @staticmethod
@@ -319,7 +547,10 @@ class CoyoteDb(object):
         @return: None
         """
         db, cursor = CoyoteDb.execute(*args, **kwargs)
-        db.commit()
+        try:
+            db.commit()
+        finally:
+            db.close()
         return cursor
 
     @staticmethod
@@ -446,3 +677,6 @@ class CoyoteDb(object):
         """
         string = MySQLdb.escape_string(string)
         return string
+
+
+atexit.register(CoyoteDb.close_connections)
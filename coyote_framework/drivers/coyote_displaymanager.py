@@ -0,0 +1,284 @@
+"""
+Display manager module -- shares a few virtual X displays between the headless browsers of a process
+"""
+import atexit
+import logging
+import socket
+import threading
+
+from coyote_framework.config.browser_config import BrowserConfig
+from coyote_framework.util.apps.polling import polling
+
+__author__ = 'justin@shapeways.com'
+
+
+X11_SOCKET = '/tmp/.X11-unix/X{}'
+
+
+def is_display_ready(display_number):
+    """
+    Readiness probe: the display is ready once its X socket accepts connections
+
+    @type display_number:   int
+    @rtype:                 bool
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(X11_SOCKET.format(display_number))
+        return True
+    except socket.error:
+        return False
+    finally:
+        connection.close()
+
+
+class ManagedDisplay(object):
+    """
+    One virtual display (Xvfb server) and the number of browsers using it; `ready` is cleared while the display is
+    (re)started, and `error` holds the exception if that failed
+    """
+    def __init__(self, display=None):
+        self.display = display
+        self.clients = 0
+        self.restarts = 0
+        self.error = None
+        self.ready = threading.Event()
+        if display is not None:
+            self.ready.set()
+
+    @property
+    def number(self):
+        return self.display.display
+
+    @property
+    def pid(self):
+        return self.display.pid
+
+
+class DisplayLease(object):
+    """
+    A browser's share of a managed display; stop() gives it back (it does not stop the shared Xvfb server), so a lease
+    can be passed to WebDriverWrapper as its display. WebDriverWrapper never kills a shared display's process
+    """
+    shared = True
+
+    def __init__(self, manager, managed_display):
+        self.manager = manager
+        self.managed_display = managed_display
+        self.display = managed_display.number
+        self.pid = managed_display.pid
+        self.stopped = False
+
+    @property
+    def name(self):
+        """
+        @rtype:     str
+        @return:    the DISPLAY environment value for the browser, e.g. ":1001"
+        """
+        return ':{}'.format(self.display)
+
+    def stop(self):
+        if not self.stopped:
+            self.stopped = True
+            self.manager.release(self)
+
+    def __repr__(self):
+        return 'DisplayLease({}, pid={})'.format(self.name, self.pid)
+
+
+class DisplayManager(object):
+    """
+    Pool of virtual displays handed out to headless browsers
+
+        >>> manager = DisplayManager(max_displays=2, clients_per_display=8)
+        >>> lease = manager.acquire()
+        >>> binary = get_firefox_binary(display=lease)  # launches Firefox with DISPLAY=lease.name
+        >>> lease.stop()
+
+    Browsers are put on the least used display; a new display is only started when every running display already
+    has clients_per_display browsers (and there are fewer than max_displays). Displays stay up when their last
+    browser leaves, and dead displays are restarted the next time they would be handed out
+    """
+    def __init__(self, factory=None, max_displays=2, clients_per_display=8, size=(1280, 1024), startup_timeout=60,
+                 probe=is_display_ready):
+        """
+        @type factory:                  types.FunctionType
+        @param factory:                 creates an unstarted display from a size; defaults to pyvirtualdisplay's
+                                        Display
+        @type max_displays:             int
+        @param max_displays:            maximum number of displays running at once
+        @type clients_per_display:      int
+        @param clients_per_display:     browsers per display before another display is started
+        @type size:                     tuple
+        @param size:                    (width, height) of the displays
+        @type startup_timeout:          float
+        @param startup_timeout:         seconds to wait for a display to pass the readiness probe
+        @type probe:                    types.FunctionType
+        @param probe:                   called with the display number; truthy once the display accepts connections
+        """
+        if max_displays < 1 or clients_per_display < 1:
+            raise ValueError('Display managers need a max_displays and clients_per_display of at least 1')
+
+        if factory is None:
+            from pyvirtualdisplay import Display
+            factory = lambda size: Display(visible=0, size=size)
+
+        self.factory = factory
+        self.max_displays = max_displays
+        self.clients_per_display = clients_per_display
+        self.size = size
+        self.startup_timeout = startup_timeout
+        self.probe = probe
+        self.displays = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self):
+        """
+        Gets a share of a running display, starting or restarting a display if needed; displays are started outside
+        the manager's lock, so other browsers can acquire and release shares meanwhile
+
+        @rtype:     DisplayLease
+        @return:    the lease; give it back with its stop()
+        """
+        while True:
+            start = restart = False
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError('The display manager is closed')
+
+                managed_display = self._least_used()
+                if managed_display is None or (managed_display.clients >= self.clients_per_display and
+                                               len(self.displays) < self.max_displays):
+                    managed_display = ManagedDisplay()
+                    self.displays.append(managed_display)
+                    start = True
+                elif managed_display.ready.is_set() and not self.is_alive(managed_display):
+                    managed_display.ready.clear()
+                    managed_display.error = None
+                    restart = True
+                managed_display.clients += 1
+
+            if start or restart:
+                self._bring_up(managed_display, restart)
+            else:
+                managed_display.ready.wait()
+                if managed_display.error is not None:
+                    # another browser's start of this display failed (and raised there); pick a display again
+                    continue
+
+            return DisplayLease(self, managed_display)
+
+    def release(self, lease):
+        """
+        Gives back a share of a display; the display keeps running for the next browser
+
+        @type lease:    DisplayLease
+        """
+        with self._lock:
+            lease.managed_display.clients = max(0, lease.managed_display.clients - 1)
+
+    def is_alive(self, managed_display):
+        """
+        @rtype:     bool
+        @return:    True if the display's server is running and accepts connections
+        """
+        try:
+            return bool(managed_display.display.is_alive() and self.probe(managed_display.number))
+        except Exception:
+            return False
+
+    def close(self):
+        """
+        Stops every display, including the ones browsers still use
+        """
+        with self._lock:
+            self._closed = True
+            displays, self.displays = self.displays, []
+        for managed_display in displays:
+            # displays still starting are stopped by the browser starting them
+            if managed_display.ready.is_set() and managed_display.display is not None:
+                self._stop(managed_display.display)
+
+    def _least_used(self):
+        if not self.displays:
+            return None
+        return min(self.displays, key=lambda managed_display: managed_display.clients)
+
+    def _bring_up(self, managed_display, restart):
+        """
+        (Re)starts a display outside the lock, and wakes the browsers waiting for it; a display that fails to start
+        is dropped from the pool
+        """
+        try:
+            if restart:
+                self._restart(managed_display)
+            else:
+                managed_display.display = self._start()
+            with self._lock:
+                if self._closed:
+                    self._stop(managed_display.display)
+                    raise RuntimeError('The display manager was closed while display :{} started'.format(
+                        managed_display.number))
+        except Exception, e:
+            with self._lock:
+                if managed_display in self.displays:
+                    self.displays.remove(managed_display)
+            managed_display.error = e
+            raise
+        finally:
+            managed_display.ready.set()
+
+    def _start(self):
+        display = self.factory(self.size)
+        display.start()
+        try:
+            polling.poll(
+                lambda: display.is_alive() and self.probe(display.display),
+                step=0.05,
+                timeout=self.startup_timeout,
+                exception_message='Display :{} was not ready within {} seconds; process was: {}'.format(
+                    display.display, self.startup_timeout, display.pid)
+            )
+        except AssertionError:
+            self._stop(display)
+            raise
+        return display
+
+    def _restart(self, managed_display):
+        logging.getLogger(__name__).warn('Display :{} (process {}) died; restarting it'.format(
+            managed_display.number, managed_display.pid))
+        self._stop(managed_display.display)
+        managed_display.display = self._start()
+        managed_display.restarts += 1
+
+    @staticmethod
+    def _stop(display):
+        try:
+            display.stop()
+        except Exception, e:
+            logging.getLogger(__name__).info('Could not stop display :{} ({})'.format(display.display, e))
+
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+
+def get_default_display_manager():
+    """
+    Gets the process-wide display manager, sized by the display_pool_size, display_clients, viewport_width and
+    viewport_height browser settings
+
+    @rtype:     DisplayManager
+    """
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            browser_config = BrowserConfig()
+            _default_manager = DisplayManager(
+                max_displays=browser_config.getint('display_pool_size'),
+                clients_per_display=browser_config.getint('display_clients'),
+                size=(browser_config.getint('viewport_width'), browser_config.getint('viewport_height'))
+            )
+            atexit.register(_default_manager.close)
+        return _default_manager
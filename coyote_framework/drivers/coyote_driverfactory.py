@@ -2,14 +2,10 @@ import os
 import datetime
 import logging
 import socket
-import time
 import urllib2
 
-from selenium import webdriver
 from selenium.webdriver.firefox.firefox_binary import FirefoxBinary
 from selenium.common.exceptions import WebDriverException
-from selenium.webdriver import DesiredCapabilities
-from pyvirtualdisplay import Display
 from coyote_framework.config.constants_config import ConstantsConfig
 from coyote_framework.log.Logger import log
 
@@ -17,12 +13,17 @@ from coyote_framework.config.browser_config import BrowserConfig
 from coyote_framework.util.apps.randomwords import words
 from coyote_framework.mixins.filesystem import create_directory
 from coyote_framework.config.testrun_config import TestrunConfig
-from coyote_framework.util.apps.polling import polling
 from coyote_framework.mixins import timer
 from coyote_framework.webdriver.webdriver import driverfactory
 from coyote_framework.drivers.coyote_driver import CoyoteDriver
+from coyote_framework.drivers.coyote_displaymanager import get_default_display_manager
+from coyote_framework.drivers.coyote_driverlifecycle import get_default_lifecycle
+from coyote_framework.drivers.coyote_driverpool import get_default_pool
+from coyote_framework.drivers.coyote_profilecache import ProfileCache
+from coyote_framework.webdriver.webdriver.browsercapabilities import get_capabilities
 from coyote_framework.webdriver.webdriver.driverfactory import DriverFactory
 from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import quitting, BROWSER_LOG_LEVEL_SEVERE
+from coyote_framework.webdriver.webdriverwrapper.support.ActionCallbacks import ActionCallback
 
 
 __author__ = 'justin@shapeways.com'
@@ -31,11 +32,10 @@ __author__ = 'justin@shapeways.com'
 def get_firefox_profile():
     # TODO: update this so that it is not browser-specific
     constants_config = ConstantsConfig()
-    profile_directory = os.path.join(constants_config.get('webdriver_dir'), 'firefox', 'profile', 'tmp')
-    create_directory(profile_directory)
+    cache_directory = os.path.join(constants_config.get('webdriver_dir'), 'firefox', 'profile', 'cache')
 
-
-    ffprofile = webdriver.FirefoxProfile(profile_directory)
+    # The profile template (with the WebDriver extension installed) is built once; each launch gets a cheap copy
+    ffprofile = ProfileCache(cache_directory).new_profile()
 
     log_dir = os.path.join(constants_config.get('logs_dir'), 'webdriver')
     create_directory(log_dir)
@@ -48,9 +48,11 @@ def get_firefox_profile():
     return ffprofile
 
 
-def get_firefox_binary():
+def get_firefox_binary(display=None):
     """Gets the firefox binary
 
+    @type display: DisplayLease
+    @param display: virtual display to launch Firefox on, rather than the current DISPLAY
     @rtype: FirefoxBinary
     """
     browser_config = BrowserConfig()
@@ -63,6 +65,8 @@ def get_firefox_binary():
     log('Firefox log file: {}'.format(log_path))
 
     binary = FirefoxBinary(log_file=log_file)
+    if display is not None:
+        binary._firefox_env['DISPLAY'] = display.name
 
     return binary
 
@@ -75,7 +79,7 @@ def _log_fail_callback(driver, *args, **kwargs):
     """
 
     try:
-        logs = driver.get_browser_log(levels=[BROWSER_LOG_LEVEL_SEVERE])
+        logs = driver.get_browser_log(levels=[BROWSER_LOG_LEVEL_SEVERE], consumer='console_errors')
         failure_message = 'There were severe console errors on this page: {}'.format(logs)
         failure_message = failure_message.replace('{', '{{').replace('}', '}}')  # Escape braces for error message
         driver.assertion.assert_false(
@@ -87,27 +91,44 @@ def _log_fail_callback(driver, *args, **kwargs):
         pass
 
 
+def get_browser_name():
+    """Gets the driverfactory backend to launch, from the browser, use_remote, use_headless_browser and
+    use_native_headless browser settings
+
+    @rtype: str
+    """
+    browser_config = BrowserConfig()
+    if browser_config.getbool('use_remote'):
+        return driverfactory.REMOTE
+
+    browser = browser_config.get('browser')
+    if browser_config.getbool('use_headless_browser') and browser_config.getbool('use_native_headless'):
+        # Only Chrome has a native headless mode the pinned selenium can drive; Firefox stays on a virtual display
+        return {
+            driverfactory.CHROME: driverfactory.CHROME_HEADLESS,
+        }.get(browser, browser)
+    return browser
+
+
 @timer.time_this_function(datadog_key='function:new_driver')
-def new_driver():
+def new_driver(display=None):
     logger = logging.getLogger(__name__)
     browser_config = BrowserConfig()
+    browser_name = get_browser_name()
 
-    profile = get_firefox_profile()
-
-    # TODO 1/2/15: put the capabilities somewhere better
+    profile = None
     kwargs = dict()
 
-    if browser_config.getbool('use_remote'):
+    if browser_name == driverfactory.REMOTE:
         kwargs.update({
             'command_executor': browser_config.get('remote_command_executor'),
-            'desired_capabilities': DesiredCapabilities.FIREFOX
+            # Ignore unexpected alerts
+            'desired_capabilities': get_capabilities(browser_config.get('browser'), unexpectedAlertBehaviour='ignore')
         })
-        kwargs['desired_capabilities'].update({'unexpectedAlertBehaviour': 'ignore'})  # Ignore unexpected alerts
-
-        browser_name = driverfactory.REMOTE
-    else:
+    elif browser_name == driverfactory.FIREFOX:
+        profile = get_firefox_profile()
         # Make sure correct Firefox version is installed
-        binary = get_firefox_binary()
+        binary = get_firefox_binary(display=display)
 
         kwargs.update({
             'firefox_profile': profile,
@@ -115,15 +136,15 @@ def new_driver():
         })
         logger.debug('Driver profile is located at: {}'.format(profile.path))
         logger.debug('Driver binary is located at: {}'.format(binary._start_cmd))
-
-        browser_name = driverfactory.FIREFOX
+    elif browser_name == driverfactory.CHROME_HEADLESS:
+        kwargs['window_size'] = (browser_config.getint('viewport_width'), browser_config.getint('viewport_height'))
 
     try:
         driver = DriverFactory().new_driver(browser_name=browser_name,**kwargs)
     except WebDriverException, e:
         try:
             logger.critical('WebDriver could not start due to an error: {}'.format(e))
-            if 'load the profile' in e.msg:
+            if profile is not None and 'load the profile' in e.msg:
                 logger.critical('There was an error loading the driver profile! Gathering debugging information...')
 
                 profile_dir = profile.path
@@ -147,48 +168,32 @@ def new_driver_wrapper(startup_url=None):
     browser_config = BrowserConfig()
 
     display = None
-    if browser_config.getbool('use_headless_browser') and not browser_config.getbool('use_remote'):
-        display = Display(visible=0, size=(1280, 1024))
-        display.start()
-        display_pid = display.pid
-
-        def process_exists(pid):
-            try:
-                os.kill(pid, 0)
-            except OSError:
-                return False
-            else:
-                return True
-
-        polling.poll(
-            lambda: display.is_alive(),
-            timeout=60,
-            exception_message='Display was not alive; process was: {}'.format(display_pid),
-            ontimeout=(
-                lambda: logger.critical('Display process {} exists: {}'.format(
-                    display_pid,
-                    process_exists(display_pid))
-                ),
-            )
-        )
+    if (browser_config.getbool('use_headless_browser') and not browser_config.getbool('use_remote') and
+            not DriverFactory.is_headless(get_browser_name())):
+        # Headless browsers share a few virtual displays rather than starting an Xvfb server each
+        display = get_default_display_manager().acquire()
+        logger.debug('Driver display is {}'.format(display))
 
-        polling.poll(
-            lambda: display.is_started,
-            timeout=60,
-            exception_message='Display was alive but not started; process was: {}'.format(display_pid)
-        )
-
-        # TODO: Is there a better condition we can check here?
-        time.sleep(1.5)
-
-    driver = new_driver()
+    try:
+        driver = new_driver(display=display)
+    except:
+        if display is not None:
+            display.stop()
+        raise
 
     logging.getLogger(__name__).info('Browser successfully launched')
 
     action_callbacks = []
-    # Fail if there are errors in the console
-    if TestrunConfig().getbool('fail_on_console_errors'):
-        action_callbacks.append(_log_fail_callback)
+    # Fail if there are errors in the console; checked after navigating, at most every few seconds in between, and
+    # before quitting, rather than fetching the browser log after every action
+    testrun_config = TestrunConfig()
+    if testrun_config.getbool('fail_on_console_errors'):
+        action_callbacks.append(ActionCallback(
+            _log_fail_callback,
+            on_navigation=True,
+            debounce=testrun_config.getfloat('console_error_check_interval'),
+            on_teardown=True
+        ))
 
     driver_wrapper = CoyoteDriver(driver=driver, display=display, options={
         'timeout': 40,
@@ -202,3 +207,23 @@ def new_driver_wrapper(startup_url=None):
 
 def driver_context(startup_url=None, *args, **kwargs):
     return quitting(new_driver_wrapper(startup_url))
+
+
+def pooled_driver_context(*args, **kwargs):
+    """Leases a warm driver from the process-wide pool instead of launching a new browser; the driver is reset and
+    returned to the pool when the context exits
+
+    >>> with pooled_driver_context() as driver:
+    >>>     driver.visit('http://www.shapeways.com')
+    """
+    return get_default_pool().lease()
+
+
+def prestarted_driver_context(*args, **kwargs):
+    """Gets a driver started in the background while the previous test ran (starting the next one in turn); the driver
+    is quit in the background when the context exits
+
+    >>> with prestarted_driver_context() as driver:
+    >>>     driver.visit('http://www.shapeways.com')
+    """
+    return get_default_lifecycle().lease()
@@ -0,0 +1,335 @@
+"""
+Driver lifecycle module -- starts drivers ahead of time and quits them in the background, off the tests' critical path
+"""
+import atexit
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from coyote_framework.config.browser_config import BrowserConfig
+
+__author__ = 'justin@shapeways.com'
+
+
+class DriverStartupTimeout(Exception):
+    """Raised when a driver started in the background was not ready before the timeout"""
+
+
+class DriverStartup(object):
+    """
+    A driver being launched on a background thread
+
+        >>> startup = DriverStartup(new_driver_wrapper)
+        >>> ...
+        >>> driver = startup.result(timeout=120)
+    """
+    def __init__(self, factory):
+        """
+        @type factory:  types.FunctionType
+        @param factory: creates the driver wrapper
+        """
+        self.factory = factory
+        self._driver_wrapper = None
+        self._exc_info = None
+        self._done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._launch, name='driver-startup')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _launch(self):
+        try:
+            self._driver_wrapper = self.factory()
+        except Exception:
+            self._exc_info = sys.exc_info()
+        finally:
+            with self._lock:
+                self._done.set()
+                callbacks, self._callbacks = self._callbacks, []
+            for callback in callbacks:
+                self._call(callback)
+
+    def when_started(self, callback):
+        """
+        Calls callback with the driver wrapper once the driver started (right away if it already has); nothing is called
+        if the driver fails to start. Used to quit drivers nobody waits for anymore
+
+        @type callback:     types.FunctionType
+        @param callback:    called with the driver wrapper, on the startup thread if the driver is still starting
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        self._call(callback)
+
+    def _call(self, callback):
+        if self._driver_wrapper is None:
+            return
+        try:
+            callback(self._driver_wrapper)
+        except Exception, e:
+            logging.getLogger(__name__).warn('Callback for a started driver failed ({})'.format(e))
+
+    def done(self):
+        """
+        @rtype:     bool
+        @return:    True once the driver started, or failed to
+        """
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Waits for the driver; exceptions raised while starting it are raised here, with their original traceback
+
+        @type timeout:  float
+        @param timeout: seconds to wait, or None to wait for as long as it takes
+
+        @rtype:         CoyoteDriver
+        """
+        if not self._done.wait(timeout):
+            raise DriverStartupTimeout('The driver did not start within {} seconds'.format(timeout))
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._driver_wrapper
+
+
+class DriverReaper(object):
+    """
+    Quits drivers in the background; a driver whose quit fails or takes longer than the timeout has its browser process
+    killed
+    """
+    def __init__(self, timeout=30):
+        """
+        @type timeout:  float
+        @param timeout: seconds a quit may take before the browser is killed
+        """
+        self.timeout = timeout
+        self.killed = []  # browser pids killed after their quit failed or timed out
+        self._pending = 0
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return self._pending
+
+    def reap(self, driver_wrapper):
+        """
+        Quits a driver in the background, and returns immediately
+
+        @type driver_wrapper:   WebDriverWrapper
+        """
+        with self._condition:
+            self._pending += 1
+        watcher = threading.Thread(target=self._reap, args=(driver_wrapper,), name='driver-reaper')
+        watcher.daemon = True
+        watcher.start()
+
+    def wait(self, timeout=None):
+        """
+        Waits for the pending quits to finish
+
+        @type timeout:  float
+        @param timeout: seconds to wait, or None to wait for as long as it takes
+        @rtype:         bool
+        @return:        True if no quit is pending
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return not self._pending
+
+    def _reap(self, driver_wrapper):
+        failed = []
+
+        def quit_driver():
+            try:
+                driver_wrapper.quit()
+            except Exception, e:
+                logging.getLogger(__name__).info('Could not quit the driver ({})'.format(e))
+                failed.append(e)
+
+        try:
+            quitter = threading.Thread(target=quit_driver, name='driver-quit')
+            quitter.daemon = True
+            quitter.start()
+            quitter.join(self.timeout)
+
+            if quitter.is_alive() or failed:
+                if quitter.is_alive():
+                    logging.getLogger(__name__).warn('Driver did not quit within {} seconds'.format(self.timeout))
+                self.kill(driver_wrapper)
+        finally:
+            with self._condition:
+                self._pending -= 1
+                self._condition.notify_all()
+
+    def kill(self, driver_wrapper):
+        """
+        Kills the driver's browser process, if it is local and still running, and gives back its display
+
+        @type driver_wrapper:   WebDriverWrapper
+        """
+        pid = driver_wrapper.driver_pid
+        if pid is None:
+            logging.getLogger(__name__).warn('Cannot kill a remote driver; its session may be left open')
+        else:
+            try:
+                os.kill(pid, signal.SIGKILL)
+                self.killed.append(pid)
+            except OSError:
+                pass  # already gone
+
+        # the failed quit may not have got as far as stopping the display (or releasing its lease)
+        display = getattr(driver_wrapper, 'display', None)
+        if display is not None:
+            try:
+                display.stop()
+            except Exception, e:
+                logging.getLogger(__name__).info('Could not stop the display of a killed driver ({})'.format(e))
+
+
+class DriverLifecycle(object):
+    """
+    Starts the next drivers while the current test runs, and quits used drivers in the background
+
+        >>> lifecycle = DriverLifecycle(prestart=1)
+        >>> with lifecycle.lease() as driver:
+        >>>     driver.visit('http://www.shapeways.com')
+
+    acquire() hands out a driver started in the background (waiting for it if it is not ready yet) and starts the next
+    one. release() runs the driver's teardown callbacks in the caller, so that their assertions still fail the test,
+    and leaves the quit to the reaper
+    """
+    def __init__(self, factory=None, prestart=1, startup_timeout=120, reaper=None):
+        """
+        @type factory:          types.FunctionType
+        @param factory:         creates a new driver wrapper; defaults to coyote_driverfactory.new_driver_wrapper
+        @type prestart:         int
+        @param prestart:        number of drivers kept starting or started ahead of acquire()
+        @type startup_timeout:  float
+        @param startup_timeout: seconds to wait for a driver started in the background
+        @type reaper:           DriverReaper
+        @param reaper:          quits the released drivers; defaults to a DriverReaper with a 30 second timeout
+        """
+        if prestart < 0:
+            raise ValueError('Cannot prestart {} drivers'.format(prestart))
+
+        if factory is None:
+            from coyote_framework.drivers.coyote_driverfactory import new_driver_wrapper
+            factory = new_driver_wrapper
+
+        self.factory = factory
+        self.prestart = prestart
+        self.startup_timeout = startup_timeout
+        self.reaper = reaper or DriverReaper()
+        self.startups = []  # drivers starting in the background, oldest first
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def start_ahead(self):
+        """
+        Starts drivers in the background until `prestart` of them are starting or ready
+        """
+        with self._lock:
+            while not self._closed and len(self.startups) < self.prestart:
+                self.startups.append(DriverStartup(self.factory))
+
+    def acquire(self):
+        """
+        @rtype:     CoyoteDriver
+        @return:    a driver started ahead of time if there is one, or else a new one; give it back with release()
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('The driver lifecycle is closed')
+            startup = self.startups.pop(0) if self.startups else None
+        self.start_ahead()
+
+        if startup is None:
+            return self.factory()
+        try:
+            return startup.result(self.startup_timeout)
+        except DriverStartupTimeout:
+            # nobody will use the browser if it does start after all
+            startup.when_started(self.reaper.reap)
+            raise
+        except Exception, e:
+            # the browser may have failed for reasons long gone by now; try once more in the foreground
+            logging.getLogger(__name__).warn('Driver started in the background failed ({}); starting another'.format(e))
+            return self.factory()
+
+    def release(self, driver_wrapper):
+        """
+        Runs the driver's teardown callbacks, then quits it in the background
+
+        @type driver_wrapper:   WebDriverWrapper
+        """
+        try:
+            driver_wrapper.callback_pipeline.teardown()
+        finally:
+            self.reaper.reap(driver_wrapper)
+
+    @contextmanager
+    def lease(self):
+        """
+        Context acquiring a driver, and releasing it when the block exits
+        """
+        driver_wrapper = self.acquire()
+        try:
+            yield driver_wrapper
+        finally:
+            self.release(driver_wrapper)
+
+    def close(self, timeout=None):
+        """
+        Quits the drivers started ahead of time, and waits for every pending quit
+
+        @type timeout:  float
+        @param timeout: seconds to wait for the pending quits, or None to wait for as long as they take
+        @rtype:         bool
+        @return:        True if every quit finished
+        """
+        with self._lock:
+            self._closed = True
+            startups, self.startups = self.startups, []
+        for startup in startups:
+            try:
+                self.reaper.reap(startup.result(self.startup_timeout))
+            except DriverStartupTimeout, e:
+                logging.getLogger(__name__).info('Driver started ahead of time is not ready ({}); it will be quit '
+                                                 'once it starts'.format(e))
+                startup.when_started(self.reaper.reap)
+            except Exception, e:
+                logging.getLogger(__name__).info('Driver started ahead of time did not start ({})'.format(e))
+        return self.reaper.wait(timeout)
+
+
+_default_lifecycle = None
+_default_lifecycle_lock = threading.Lock()
+
+
+def get_default_lifecycle():
+    """
+    Gets the process-wide lifecycle, configured by the driver_prestart and driver_quit_timeout browser settings
+
+    @rtype:     DriverLifecycle
+    """
+    global _default_lifecycle
+    with _default_lifecycle_lock:
+        if _default_lifecycle is None:
+            browser_config = BrowserConfig()
+            _default_lifecycle = DriverLifecycle(
+                prestart=browser_config.getint('driver_prestart'),
+                reaper=DriverReaper(timeout=browser_config.getfloat('driver_quit_timeout'))
+            )
+            atexit.register(_default_lifecycle.close)
+        return _default_lifecycle
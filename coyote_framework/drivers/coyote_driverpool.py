@@ -0,0 +1,252 @@
+"""
+Driver pool module -- keeps warm CoyoteDriver sessions to lease to tests instead of launching a browser per test
+"""
+import atexit
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from coyote_framework.config.browser_config import BrowserConfig
+
+__author__ = 'justin@shapeways.com'
+
+
+RESET_URL = 'about:blank'
+
+CLEAR_STORAGE_SCRIPT = '''
+try { window.localStorage.clear(); } catch (ex) {}
+try { window.sessionStorage.clear(); } catch (ex) {}
+'''
+
+
+class DriverPoolTimeout(Exception):
+    """Raised when no session could be leased before the timeout"""
+
+
+class DriverPool(object):
+    """
+    Pool of warm driver wrappers, shared by the tests of a process
+
+        >>> pool = DriverPool(max_size=2, max_uses=25)
+        >>> with pool.lease() as driver:
+        >>>     driver.visit('http://www.shapeways.com')
+
+    Sessions are reset between leases (cookies, local and session storage of the current page, extra windows, and
+    about:blank), health checked before they are leased again, and quit after max_uses leases
+    """
+    def __init__(self, factory=None, max_size=2, max_uses=25, lease_timeout=300):
+        """
+        @type factory:          types.FunctionType
+        @param factory:         creates a new driver wrapper; defaults to coyote_driverfactory.new_driver_wrapper
+        @type max_size:         int
+        @param max_size:        maximum number of sessions, leased or idle
+        @type max_uses:         int
+        @param max_uses:        number of leases after which a session is quit instead of reused
+        @type lease_timeout:    float
+        @param lease_timeout:   seconds to wait for a session when all of them are leased
+        """
+        if max_size < 1 or max_uses < 1:
+            raise ValueError('Driver pools need a max_size and max_uses of at least 1')
+
+        if factory is None:
+            from coyote_framework.drivers.coyote_driverfactory import new_driver_wrapper
+            factory = new_driver_wrapper
+
+        self.factory = factory
+        self.max_size = max_size
+        self.max_uses = max_uses
+        self.lease_timeout = lease_timeout
+        self.idle = []  # sessions ready to lease, most recently used last
+        self.uses = {}  # session to the number of times it was leased
+        self.reserved = 0  # sessions being launched
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        return len(self.uses) + self.reserved
+
+    def acquire(self):
+        """
+        Leases a healthy session, starting a new one if none is idle and the pool is not full
+
+        @rtype:     CoyoteDriver
+        @return:    the leased driver wrapper; give it back with release()
+        """
+        deadline = time.time() + self.lease_timeout
+        while True:
+            with self._condition:
+                driver_wrapper = self._take_idle_or_reserve(deadline)
+
+            if driver_wrapper is None:
+                break
+            # health checks (and quitting dead sessions) happen outside of the lock, as they talk to the browser
+            if self.is_healthy(driver_wrapper):
+                # its teardown callbacks ran when it was released; they run again for this lease
+                driver_wrapper.callback_pipeline.reopen()
+                return driver_wrapper
+            self._discard(driver_wrapper)
+
+        # a slot is reserved; launch the (slow) browser outside of the lock
+        driver_wrapper = None
+        try:
+            driver_wrapper = self.factory()
+        finally:
+            with self._condition:
+                self.reserved -= 1
+                if driver_wrapper is not None:
+                    self.uses[driver_wrapper] = 1
+                self._condition.notify()
+        return driver_wrapper
+
+    def _take_idle_or_reserve(self, deadline):
+        """
+        Must hold the lock; returns an idle session (counting the lease), or None after reserving a slot for a new one
+        """
+        while True:
+            if self._closed:
+                raise RuntimeError('The driver pool is closed')
+
+            if self.idle:
+                driver_wrapper = self.idle.pop()
+                self.uses[driver_wrapper] += 1
+                return driver_wrapper
+
+            if len(self.uses) + self.reserved < self.max_size:
+                self.reserved += 1
+                return None
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise DriverPoolTimeout('No driver became available within {} seconds'.format(self.lease_timeout))
+            self._condition.wait(remaining)
+
+    def release(self, driver_wrapper, discard=False):
+        """
+        Returns a leased session to the pool, resetting it for the next lease. The session's teardown callbacks (e.g.
+        console checks) run first, as they would when quitting an unpooled driver, and their errors are raised once
+        the session is back in the pool (or quit, if the error was not an AssertionError)
+
+        @type driver_wrapper:   CoyoteDriver
+        @param driver_wrapper:  the session returned by acquire()
+        @type discard:          bool
+        @param discard:         quit the session instead of reusing it (e.g. if the test broke the browser)
+        """
+        teardown_error = None
+        try:
+            driver_wrapper.callback_pipeline.teardown()
+        except Exception, e:
+            teardown_error = sys.exc_info()
+            discard = discard or not isinstance(e, AssertionError)
+
+        if not discard and not self._closed and self.uses.get(driver_wrapper, 0) < self.max_uses:
+            try:
+                self.reset(driver_wrapper)
+            except Exception, e:
+                logging.getLogger(__name__).warn('Could not reset driver, quitting it instead: {}'.format(e))
+                discard = True
+        else:
+            discard = True
+
+        if discard:
+            self._discard(driver_wrapper)
+        else:
+            with self._condition:
+                self.idle.append(driver_wrapper)
+                self._condition.notify()
+
+        if teardown_error is not None:
+            raise teardown_error[0], teardown_error[1], teardown_error[2]
+
+    @contextmanager
+    def lease(self):
+        """
+        Context leasing a session; the session is quit instead of reused if the block raised anything other than an
+        AssertionError (a failed assertion leaves the browser usable, other errors may not). Errors of the teardown
+        callbacks are raised when the block exits, unless the block raised already
+        """
+        driver_wrapper = self.acquire()
+        try:
+            yield driver_wrapper
+        except BaseException, e:
+            error = sys.exc_info()
+            try:
+                self.release(driver_wrapper, discard=not isinstance(e, AssertionError))
+            except Exception:
+                logging.getLogger(__name__).exception('Error releasing driver after its test failed')
+            raise error[0], error[1], error[2]
+        self.release(driver_wrapper)
+
+    @staticmethod
+    def reset(driver_wrapper):
+        """
+        Resets a session to a blank state: one window on about:blank, with no cookies or storage. The browser is
+        driven directly, so no action callbacks run for the reset
+
+        @type driver_wrapper:   CoyoteDriver
+        """
+        driver = driver_wrapper.driver
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to_window(handle)
+            driver.close()
+        driver_wrapper.switch_to_window(handles[0])
+
+        driver.delete_all_cookies()
+        driver.execute_script(CLEAR_STORAGE_SCRIPT)
+        driver.get(RESET_URL)
+        driver_wrapper.invalidate_element_cache()
+        driver_wrapper.browser_logs.clear()
+
+    @staticmethod
+    def is_healthy(driver_wrapper):
+        """
+        @rtype:     bool
+        @return:    True if the session still answers WebDriver commands
+        """
+        try:
+            driver_wrapper.driver.current_window_handle
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        """
+        Quits every idle session; leased sessions are quit when they are released
+        """
+        with self._condition:
+            self._closed = True
+            idle, self.idle = self.idle, []
+            self._condition.notify_all()
+        for driver_wrapper in idle:
+            self._discard(driver_wrapper)
+
+    def _discard(self, driver_wrapper):
+        with self._condition:
+            self.uses.pop(driver_wrapper, None)
+            self._condition.notify()
+        try:
+            driver_wrapper.quit()
+        except Exception, e:
+            logging.getLogger(__name__).info('Could not quit pooled driver ({})'.format(e))
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool():
+    """
+    Gets the process-wide pool, sized by the driver_pool_size and driver_pool_max_uses browser settings
+
+    @rtype:     DriverPool
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            browser_config = BrowserConfig()
+            _default_pool = DriverPool(max_size=browser_config.getint('driver_pool_size'),
+                                       max_uses=browser_config.getint('driver_pool_max_uses'))
+            atexit.register(_default_pool.close)
+        return _default_pool
@@ -0,0 +1,156 @@
+"""
+Profile cache module -- builds each Firefox profile template once, and launches from cheap copies of it
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import selenium
+from selenium.webdriver.firefox.firefox_profile import FirefoxProfile, WEBDRIVER_EXT
+
+from coyote_framework.mixins.filesystem import create_directory
+
+__author__ = 'justin@shapeways.com'
+
+
+WEBDRIVER_EXT_ID = 'fxdriver@googlecode.com'
+
+# Files under these profile directories are never written by Firefox or WebDriver, so launches hardlink them
+HARDLINKED_DIRECTORIES = ('extensions',)
+
+PROFILE_DIRECTORY = 'profile'
+
+
+class CachedFirefoxProfile(FirefoxProfile):
+    """
+    FirefoxProfile launched from a copy of a cached template, which already has the WebDriver extension installed
+    """
+    def __init__(self, profile_directory):
+        """
+        @type profile_directory:    str
+        @param profile_directory:   launch copy of the template; deleted when the driver quits
+        """
+        FirefoxProfile.__init__(self)
+        # FirefoxProfile made an empty temporary profile; use the launch copy instead
+        os.rmdir(self.profile_dir)
+        self.profile_dir = profile_directory
+        self.tempfolder = os.path.dirname(profile_directory)  # removed along with the profile when the driver quits
+        self.extensionsDir = os.path.join(self.profile_dir, 'extensions')
+        self.userPrefs = os.path.join(self.profile_dir, 'user.js')
+        # Start from the template's preferences, since update_preferences() rewrites user.js from these
+        self._read_existing_userjs(self.userPrefs)
+
+    def add_extension(self, extension=WEBDRIVER_EXT):
+        if extension == WEBDRIVER_EXT and os.path.isdir(os.path.join(self.extensionsDir, WEBDRIVER_EXT_ID)):
+            # the template already has the WebDriver extension
+            return
+        FirefoxProfile.add_extension(self, extension)
+
+
+class ProfileCache(object):
+    """
+    On-disk cache of Firefox profile templates, one per configuration hash (selenium version, preferences and
+    extensions). Each launch gets its own copy of the template, with the extension files hardlinked and the rest copied
+
+        >>> profile = ProfileCache('/tmp/coyote/webdriver/firefox/profile/cache').new_profile()
+        >>> profile.set_preference('webdriver.log.file', log_path)
+    """
+    def __init__(self, cache_directory, preferences=None, extensions=()):
+        """
+        @type cache_directory:  str
+        @param cache_directory: directory holding the templates
+        @type preferences:      dict
+        @param preferences:     preferences written into the template
+        @type extensions:       tuple
+        @param extensions:      paths of extensions (.xpi files or directories) installed into the template, besides
+                                the WebDriver extension
+        """
+        self.cache_directory = cache_directory
+        self.preferences = preferences or {}
+        self.extensions = tuple(extensions)
+
+    def config_hash(self):
+        """
+        @rtype:     str
+        @return:    hash identifying the template for this configuration
+        """
+        extensions = [(path, os.path.getmtime(path)) for path in self.extensions]
+        config = json.dumps([selenium.__version__, self.preferences, extensions], sort_keys=True)
+        return hashlib.sha1(config).hexdigest()
+
+    def template_directory(self):
+        """
+        Gets the template for this configuration, building it if it is not cached yet
+
+        @rtype:     str
+        @return:    directory holding the template profile
+        """
+        template_directory = os.path.join(self.cache_directory, self.config_hash())
+        if not os.path.isdir(template_directory):
+            self._build(template_directory)
+        return template_directory
+
+    def new_profile(self):
+        """
+        @rtype:     CachedFirefoxProfile
+        @return:    a profile launching from a new copy of the template
+        """
+        template_directory = self.template_directory()
+        launch_directory = os.path.join(tempfile.mkdtemp(prefix='coyote-profile-'), PROFILE_DIRECTORY)
+        copy_profile(os.path.join(template_directory, PROFILE_DIRECTORY), launch_directory)
+        return CachedFirefoxProfile(launch_directory)
+
+    def _build(self, template_directory):
+        create_directory(self.cache_directory)
+        staging_directory = tempfile.mkdtemp(prefix='building-', dir=self.cache_directory)
+
+        profile = FirefoxProfile()
+        try:
+            for key, value in self.preferences.iteritems():
+                profile.set_preference(key, value)
+            profile.add_extension()
+            for extension in self.extensions:
+                profile.add_extension(extension)
+            profile.update_preferences()
+
+            shutil.copytree(profile.path, os.path.join(staging_directory, PROFILE_DIRECTORY))
+
+            try:
+                os.rename(staging_directory, template_directory)
+            except OSError:
+                # another process finished the same template first
+                if not os.path.isdir(template_directory):
+                    raise
+        finally:
+            shutil.rmtree(profile.path, ignore_errors=True)
+            shutil.rmtree(staging_directory, ignore_errors=True)
+
+
+def copy_profile(source, destination):
+    """
+    Copies a profile directory, hardlinking the files Firefox never writes to (falling back to copying them if the
+    destination is on another filesystem)
+
+    @type source:       str
+    @param source:      template profile directory
+    @type destination:  str
+    @param destination: directory to create
+    """
+    for directory, _, file_names in os.walk(source):
+        relative_directory = os.path.relpath(directory, source)
+        target_directory = os.path.normpath(os.path.join(destination, relative_directory))
+        create_directory(target_directory)
+        hardlink = relative_directory.split(os.sep)[0] in HARDLINKED_DIRECTORIES
+
+        for file_name in file_names:
+            source_file = os.path.join(directory, file_name)
+            target_file = os.path.join(target_directory, file_name)
+            if hardlink:
+                try:
+                    os.link(source_file, target_file)
+                    continue
+                except OSError:
+                    pass
+            shutil.copy2(source_file, target_file)
@@ -0,0 +1,361 @@
+"""
+Parallel test runner -- shards test modules across worker processes, balanced by how long each module took last time
+
+    python -m coyote_framework.testing.coyote_runner --workers 4 example_tests
+    python -m coyote_framework.testing.coyote_runner --workers 4 example_tests.test_home example_tests.test_search
+
+Each worker runs whole modules (so module fixtures still run once), with its own driver pool, display manager and
+driver lifecycle. The results of all workers are merged and reported like unittest's, and the measured durations are
+saved for balancing the next run
+"""
+import argparse
+import heapq
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import traceback
+import unittest
+
+from coyote_framework.config.constants_config import ConstantsConfig
+
+__author__ = 'justin@shapeways.com'
+
+
+DURATIONS_FILE = 'test_durations.json'
+
+# Assumed duration of modules that have not run before
+DEFAULT_MODULE_DURATION = 30.0
+
+SEPARATOR = '=' * 70
+
+
+def get_durations_path():
+    """
+    @rtype:     str
+    @return:    path of the historical durations, under the data_dir constant
+    """
+    return os.path.join(ConstantsConfig().get('data_dir'), DURATIONS_FILE)
+
+
+def load_durations(path):
+    """
+    @type path:     str
+    @rtype:         dict
+    @return:        module name to the seconds it took on its last run; empty if there is no history yet
+    """
+    try:
+        with open(path) as durations_file:
+            return json.load(durations_file)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_durations(path, durations):
+    """
+    Merges the durations measured by a run into the history, written atomically so that concurrent runs can not
+    leave a truncated file
+
+    @type path:         str
+    @type durations:    dict
+    @param durations:   module name to the seconds it took
+    """
+    history = load_durations(path)
+    history.update(durations)
+
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(descriptor, 'w') as durations_file:
+        json.dump(history, durations_file, indent=2, sort_keys=True)
+    os.rename(temporary_path, path)
+
+
+def shard_modules(modules, shard_count, durations=None):
+    """
+    Splits modules into shards of about equal duration: the longest modules are placed first, each on the shard
+    with the least work so far
+
+    @type modules:      list
+    @param modules:     test module names
+    @type shard_count:  int
+    @param shard_count: number of shards
+    @type durations:    dict
+    @param durations:   module name to its historical duration; unknown modules are assumed to take the mean
+                        duration of the known ones (or DEFAULT_MODULE_DURATION)
+
+    @rtype:             list
+    @return:            shards (lists of module names); empty shards are left out
+    """
+    durations = durations or {}
+    known = [durations[module] for module in modules if module in durations]
+    default = float(sum(known)) / len(known) if known else DEFAULT_MODULE_DURATION
+
+    shards = [(0.0, index, []) for index in range(max(1, shard_count))]
+    heapq.heapify(shards)
+    for module in sorted(modules, key=lambda name: (-durations.get(name, default), name)):
+        total, index, shard = heapq.heappop(shards)
+        shard.append(module)
+        heapq.heappush(shards, (total + durations.get(module, default), index, shard))
+    return [modules_of_shard for _, _, modules_of_shard in sorted(shards, key=lambda item: item[1]) if modules_of_shard]
+
+
+def discover_modules(start, pattern='test*.py', top_level_directory=None):
+    """
+    @type start:    str
+    @param start:   directory to discover tests in, or a module or package name
+
+    @rtype:         list
+    @return:        names of the modules holding tests, in discovery order
+    """
+    loader = unittest.TestLoader()
+    if os.path.isdir(start):
+        suite = loader.discover(start, pattern=pattern, top_level_dir=top_level_directory)
+    else:
+        suite = loader.loadTestsFromName(start)
+
+    modules = []
+    for test in iter_tests(suite):
+        module = test.__class__.__module__
+        if module == unittest.loader.__name__:
+            # A module whose tests could not be loaded is stood in for by a test of unittest's, named after the module;
+            # run the module itself, so that its worker reports the error
+            module = test._testMethodName
+        if module not in modules:
+            modules.append(module)
+    return modules
+
+
+def iter_tests(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            for child in iter_tests(test):
+                yield child
+        else:
+            yield test
+
+
+class ShardResult(unittest.TestResult):
+    """
+    Test result that can be sent back from a worker process: tests are kept by id, and tracebacks as text. Also
+    measures how long each module took
+    """
+    def __init__(self, *args, **kwargs):
+        super(ShardResult, self).__init__(*args, **kwargs)
+        self.successes = []
+        self.durations = {}
+        self._started = None
+
+    def startTest(self, test):
+        super(ShardResult, self).startTest(test)
+        self._started = time.time()
+
+    def stopTest(self, test):
+        super(ShardResult, self).stopTest(test)
+        module = test.__class__.__module__
+        self.durations[module] = self.durations.get(module, 0.0) + time.time() - self._started
+
+    def addError(self, test, err):
+        self.errors.append((test.id(), self._exc_info_to_string(err, test)))
+
+    def addFailure(self, test, err):
+        self.failures.append((test.id(), self._exc_info_to_string(err, test)))
+
+    def addSuccess(self, test):
+        self.successes.append(test.id())
+
+    def addSkip(self, test, reason):
+        self.skipped.append((test.id(), reason))
+
+    def addExpectedFailure(self, test, err):
+        self.expectedFailures.append((test.id(), self._exc_info_to_string(err, test)))
+
+    def addUnexpectedSuccess(self, test):
+        self.unexpectedSuccesses.append(test.id())
+
+    def __getstate__(self):
+        # Streams and the buffering machinery stay in the worker
+        return {
+            'testsRun': self.testsRun,
+            'errors': self.errors,
+            'failures': self.failures,
+            'skipped': self.skipped,
+            'expectedFailures': self.expectedFailures,
+            'unexpectedSuccesses': self.unexpectedSuccesses,
+            'successes': self.successes,
+            'durations': self.durations,
+        }
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.__dict__.update(state)
+
+    def merge(self, other):
+        """
+        Adds another shard's results to this one
+
+        @type other:    ShardResult
+        """
+        self.testsRun += other.testsRun
+        self.errors.extend(other.errors)
+        self.failures.extend(other.failures)
+        self.skipped.extend(other.skipped)
+        self.expectedFailures.extend(other.expectedFailures)
+        self.unexpectedSuccesses.extend(other.unexpectedSuccesses)
+        self.successes.extend(other.successes)
+        self.durations.update(other.durations)
+
+
+def _init_worker():
+    """
+    Forgets the process-wide pools inherited from the parent process, so that each worker starts its own browsers and
+    displays
+    """
+    from coyote_framework.drivers import coyote_displaymanager, coyote_driverlifecycle, coyote_driverpool
+    coyote_driverpool._default_pool = None
+    coyote_displaymanager._default_manager = None
+    coyote_driverlifecycle._default_lifecycle = None
+
+
+def _close_worker_pools():
+    """
+    Closes the process-wide pools the shard started; pool workers exit through os._exit, so the atexit hooks that
+    close them elsewhere never run in a worker. The driver lifecycle and pool go first, since their browsers use the
+    displays
+    """
+    from coyote_framework.drivers import coyote_displaymanager, coyote_driverlifecycle, coyote_driverpool
+    closers = []
+    if coyote_driverlifecycle._default_lifecycle is not None:
+        closers.append(coyote_driverlifecycle._default_lifecycle.close)
+        coyote_driverlifecycle._default_lifecycle = None
+    if coyote_driverpool._default_pool is not None:
+        closers.append(coyote_driverpool._default_pool.close)
+        coyote_driverpool._default_pool = None
+    if coyote_displaymanager._default_manager is not None:
+        closers.append(coyote_displaymanager._default_manager.close)
+        coyote_displaymanager._default_manager = None
+
+    for close in closers:
+        try:
+            close()
+        except Exception:
+            logging.getLogger(__name__).exception('Could not close a worker pool')
+
+
+def run_shard(modules):
+    """
+    Runs the tests of some modules in this process, then closes the browsers and displays they started
+
+    @type modules:  list
+    @param modules: test module names
+
+    @rtype:         ShardResult
+    """
+    result = ShardResult()
+    try:
+        for module in modules:
+            try:
+                # Imported here rather than by loadTestsFromName, which hides import errors behind an AttributeError
+                suite = unittest.defaultTestLoader.loadTestsFromModule(importlib.import_module(module))
+            except Exception:
+                result.errors.append((module, traceback.format_exc()))
+                continue
+            suite.run(result)
+    finally:
+        _close_worker_pools()
+    return result
+
+
+class ParallelRunner(object):
+    """
+    Runs test modules in worker processes, and merges their results
+
+        >>> result = ParallelRunner(workers=4).run(discover_modules('example_tests'))
+        >>> result.wasSuccessful()
+    """
+    def __init__(self, workers=None, durations_path=None, stream=sys.stderr):
+        """
+        @type workers:          int
+        @param workers:         number of worker processes; defaults to the number of CPUs
+        @type durations_path:   str
+        @param durations_path:  file holding the historical durations; defaults to get_durations_path()
+        @param stream:          where the merged report is written
+        """
+        self.workers = workers or multiprocessing.cpu_count()
+        self.durations_path = durations_path or get_durations_path()
+        self.stream = stream
+
+    def run(self, modules):
+        """
+        @type modules:  list
+        @param modules: test module names
+
+        @rtype:         ShardResult
+        @return:        the merged results of all shards
+        """
+        shards = shard_modules(modules, self.workers, load_durations(self.durations_path))
+        started = time.time()
+
+        result = ShardResult()
+        if shards:
+            pool = multiprocessing.Pool(processes=len(shards), initializer=_init_worker)
+            try:
+                for shard_result in pool.imap_unordered(run_shard, shards):
+                    result.merge(shard_result)
+            finally:
+                pool.close()
+                pool.join()
+
+        save_durations(self.durations_path, result.durations)
+        self.report(result, time.time() - started, len(shards))
+        return result
+
+    def report(self, result, elapsed, shard_count):
+        write = self.stream.write
+        for flavour, problems in (('ERROR', result.errors), ('FAIL', result.failures)):
+            for test_id, details in problems:
+                write('{}\n{}: {}\n{}\n{}\n'.format(SEPARATOR, flavour, test_id, '-' * 70, details))
+
+        write('{}\nRan {} tests in {:.3f}s on {} workers\n\n'.format('-' * 70, result.testsRun, elapsed, shard_count))
+
+        details = []
+        if result.failures:
+            details.append('failures={}'.format(len(result.failures)))
+        if result.errors:
+            details.append('errors={}'.format(len(result.errors)))
+        if result.skipped:
+            details.append('skipped={}'.format(len(result.skipped)))
+        if result.expectedFailures:
+            details.append('expected failures={}'.format(len(result.expectedFailures)))
+        if result.unexpectedSuccesses:
+            details.append('unexpected successes={}'.format(len(result.unexpectedSuccesses)))
+        write('{}{}\n'.format('OK' if result.wasSuccessful() else 'FAILED',
+                              ' ({})'.format(', '.join(details)) if details else ''))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs test modules in parallel worker processes')
+    parser.add_argument('tests', nargs='+', help='directories, packages or modules to run the tests of')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('-p', '--pattern', default='test*.py', help='pattern of test files in directories')
+    parser.add_argument('-t', '--top-level-directory', default=None, help='top level directory of the project')
+    parser.add_argument('--durations', default=None, help='file holding the historical durations')
+    arguments = parser.parse_args(argv)
+
+    modules = []
+    for start in arguments.tests:
+        for module in discover_modules(start, arguments.pattern, arguments.top_level_directory):
+            if module not in modules:
+                modules.append(module)
+
+    result = ParallelRunner(arguments.workers, arguments.durations).run(modules)
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,8 +15,11 @@ __author__ = 'mboylevt'
 
 class CoyoteTest(unittest.TestCase):
 
-    webdriver_instances = []
-    display_instances = []
+    def __init__(self, *args, **kwargs):
+        super(CoyoteTest, self).__init__(*args, **kwargs)
+        # Tracked per test instance, so that drivers and displays never leak into other tests
+        self.webdriver_instances = []
+        self.display_instances = []
 
     def setUp(self):
         log('----------------------------- SetUp -----------------------------')
@@ -80,6 +83,7 @@ class CoyoteTest(unittest.TestCase):
             except Exception, e:
                 log('Could not quit the driver ({})'.format(e), INFO)
                 pass
+        del self.webdriver_instances[:]
 
     def stop_displays(self):
         for display in self.display_instances:
@@ -87,6 +91,7 @@ class CoyoteTest(unittest.TestCase):
                 display.stop()
             except Exception, e:
                 log('Could not quit the display ({})'.format(display), INFO)
+        del self.display_instances[:]
 
     def cleanup_by_logging_end_statement(self):
         log('Ending test {}'.format(self.test_id))
@@ -1,10 +1,17 @@
 import unittest
 import time
-from coyote_framework.util.apps.parallel import run_parallel, ErrorInProcessException
+import os
+import threading
+from coyote_framework.util.apps.parallel import run_parallel, iter_parallel, ParallelPool, ParallelThreadPool, \
+    ErrorInProcessException, TaskTimeoutError, WorkerDiedError, THREAD
 
 __author__ = 'justin@shapeways.com'
 
 
+def get_pid():
+    return os.getpid()
+
+
 class TestRunParallel(unittest.TestCase):
 
     def test_error_capture(self):
@@ -56,4 +63,127 @@ class TestRunParallel(unittest.TestCase):
         self.assertEqual(val1, 2)
         self.assertEqual(val2, 1)
         self.assertEqual(val3, 3)
-        self.assertEqual(val4, 4)
\ No newline at end of file
+        self.assertEqual(val4, 4)
+
+    def test_large_results(self):
+        """Tests that results larger than the pipe buffer are returned instead of deadlocking the workers"""
+        val1, val2 = run_parallel(
+            lambda: 'a' * 1000000,
+            lambda: 'b' * 1000000
+        )
+        self.assertEqual(1000000, len(val1))
+        self.assertEqual('b', val2[0])
+
+    def test_results_stream_as_they_complete(self):
+        """Tests that iter_parallel yields the fastest function first, and that workers run several functions"""
+        def slow():
+            time.sleep(0.5)
+            return 'slow'
+
+        results = list(iter_parallel(slow, lambda: 'fast', os.getpid, os.getpid, workers=2))
+
+        self.assertEqual((1, 'fast'), results[0])
+        self.assertEqual((0, 'slow'), results[-1])
+        self.assertEqual(1, len(set(result for index, result in results if index in (2, 3))))
+
+    def test_errors_carry_tracebacks_and_timeouts(self):
+        """Tests that errors keep the traceback of their process, and that functions running too long are killed"""
+        def function_error():
+            raise ValueError('Error in values!')
+
+        try:
+            run_parallel(function_error, lambda: time.sleep(30), lambda: 1, timeout=0.5)
+            self.fail('No exception was raised')
+        except ErrorInProcessException, e:
+            self.assertEqual(2, len(e.errors))
+            value_error, timeout_error = sorted(e.errors, key=lambda error: isinstance(error, TaskTimeoutError))
+            self.assertIn('function_error', value_error.traceback)
+            self.assertIsInstance(timeout_error, TaskTimeoutError)
+
+    def test_worker_dying_immediately(self):
+        """Tests that a function whose worker exits before reporting anything fails instead of hanging"""
+        def die():
+            os._exit(1)
+
+        started = time.time()
+        try:
+            run_parallel(die, lambda: 2, timeout=2)
+            self.fail('No exception was raised')
+        except ErrorInProcessException, e:
+            self.assertEqual([WorkerDiedError], [type(error) for error in e.errors])
+        self.assertLess(time.time() - started, 2)
+
+    def test_pool_reuses_workers(self):
+        """Tests that a ParallelPool runs every call on the same worker processes"""
+        with ParallelPool(workers=2) as pool:
+            first = set(pool.run(get_pid, get_pid, get_pid))
+            second = set(pool.run(get_pid, get_pid))
+        self.assertLessEqual(len(first | second), 2)
+
+    def test_pool_fails_functions_it_can_not_pickle(self):
+        """Tests that a function given to a started pool that can not be pickled fails instead of hanging"""
+        started = time.time()
+        with ParallelPool(workers=2) as pool:
+            results = []
+            try:
+                for index, result in pool.iter_results(lambda: 2, get_pid):
+                    results.append(index)
+                self.fail('No exception was raised')
+            except ErrorInProcessException, e:
+                self.assertEqual([TypeError], [type(error) for error in e.errors])
+            self.assertEqual([1], results)
+            self.assertEqual(1, len(set(pool.run(get_pid))))
+        self.assertLess(time.time() - started, 10)
+
+    def test_thread_executor(self):
+        """Tests that the thread executor shares state with the caller, keeps the result order, and bounds how many
+        functions run at once"""
+        lock = threading.Lock()
+        running = [0]
+        most_running = [0]
+
+        def tracked(value):
+            def function():
+                with lock:
+                    running[0] += 1
+                    most_running[0] = max(most_running[0], running[0])
+                time.sleep(0.05)
+                with lock:
+                    running[0] -= 1
+                return value
+            return function
+
+        results = run_parallel(*[tracked(value) for value in range(6)], executor=THREAD, workers=2)
+
+        self.assertEqual(range(6), results)
+        self.assertEqual(2, most_running[0])
+
+    def test_thread_executor_errors(self):
+        """Tests that the thread executor raises the same ErrorInProcessException, including for timeouts"""
+        def function_error():
+            raise ValueError('Error in values!')
+
+        event = threading.Event()
+        try:
+            run_parallel(function_error, lambda: event.wait(5), executor=THREAD, timeout=0.2)
+            self.fail('No exception was raised')
+        except ErrorInProcessException, e:
+            self.assertEqual(set([ValueError, TaskTimeoutError]), set(type(error) for error in e.errors))
+        finally:
+            event.set()
+
+        self.assertRaises(ValueError, run_parallel, function_error, executor='asyncio')
+
+    def test_thread_pool_reuse_after_timeout(self):
+        """Tests that a function that timed out can not hand its late result to the next call on the same pool"""
+        event = threading.Event()
+
+        def slow():
+            event.wait(5)
+            return 'STALE'
+
+        with ParallelThreadPool(workers=1, timeout=0.2) as pool:
+            self.assertRaises(ErrorInProcessException, pool.run, slow)
+            event.set()
+            time.sleep(0.1)  # let the timed out function put its result on the pool's results queue
+            self.assertEqual(['fresh'], pool.run(lambda: 'fresh'))
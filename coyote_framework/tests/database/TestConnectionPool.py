@@ -0,0 +1,126 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from coyote_framework.database.coyote_connectionpool import ConnectionPool, ConnectionPoolTimeout, LEAST_LOADED, \
+    PooledConnection, ReplicaSet
+
+__author__ = 'justin@shapeways.com'
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = os.path.join(self.directory, 'test.db')
+        self.connections = []
+
+        db = sqlite3.connect(self.database)
+        db.execute('CREATE TABLE records (value INTEGER)')
+        db.commit()
+        db.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def connect(self):
+        connection = sqlite3.connect(self.database, check_same_thread=False)
+        self.connections.append(connection)
+        return connection
+
+    def count(self):
+        db = sqlite3.connect(self.database)
+        try:
+            return db.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+        finally:
+            db.close()
+
+    def test_connections_are_reused(self):
+        """Test that released connections are reused, and that uncommitted work is rolled back on release"""
+        pool = ConnectionPool(self.connect, max_size=2)
+        with pool.connection() as db:
+            db.execute('INSERT INTO records VALUES (1)')
+            db.commit()
+        with pool.connection() as db:
+            db.execute('INSERT INTO records VALUES (2)')
+
+        self.assertEqual(1, pool.opened)
+        self.assertEqual(1, self.count())
+
+    def test_max_size_is_enforced(self):
+        """Test that checking out more than max_size connections waits, then times out"""
+        pool = ConnectionPool(self.connect, max_size=1, checkout_timeout=0.1)
+        connection = pool.acquire()
+        self.assertRaises(ConnectionPoolTimeout, pool.acquire)
+        self.assertRaises(ConnectionPoolTimeout, pool.acquire, timeout=0)
+
+        threading.Timer(0.05, pool.release, args=(connection,)).start()
+        pool.checkout_timeout = 5
+        self.assertIs(connection, pool.acquire())
+
+    def test_idle_and_broken_connections_are_closed(self):
+        """Test that connections idle for too long are closed, and broken ones are replaced"""
+        pool = ConnectionPool(self.connect, idle_timeout=0, health_check_after=0)
+        pool.release(pool.acquire())
+        new = pool.acquire()
+        self.assertEqual(2, pool.opened)
+        self.assertRaises(sqlite3.ProgrammingError, self.connections[0].execute, 'SELECT 1')
+
+        pool.idle_timeout = 300
+        pool.release(new)
+        new.close()  # broken behind the pool's back
+        self.assertIsNot(new, pool.acquire())
+        self.assertEqual(3, pool.opened)
+        self.assertEqual(1, pool.size)
+
+    def test_errors_discard_connections(self):
+        """Test that a block raising a non-database error discards its connection, and a database error does not"""
+        pool = ConnectionPool(self.connect, reusable_errors=(sqlite3.DatabaseError,))
+        with self.assertRaises(sqlite3.OperationalError):
+            with pool.connection() as db:
+                db.execute('SELECT * FROM missing')
+        self.assertEqual(1, len(pool.idle))
+
+        with self.assertRaises(ValueError):
+            with pool.connection():
+                raise ValueError()
+        self.assertEqual(0, len(pool.idle))
+        self.assertEqual(0, pool.size)
+
+    def test_pooled_connections_go_back_when_dropped(self):
+        """Test that a PooledConnection returns to the pool once it and its cursors are no longer referenced"""
+        pool = ConnectionPool(self.connect)
+        db = PooledConnection(pool, pool.acquire())
+        cursor = db.cursor()
+        cursor.execute('SELECT 1')
+
+        del db
+        self.assertEqual(0, len(pool.idle))
+        self.assertEqual((1,), cursor.fetchone())
+        del cursor
+        self.assertEqual(1, len(pool.idle))
+
+    def test_replicas_are_chosen_in_turn_or_by_load(self):
+        """Test that round robin takes the replicas in turn, and least loaded avoids replicas with connections in use"""
+        first, second = ConnectionPool(self.connect), ConnectionPool(self.connect)
+        replicas = ReplicaSet([first, second])
+        self.assertEqual([first, second, first], [replicas.choose() for _ in range(3)])
+
+        replicas = ReplicaSet([first, second], selection=LEAST_LOADED)
+        self.assertEqual([first, second], [replicas.choose() for _ in range(2)])
+        first.acquire()
+        self.assertEqual([second, second], [replicas.choose() for _ in range(2)])
+
+        replicas = ReplicaSet([first, second], cooldown=0.1)
+        replicas.mark_unhealthy(first)
+        self.assertEqual([second, second], [replicas.choose() for _ in range(2)])
+        replicas.mark_unhealthy(second)
+        self.assertIsNone(replicas.choose())
+        time.sleep(0.2)
+        self.assertEqual(set([first, second]), set(replicas.choose() for _ in range(2)))
+
+        self.assertRaises(ValueError, ReplicaSet, [])
+        self.assertRaises(ValueError, ReplicaSet, [first], selection='random')
@@ -0,0 +1,196 @@
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+import uuid
+from coyote_framework.config.abstract_config import TEST_RUN_SETTING_CONFIG, confg_dict
+from coyote_framework.database.coyote_db import CoyoteDb, QUERY_COMMENT_SKIP_MODULES
+from coyote_framework.util.apps.parallel import run_parallel
+
+__author__ = 'justin@shapeways.com'
+
+
+class TestCoyoteDb(unittest.TestCase):
+    """Runs CoyoteDb against sqlite databases, configured in config sections unique to each test"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.primary = self.add_database('primary')
+        self.environment = os.environ.get(TEST_RUN_SETTING_CONFIG)
+
+    def tearDown(self):
+        if self.environment is None:
+            os.environ.pop(TEST_RUN_SETTING_CONFIG, None)
+        else:
+            os.environ[TEST_RUN_SETTING_CONFIG] = self.environment
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def add_database(self, name, **settings):
+        """Creates a sqlite database with a table naming it, and writes a config section for it; settings are added
+        to (or override) the section
+
+        @return: the name of the config section
+        """
+        section = 'coyote_db_test_{}_{}'.format(name, uuid.uuid4().hex)
+        path = os.path.join(self.directory, '{}.db'.format(name))
+        db = sqlite3.connect(path)
+        db.execute('CREATE TABLE source (name TEXT)')
+        db.execute('INSERT INTO source VALUES (?)', (name,))
+        db.commit()
+        db.close()
+
+        options = {'database_type': 'sqlite', 'sqlite_file_location': path}
+        options.update(settings)
+        config_path = os.path.join(self.directory, '{}.cfg'.format(section))
+        with open(config_path, 'w') as config_file:
+            config_file.write('[{}]\n'.format(section))
+            for key, value in options.items():
+                config_file.write('{} = {}\n'.format(key, value))
+        os.environ[TEST_RUN_SETTING_CONFIG] = ','.join(
+            filter(None, [os.environ.get(TEST_RUN_SETTING_CONFIG), config_path]))
+        return section
+
+    def set_query_comment_settings(self, **settings):
+        """Overrides settings of the default database section, and makes CoyoteDb read them afresh"""
+        config_path = os.path.join(self.directory, 'database_{}.cfg'.format(uuid.uuid4().hex))
+        with open(config_path, 'w') as config_file:
+            config_file.write('[database]\n')
+            for key, value in settings.items():
+                config_file.write('{} = {}\n'.format(key, value))
+        os.environ[TEST_RUN_SETTING_CONFIG] = ','.join(
+            filter(None, [os.environ.get(TEST_RUN_SETTING_CONFIG), config_path]))
+
+        saved = confg_dict.pop('database', None)
+
+        def restore():
+            confg_dict.pop('database', None)
+            if saved is not None:
+                confg_dict['database'] = saved
+            CoyoteDb._CoyoteDb__query_comment_settings = None
+
+        self.addCleanup(restore)
+        CoyoteDb._CoyoteDb__query_comment_settings = None
+
+    def test_forked_processes_open_their_own_connections(self):
+        """Test that processes forked after the parent used a pool do not reuse the parent's connections"""
+        section = self.primary
+
+        def connection_id():
+            with CoyoteDb.connection(section) as db:
+                db.execute('SELECT 1')
+                return id(db)
+
+        parent = connection_id()
+        self.assertEqual(parent, connection_id())
+
+        children = run_parallel(connection_id, connection_id, connection_id)
+        self.assertNotIn(parent, children)
+        self.assertEqual(parent, connection_id())
+
+    def read_source(self, section, **kwargs):
+        """@return: the name of the database a read of the section was served by"""
+        return CoyoteDb.get_single_record('SELECT name FROM source', target_database=section, **kwargs)['name']
+
+    def test_reads_go_to_replicas(self):
+        """Test that reads are served by the replicas, unless the primary is asked for"""
+        replica = self.add_database('replica')
+        section = self.add_database('main', read_replicas=replica)
+
+        self.assertEqual('replica', self.read_source(section))
+        self.assertEqual('main', self.read_source(section, use_primary=True))
+        self.assertEqual('primary', self.read_source(self.primary))
+
+    def test_unreachable_replicas_cool_down(self):
+        """Test that reads fall back to the primary when a replica can not be reached, and skip it for a while"""
+        replica = self.add_database('replica', sqlite_file_location=os.path.join(self.directory, 'missing', 'db'))
+        section = self.add_database('main', read_replicas=replica, replica_cooldown=60)
+
+        self.assertEqual('main', self.read_source(section))
+        self.assertIsNone(CoyoteDb._CoyoteDb__get_replica_set(section).choose())
+        self.assertEqual('main', self.read_source(section))
+
+    def test_busy_replicas_fall_back_quickly(self):
+        """Test that a read waits no longer than replica_checkout_timeout for a busy replica, and uses it once free"""
+        replica = self.add_database('replica', pool_max_size=1)
+        section = self.add_database('main', read_replicas=replica, replica_checkout_timeout=0.1)
+
+        db, cursor = CoyoteDb.execute_read_only('SELECT name FROM source', target_database=section)
+        try:
+            self.assertEqual('replica', cursor.fetchone()['name'])
+            start = time.time()
+            self.assertEqual('main', self.read_source(section))
+            self.assertLess(time.time() - start, 5)
+        finally:
+            db.close()
+        self.assertEqual('replica', self.read_source(section))
+
+    def test_query_comments_name_the_calling_line(self):
+        """Test that queries are commented with the file and line that made them, built once per call site"""
+        self.set_query_comment_settings(query_comments=True, query_comment_sample_rate=1.0)
+
+        def add_query_comment():
+            return CoyoteDb._CoyoteDb__add_query_comment(('SELECT ?', (1,)))
+
+        call_site = (add_query_comment.__code__, add_query_comment.__code__.co_firstlineno + 1)
+        self.assertEqual(('/*COYOTE: Q_SRC: {}:{} */\nSELECT ?'.format(call_site[0].co_filename, call_site[1]), (1,)),
+                         add_query_comment())
+
+        comments = CoyoteDb._CoyoteDb__query_comments
+        comments[call_site] = '/*CACHED*/\n'
+        try:
+            self.assertEqual(('/*CACHED*/\nSELECT ?', (1,)), add_query_comment())
+        finally:
+            del comments[call_site]
+
+        self.assertEqual('primary', CoyoteDb.get_single_record(
+            'SELECT name FROM source WHERE name = ?', ('primary',), target_database=self.primary)['name'])
+
+    def test_query_comments_can_be_turned_off_or_sampled(self):
+        """Test that query_comments = False leaves queries alone, and the sample rate comments a fraction of them"""
+        def commented():
+            return CoyoteDb._CoyoteDb__add_query_comment(('SELECT 1',))[0] != 'SELECT 1'
+
+        self.set_query_comment_settings(query_comments=False)
+        self.assertEqual(('SELECT 1',), CoyoteDb._CoyoteDb__add_query_comment(('SELECT 1',)))
+
+        self.set_query_comment_settings(query_comments=True, query_comment_sample_rate=0)
+        self.assertFalse(any(commented() for _ in range(100)))
+
+        self.set_query_comment_settings(query_comments=True, query_comment_sample_rate=0.5)
+        random.seed(0)
+        self.assertTrue(300 < sum(commented() for _ in range(1000)) < 700)
+
+    def test_query_comments_skip_downstream_modules(self):
+        """Test that modules added by skip_query_comment_modules are looked past for the code making the query"""
+        self.set_query_comment_settings(query_comments=True, query_comment_sample_rate=1.0)
+        module = 'coyote_db_test_downstream_{}'.format(uuid.uuid4().hex)
+        namespace = {'__name__': module, 'CoyoteDb': CoyoteDb}
+        exec compile('def add_query_comment(args):\n'
+                     '    return CoyoteDb._CoyoteDb__add_query_comment(args)\n', 'downstream_db.py', 'exec') in namespace
+
+        def add_query_comment():
+            return namespace['add_query_comment'](('SELECT 1',))
+
+        self.assertEqual('/*COYOTE: Q_SRC: downstream_db.py:2 */\nSELECT 1', add_query_comment()[0])
+
+        self.addCleanup(QUERY_COMMENT_SKIP_MODULES.discard, module)
+        CoyoteDb.skip_query_comment_modules(module)
+        self.assertEqual('/*COYOTE: Q_SRC: {}:{} */\nSELECT 1'.format(
+            add_query_comment.__code__.co_filename, add_query_comment.__code__.co_firstlineno + 1),
+            add_query_comment()[0])
+
+    def test_failed_statements_give_their_connection_back(self):
+        """Test that a statement raising something other than an OperationalError does not keep its connection"""
+        section = self.add_database('keyed', pool_max_size=1)
+        CoyoteDb.execute_and_commit('CREATE TABLE keyed (id INTEGER PRIMARY KEY)', target_database=section)
+        CoyoteDb.insert('INSERT INTO keyed VALUES (1)', target_database=section)
+
+        try:
+            CoyoteDb.insert('INSERT INTO keyed VALUES (1)', target_database=section)
+            self.fail('No exception was raised')
+        except sqlite3.IntegrityError:
+            # the traceback is still alive here
+            self.assertEqual('keyed', self.read_source(section))
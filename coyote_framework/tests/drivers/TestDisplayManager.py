@@ -0,0 +1,134 @@
+import itertools
+import subprocess
+import threading
+import unittest
+from coyote_framework.drivers.coyote_displaymanager import DisplayManager
+
+__author__ = 'justin@shapeways.com'
+
+
+class FakeDisplay(object):
+
+    numbers = itertools.count(1001)
+
+    def __init__(self, size):
+        self.size = size
+        self.display = next(self.numbers)
+        self.pid = self.display
+        self.alive = False
+        self.stopped = False
+
+    def start(self):
+        self.alive = True
+
+    def stop(self):
+        self.alive = False
+        self.stopped = True
+
+    def is_alive(self):
+        return self.alive
+
+
+class TestDisplayManager(unittest.TestCase):
+
+    def setUp(self):
+        self.started = []
+
+        def factory(size):
+            display = FakeDisplay(size)
+            self.started.append(display)
+            return display
+
+        self.manager = DisplayManager(factory, max_displays=2, clients_per_display=2, probe=lambda number: True)
+
+    def tearDown(self):
+        self.manager.close()
+
+    def test_displays_are_shared(self):
+        """Test that browsers share a display until it is full, and then spread over at most max_displays"""
+        leases = [self.manager.acquire() for _ in range(5)]
+
+        self.assertEqual(2, len(self.started))
+        self.assertEqual([2, 3], sorted(display.clients for display in self.manager.displays))
+        self.assertEqual(':{}'.format(self.started[0].display), leases[0].name)
+        self.assertEqual(leases[0].display, leases[1].display)
+
+    def test_displays_are_reference_counted(self):
+        """Test that released displays keep running and are reused"""
+        lease = self.manager.acquire()
+        lease.stop()
+        lease.stop()
+
+        self.assertEqual(0, self.manager.displays[0].clients)
+        self.assertFalse(self.started[0].stopped)
+        self.assertEqual(lease.display, self.manager.acquire().display)
+        self.assertEqual(1, len(self.started))
+
+    def test_dead_displays_are_restarted(self):
+        """Test that a display that died is restarted before it is handed out again"""
+        self.manager.acquire().stop()
+        self.started[0].alive = False
+
+        lease = self.manager.acquire()
+        self.assertEqual(2, len(self.started))
+        self.assertEqual(self.started[1].display, lease.display)
+        self.assertEqual(1, self.manager.displays[0].restarts)
+
+    def test_display_must_pass_readiness_probe(self):
+        """Test that a display that never accepts connections is stopped and raises"""
+        manager = DisplayManager(FakeDisplay, probe=lambda number: False, startup_timeout=0.1)
+        self.assertRaises(AssertionError, manager.acquire)
+        self.assertEqual([], manager.displays)
+
+    def test_displays_start_outside_the_lock(self):
+        """Test that a slow display start does not block releasing shares of other displays"""
+        first = self.manager.acquire()
+        self.manager.acquire()
+        starting = threading.Event()
+        proceed = threading.Event()
+
+        def slow_probe(number):
+            starting.set()
+            return proceed.wait(5)
+
+        self.manager.probe = slow_probe
+        acquirer = threading.Thread(target=self.manager.acquire)
+        acquirer.start()
+        starting.wait(5)
+
+        released = threading.Thread(target=first.stop)
+        released.start()
+        released.join(1)
+        self.assertFalse(released.is_alive())
+
+        proceed.set()
+        acquirer.join(5)
+        self.assertEqual(2, len(self.manager.displays))
+
+    def test_failed_start_is_dropped(self):
+        """Test that a display that fails to start is removed from the pool"""
+        def failing_factory(size):
+            raise OSError('no Xvfb')
+
+        manager = DisplayManager(failing_factory, probe=lambda number: True)
+        self.assertRaises(OSError, manager.acquire)
+        self.assertEqual([], manager.displays)
+
+    def test_driver_wrapper_never_kills_a_shared_display(self):
+        """Test that quitting a browser whose display lease fails to stop does not kill the shared Xvfb server"""
+        from coyote_framework.tests.webdriverwrapper.fakedriver import FakeDriver
+        from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import WebDriverWrapper
+
+        xvfb = subprocess.Popen(['sleep', '30'])
+        self.addCleanup(xvfb.wait)
+        self.addCleanup(xvfb.kill)
+        lease = self.manager.acquire()
+        lease.pid = xvfb.pid
+
+        def failing_stop():
+            raise RuntimeError('could not release')
+
+        lease.stop = failing_stop
+        dw = WebDriverWrapper(FakeDriver(), display=lease)
+        self.assertRaises(RuntimeError, dw.quit)
+        self.assertIsNone(xvfb.poll())
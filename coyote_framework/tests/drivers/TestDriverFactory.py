@@ -0,0 +1,43 @@
+import unittest
+from selenium.webdriver import DesiredCapabilities
+from coyote_framework.webdriver.webdriver import browsercapabilities, driverfactory
+from coyote_framework.webdriver.webdriver.driverfactory import DriverFactory
+
+__author__ = 'justin@shapeways.com'
+
+
+class TestDriverFactory(unittest.TestCase):
+
+    def setUp(self):
+        self.backends = dict(DriverFactory.backends)
+
+    def tearDown(self):
+        DriverFactory.backends = self.backends
+
+    def test_registered_backends_are_used(self):
+        """Test that drivers come from the backend registered for the browser name, and unknown names go remote"""
+        DriverFactory.register('fake', lambda *args, **kwargs: ('fake', args, kwargs))
+        DriverFactory.register(driverfactory.REMOTE, lambda *args, **kwargs: 'remote')
+
+        self.assertEqual(('fake', (1,), {'a': 2}), DriverFactory().new_driver('fake', 1, a=2))
+        self.assertEqual('remote', DriverFactory.new_driver('unknown'))
+        self.assertTrue(DriverFactory.is_headless(driverfactory.CHROME_HEADLESS))
+        self.assertFalse(DriverFactory.is_headless(driverfactory.FIREFOX))
+
+    def test_capabilities_are_lazy_and_cached(self):
+        """Test that versioned capabilities are built on first use and reused"""
+        chrome = browsercapabilities.Browser.CHROME
+        self.assertEqual({}, chrome._built)
+        self.assertEqual('28', chrome['28']['version'])
+        self.assertIs(chrome['28'], chrome['28'])
+        self.assertEqual(['28'], chrome._built.keys())
+        self.assertEqual(set(['28', '27']), set(chrome))
+
+    def test_capabilities_are_copies(self):
+        """Test that get_capabilities can be modified without changing the cached or selenium capabilities"""
+        capabilities = browsercapabilities.get_capabilities(driverfactory.FIREFOX, unexpectedAlertBehaviour='ignore')
+        capabilities['version'] = '24'
+
+        self.assertEqual('ignore', capabilities['unexpectedAlertBehaviour'])
+        self.assertNotIn('unexpectedAlertBehaviour', DesiredCapabilities.FIREFOX)
+        self.assertNotEqual('24', browsercapabilities.get_capabilities(driverfactory.FIREFOX).get('version'))
@@ -0,0 +1,101 @@
+import threading
+import unittest
+from coyote_framework.drivers.coyote_driverlifecycle import DriverLifecycle, DriverReaper, DriverStartup, \
+    DriverStartupTimeout
+from coyote_framework.tests.webdriverwrapper.fakedriver import FakeDriver
+from coyote_framework.util.apps.polling import polling
+from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import WebDriverWrapper
+
+__author__ = 'justin@shapeways.com'
+
+
+class HangingDriver(FakeDriver):
+
+    def __init__(self):
+        super(HangingDriver, self).__init__()
+        self.hang = threading.Event()
+
+    def quit(self):
+        self.hang.wait(5)
+
+
+class TestDriverLifecycle(unittest.TestCase):
+
+    def setUp(self):
+        self.launched = []
+
+        def factory():
+            driver_wrapper = WebDriverWrapper(FakeDriver())
+            self.launched.append(driver_wrapper)
+            return driver_wrapper
+
+        self.factory = factory
+
+    def test_next_driver_is_started_ahead(self):
+        """Test that acquiring a driver starts the next one, and that released drivers are quit in the background"""
+        lifecycle = DriverLifecycle(self.factory, prestart=1)
+        lifecycle.start_ahead()
+        first = lifecycle.startups[0].result(5)
+
+        with lifecycle.lease() as driver:
+            self.assertIs(first, driver)
+            self.assertIsNot(first, lifecycle.startups[0].result(5))
+        self.assertEqual(2, len(self.launched))
+
+        self.assertTrue(lifecycle.close(timeout=5))
+        for driver_wrapper in self.launched:
+            self.assertIn(('quit',), driver_wrapper.driver.commands)
+
+    def test_startup_errors_are_raised(self):
+        """Test that an exception raised while starting a driver in the background is raised by result()"""
+        def factory():
+            raise ValueError('no browser')
+
+        startup = DriverStartup(factory)
+        self.assertRaises(ValueError, startup.result, 5)
+        self.assertTrue(startup.done())
+
+    def test_hanging_quit_is_killed(self):
+        """Test that a driver that does not quit within the timeout has its browser killed"""
+        driver_wrapper = WebDriverWrapper(HangingDriver())
+        driver_wrapper.driver_pid = -1
+        reaper = DriverReaper(timeout=0.1)
+        killed = []
+        reaper.kill = killed.append
+
+        reaper.reap(driver_wrapper)
+        self.assertTrue(reaper.wait(5))
+        self.assertEqual([driver_wrapper], killed)
+        driver_wrapper.driver.hang.set()
+
+    def test_timed_out_startup_is_reaped(self):
+        """Test that a driver which starts after acquire() gave up on it is quit once it is up"""
+        slow = threading.Event()
+
+        def factory():
+            slow.wait(5)
+            return self.factory()
+
+        lifecycle = DriverLifecycle(factory, prestart=1, startup_timeout=0.05)
+        lifecycle.start_ahead()
+        self.assertRaises(DriverStartupTimeout, lifecycle.acquire)
+
+        slow.set()
+        lifecycle.close(timeout=5)
+        # the timed out driver and the one started ahead after it are both quit once they are up
+        polling.poll(lambda: len(self.launched) == 2 and all(
+            ('quit',) in driver_wrapper.driver.commands for driver_wrapper in self.launched), step=0.01, timeout=5)
+
+    def test_killed_driver_releases_its_display(self):
+        """Test that killing a driver whose quit failed gives back its display"""
+        class Display(object):
+            pid = None
+            stopped = False
+
+            def stop(self):
+                self.stopped = True
+
+        display = Display()
+        driver_wrapper = WebDriverWrapper(FakeDriver(), display=display)
+        DriverReaper().kill(driver_wrapper)
+        self.assertTrue(display.stopped)
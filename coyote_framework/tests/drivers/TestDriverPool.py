@@ -0,0 +1,102 @@
+import threading
+import unittest
+from coyote_framework.drivers.coyote_driverpool import DriverPool, DriverPoolTimeout
+from coyote_framework.tests.webdriverwrapper.fakedriver import FakeDriver
+from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import WebDriverWrapper
+from coyote_framework.webdriver.webdriverwrapper.support.ActionCallbacks import ActionCallback
+
+__author__ = 'justin@shapeways.com'
+
+
+class TestDriverPool(unittest.TestCase):
+
+    def setUp(self):
+        self.launched = []
+
+        def factory():
+            driver_wrapper = WebDriverWrapper(FakeDriver())
+            self.launched.append(driver_wrapper)
+            return driver_wrapper
+
+        self.factory = factory
+
+    def test_sessions_are_reused_and_reset(self):
+        """Test that a released session is reset and leased again instead of launching a new browser"""
+        pool = DriverPool(self.factory, max_size=1, max_uses=5)
+        with pool.lease() as first:
+            pass
+        with pool.lease() as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(1, len(self.launched))
+        commands = [command[0] for command in first.driver.commands]
+        self.assertIn('delete_all_cookies', commands)
+        self.assertIn(('get', 'about:blank'), first.driver.commands)
+
+    def test_sessions_are_recycled_after_max_uses(self):
+        """Test that a session is quit after max_uses leases, and a new one launched"""
+        pool = DriverPool(self.factory, max_size=1, max_uses=2)
+        for _ in range(3):
+            with pool.lease():
+                pass
+
+        self.assertEqual(2, len(self.launched))
+        self.assertIn(('quit',), self.launched[0].driver.commands)
+
+    def test_unhealthy_and_broken_sessions_are_replaced(self):
+        """Test that sessions failing the health check, or whose test raised a non-assertion error, are not reused"""
+        pool = DriverPool(self.factory, max_size=1)
+        with self.assertRaises(ValueError):
+            with pool.lease():
+                raise ValueError('browser crashed')
+        self.assertEqual(0, len(pool))
+
+        with pool.lease() as driver_wrapper:
+            pass
+        type(driver_wrapper.driver).current_window_handle = property(lambda driver: 1 / 0)
+        try:
+            with pool.lease() as replacement:
+                self.assertIsNot(driver_wrapper, replacement)
+        finally:
+            type(driver_wrapper.driver).current_window_handle = 'main'
+        self.assertEqual(3, len(self.launched))
+
+    def test_pool_size_is_capped(self):
+        """Test that leases wait for a free session once the pool is full"""
+        pool = DriverPool(self.factory, max_size=1, lease_timeout=0.05)
+        driver_wrapper = pool.acquire()
+        self.assertRaises(DriverPoolTimeout, pool.acquire)
+
+        threading.Timer(0.01, pool.release, args=(driver_wrapper,)).start()
+        pool.lease_timeout = 5
+        self.assertIs(driver_wrapper, pool.acquire())
+
+    def test_teardown_callbacks_run_for_every_lease(self):
+        """Test that a lease's console checks run (and fail the lease) when it is released, not when the pool resets
+        the session"""
+        events = []
+        console_errors = []
+
+        def check_console(driver_wrapper):
+            events.append('teardown')
+            assert not console_errors, 'Console errors: {}'.format(console_errors)
+
+        callbacks = [ActionCallback(lambda driver_wrapper: events.append('navigation'), on_navigation=True),
+                     ActionCallback(check_console, on_teardown=True)]
+        pool = DriverPool(lambda: WebDriverWrapper(FakeDriver(), action_callbacks=callbacks), max_size=1)
+
+        with self.assertRaises(AssertionError):
+            with pool.lease() as first:
+                console_errors.append('TypeError: undefined is not a function')
+        self.assertEqual(['teardown'], events)
+        self.assertIn(('get', 'about:blank'), first.driver.commands)
+
+        del console_errors[:]
+        with pool.lease() as second:
+            second.visit('http://example.com')
+        self.assertIs(first, second)
+        self.assertEqual(['teardown', 'navigation', 'teardown'], events)
+
+        pool.close()
+        self.assertEqual(['teardown', 'navigation', 'teardown'], events)
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+from coyote_framework.drivers.coyote_profilecache import ProfileCache, WEBDRIVER_EXT_ID
+
+__author__ = 'justin@shapeways.com'
+
+
+class TestProfileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_directory = tempfile.mkdtemp()
+        self.profiles = []
+
+    def tearDown(self):
+        for profile in self.profiles:
+            shutil.rmtree(profile.tempfolder, ignore_errors=True)
+        shutil.rmtree(self.cache_directory, ignore_errors=True)
+
+    def new_profile(self, cache):
+        profile = cache.new_profile()
+        self.profiles.append(profile)
+        return profile
+
+    def test_template_is_built_once(self):
+        """Test that launches share one template per configuration, and a new configuration builds a new one"""
+        cache = ProfileCache(self.cache_directory)
+        first = self.new_profile(cache)
+        second = self.new_profile(cache)
+
+        self.assertNotEqual(first.path, second.path)
+        self.assertEqual([cache.config_hash()], os.listdir(self.cache_directory))
+
+        self.new_profile(ProfileCache(self.cache_directory, preferences={'browser.startup.page': 0}))
+        self.assertEqual(2, len(os.listdir(self.cache_directory)))
+
+    def test_only_extensions_are_hardlinked(self):
+        """Test that extension files are hardlinked to the template, and preferences are copied"""
+        cache = ProfileCache(self.cache_directory)
+        profile = self.new_profile(cache)
+        template = os.path.join(cache.template_directory(), 'profile')
+
+        extension = os.path.join('extensions', WEBDRIVER_EXT_ID, 'install.rdf')
+        self.assertEqual(os.stat(os.path.join(template, extension)).st_ino,
+                         os.stat(os.path.join(profile.path, extension)).st_ino)
+        self.assertNotEqual(os.stat(os.path.join(template, 'user.js')).st_ino,
+                            os.stat(os.path.join(profile.path, 'user.js')).st_ino)
+
+    def test_launch_reuses_template(self):
+        """Test that the WebDriver extension is not reinstalled, and launch preferences are written to the copy"""
+        cache = ProfileCache(self.cache_directory)
+        profile = self.new_profile(cache)
+        template = os.path.join(cache.template_directory(), 'profile')
+
+        extension = os.path.join('extensions', WEBDRIVER_EXT_ID, 'install.rdf')
+        profile.add_extension()
+        self.assertEqual(os.stat(os.path.join(template, extension)).st_ino,
+                         os.stat(os.path.join(profile.path, extension)).st_ino)
+
+        profile.set_preference('webdriver.log.file', '/tmp/webdriver.log')
+        profile.update_preferences()
+        with open(os.path.join(profile.path, 'user.js')) as user_prefs:
+            self.assertIn('webdriver.log.file', user_prefs.read())
+        with open(os.path.join(template, 'user.js')) as user_prefs:
+            self.assertNotIn('webdriver.log.file', user_prefs.read())
+
+    def test_template_preferences_survive_launch(self):
+        """Test that rewriting user.js at launch keeps the template's preferences"""
+        cache = ProfileCache(self.cache_directory, preferences={'browser.startup.page': 0})
+        profile = self.new_profile(cache)
+
+        self.assertEqual(0, profile.default_preferences['browser.startup.page'])
+        profile.update_preferences()
+        with open(os.path.join(profile.path, 'user.js')) as user_prefs:
+            self.assertIn('browser.startup.page', user_prefs.read())
@@ -0,0 +1,106 @@
+import threading
+import unittest
+from coyote_framework.webdriver.webdriverwrapper.support.LocatorHandler import LocatorHandler, LocatorCache
+from coyote_framework.webdriver.webdriverwrapper.support.locator import Locator
+
+__author__ = 'justin@shapeways.com'
+
+
+class FakeSearchObject(object):
+    """Records the strategy used for each find instead of talking to a browser"""
+
+    def __init__(self):
+        self.calls = []
+
+    def find_elements(self, by, value):
+        self.calls.append(('find_elements', by, value))
+        return []
+
+    def find_element(self, by, value):
+        self.calls.append(('find_element', by, value))
+        return None
+
+
+class TestLocatorHandlerCompile(unittest.TestCase):
+
+    def setUp(self):
+        super(TestLocatorHandlerCompile, self).setUp()
+        LocatorHandler.cache.clear()
+
+    def test_locator_instances(self):
+        """Test that every Locator strategy constant resolves to its selenium By"""
+        expected = {
+            Locator.CSS: 'css selector',
+            Locator.ID: 'id',
+            Locator.XPATH: 'xpath',
+            Locator.CLASS_NAME: 'class name',
+            Locator.LINK_TEXT: 'link text',
+            Locator.PARTIAL_LINK_TEXT: 'partial link text',
+            Locator.NAME: 'name',
+            Locator.TAG_NAME: 'tag name',
+        }
+        for by, selenium_by in expected.iteritems():
+            strategy = LocatorHandler.parse_locator(Locator(by, 'value=1'))
+            self.assertEqual((selenium_by, 'value=1'), strategy)
+
+    def test_raw_strings(self):
+        """Test that prefixed strings use their strategy and everything else defaults to css"""
+        self.assertEqual(('xpath', '//div[@id="a"]'), LocatorHandler.parse_locator('xpath=//div[@id="a"]'))
+        self.assertEqual(('css selector', '.class'), LocatorHandler.parse_locator('css=.class'))
+        self.assertEqual(('css selector', '.class'), LocatorHandler.parse_locator('css_selector=.class'))
+        self.assertEqual(('css selector', '.class'), LocatorHandler.parse_locator('.class'))
+        self.assertEqual(('css selector', '[name=fname]'), LocatorHandler.parse_locator('[name=fname]'))
+        self.assertEqual(('css selector', 'a[data-id=5]'), LocatorHandler.parse_locator('a[data-id=5]'))
+
+    def test_locator_instance_is_memoized(self):
+        """Test that a Locator is compiled once, and recompiled if its attributes change"""
+        locator = Locator('css', '.first', 'a locator')
+        strategy = LocatorHandler.compile_locator(locator)
+        self.assertIs(strategy, LocatorHandler.compile_locator(locator))
+
+        locator.locator = '.second'
+        self.assertEqual(('css selector', '.second'), LocatorHandler.compile_locator(locator))
+
+    def test_raw_string_cache_is_bounded(self):
+        """Test that the raw string cache evicts the least recently used entry"""
+        cache = LocatorCache(maxsize=3)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.put('c', 3)
+        cache.get('a')
+        cache.put('d', 4)
+
+        self.assertEqual(3, len(cache))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+
+    def test_raw_string_cache_is_thread_safe(self):
+        """Test that concurrent gets and evicting puts do not corrupt the cache"""
+        cache = LocatorCache(maxsize=16)
+        errors = []
+
+        def hammer(offset):
+            try:
+                for i in range(2000):
+                    key = (offset + i) % 64
+                    if cache.get(key) is None:
+                        cache.put(key, i + 1)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=hammer, args=(n * 7,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([], errors)
+        self.assertLessEqual(len(cache), 16)
+
+    def test_find_by_locator_dispatch(self):
+        """Test that finds dispatch to find_element(s) with the compiled strategy"""
+        search_object = FakeSearchObject()
+        LocatorHandler.find_by_locator(search_object, Locator('xpath', '//a'), True)
+        LocatorHandler.find_by_locator(search_object, 'id=main')
+
+        self.assertEqual([('find_elements', 'xpath', '//a'), ('find_element', 'id', 'main')], search_object.calls)
@@ -0,0 +1,123 @@
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+from coyote_framework.drivers import coyote_displaymanager, coyote_driverlifecycle, coyote_driverpool
+from coyote_framework.testing.coyote_runner import ParallelRunner, ShardResult, discover_modules, load_durations, \
+    run_shard, save_durations, shard_modules
+
+__author__ = 'justin@shapeways.com'
+
+
+URLBUILDER_MODULES = [
+    'coyote_framework.tests.urbuilder.TestUrlBuilderHostArgument',
+    'coyote_framework.tests.urbuilder.TestUrlBuilderHostAndPortArguments',
+]
+
+
+class TestParallelRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.durations_path = os.path.join(self.directory, 'durations', 'test_durations.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_shards_are_balanced_by_duration(self):
+        """Test that the longest modules are spread over the shards first, and unknown modules get the mean duration"""
+        durations = {'a': 10, 'b': 6, 'c': 5, 'd': 1}
+        self.assertEqual([['a', 'd'], ['b', 'c']], shard_modules(['a', 'b', 'c', 'd'], 2, durations))
+        self.assertEqual([['a', 'c'], ['b', 'new', 'd']], shard_modules(['a', 'b', 'c', 'd', 'new'], 2, durations))
+        self.assertEqual([['a'], ['b']], shard_modules(['a', 'b'], 4))
+
+    def test_durations_are_merged_into_history(self):
+        """Test that saved durations update the history instead of replacing it"""
+        self.assertEqual({}, load_durations(self.durations_path))
+        save_durations(self.durations_path, {'a': 1.0, 'b': 2.0})
+        save_durations(self.durations_path, {'b': 3.0})
+        self.assertEqual({'a': 1.0, 'b': 3.0}, load_durations(self.durations_path))
+
+    def test_shard_results_survive_pickling(self):
+        """Test that a shard's outcomes are kept by test id, so they can be sent back from a worker"""
+        class Shard(unittest.TestCase):
+            def test_pass(self):
+                pass
+
+            def test_fail(self):
+                self.fail('broken')
+
+        result = ShardResult()
+        unittest.defaultTestLoader.loadTestsFromTestCase(Shard).run(result)
+        result = pickle.loads(pickle.dumps(result))
+
+        self.assertEqual(2, result.testsRun)
+        self.assertEqual(1, len(result.successes))
+        self.assertIn('test_fail', result.failures[0][0])
+        self.assertIn('broken', result.failures[0][1])
+        self.assertIn(Shard.__module__, result.durations)
+
+    def test_modules_run_in_worker_processes(self):
+        """Test that the results of every worker are merged, and their durations saved"""
+        stream = StringIO()
+        result = ParallelRunner(workers=2, durations_path=self.durations_path, stream=stream).run(URLBUILDER_MODULES)
+
+        self.assertTrue(result.wasSuccessful(), stream.getvalue())
+        self.assertEqual(len(result.successes), result.testsRun)
+        self.assertIn('on 2 workers', stream.getvalue())
+        self.assertEqual(set(URLBUILDER_MODULES), set(load_durations(self.durations_path)))
+
+    def test_shard_closes_its_pools(self):
+        """Test that a shard closes the driver lifecycle, driver pool and display manager it started, in that order"""
+        closed = []
+
+        class Closeable(object):
+            def __init__(self, name):
+                self.name = name
+
+            def close(self):
+                closed.append(self.name)
+
+        originals = (coyote_driverlifecycle._default_lifecycle, coyote_driverpool._default_pool,
+                     coyote_displaymanager._default_manager)
+        try:
+            coyote_displaymanager._default_manager = Closeable('displays')
+            coyote_driverpool._default_pool = Closeable('pool')
+            coyote_driverlifecycle._default_lifecycle = Closeable('lifecycle')
+
+            result = run_shard(URLBUILDER_MODULES[:1])
+
+            self.assertTrue(result.wasSuccessful())
+            self.assertEqual(['lifecycle', 'pool', 'displays'], closed)
+            self.assertIsNone(coyote_driverpool._default_pool)
+        finally:
+            (coyote_driverlifecycle._default_lifecycle, coyote_driverpool._default_pool,
+             coyote_displaymanager._default_manager) = originals
+
+    def test_modules_that_fail_to_import_are_errors(self):
+        """Test that a discovered module that can not be imported is run (and reported as an error), not dropped"""
+        package = os.path.join(self.directory, 'coyote_runner_test_project')
+        os.mkdir(package)
+        for name, source in (('__init__.py', ''),
+                             ('test_ok.py', 'import unittest\n\n\nclass TestOk(unittest.TestCase):\n'
+                                            '    def test_ok(self):\n        pass\n'),
+                             ('test_broken.py', 'import nosuchmodule_xyz\n')):
+            with open(os.path.join(package, name), 'w') as module_file:
+                module_file.write(source)
+        self.addCleanup(sys.path.remove, self.directory)
+        self.addCleanup(lambda: [sys.modules.pop(module) for module in list(sys.modules)
+                                 if module.startswith('coyote_runner_test_project')])
+
+        modules = discover_modules(package, top_level_directory=self.directory)
+        self.assertEqual(['coyote_runner_test_project.test_broken', 'coyote_runner_test_project.test_ok'],
+                         sorted(modules))
+
+        stream = StringIO()
+        result = ParallelRunner(workers=2, durations_path=self.durations_path, stream=stream).run(modules)
+        self.assertFalse(result.wasSuccessful())
+        self.assertEqual('coyote_runner_test_project.test_broken', result.errors[0][0])
+        self.assertIn('nosuchmodule_xyz', result.errors[0][1])
+        self.assertIn('FAILED (errors=1)', stream.getvalue())
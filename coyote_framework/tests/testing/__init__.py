@@ -0,0 +1 @@
+__author__ = 'justin@shapeways.com'
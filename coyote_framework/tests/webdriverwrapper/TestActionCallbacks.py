@@ -0,0 +1,71 @@
+import threading
+import unittest
+from coyote_framework.tests.webdriverwrapper.fakedriver import FakeDriver
+from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import WebDriverWrapper
+from coyote_framework.webdriver.webdriverwrapper.support.ActionCallbacks import ActionCallback, ACTION, NAVIGATION, \
+    TEARDOWN
+
+__author__ = 'justin@shapeways.com'
+
+
+class TestActionCallbacks(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def record(self, name):
+        return lambda driver_wrapper: self.calls.append(name)
+
+    def test_triggers(self):
+        """Test that callbacks run only for the events their triggers select"""
+        every_third = ActionCallback(self.record('every'), every=3)
+        navigation = ActionCallback(self.record('navigation'), on_navigation=True)
+        teardown = ActionCallback(self.record('teardown'), on_teardown=True)
+        dw = WebDriverWrapper(FakeDriver(), action_callbacks=[self.record('plain'), every_third, navigation, teardown])
+
+        for _ in range(3):
+            dw.callback_pipeline.run(ACTION)
+        dw.callback_pipeline.run(NAVIGATION)
+        dw.callback_pipeline.teardown()
+
+        self.assertEqual(['plain', 'plain', 'plain', 'every', 'plain', 'navigation', 'teardown'], self.calls)
+
+    def test_failing_teardown_still_quits(self):
+        """Test that the driver quits when a teardown callback raises, and that the callback's error is raised"""
+        def fail(driver_wrapper):
+            raise ValueError('console errors')
+
+        driver = FakeDriver()
+        dw = WebDriverWrapper(driver, action_callbacks=[ActionCallback(fail, on_teardown=True)])
+
+        self.assertRaises(ValueError, dw.quit)
+        self.assertIn(('quit',), driver.commands)
+
+    def test_debounce(self):
+        """Test that a debounced callback runs at most once per interval"""
+        callback = ActionCallback(self.record('debounced'), debounce=5)
+        self.assertEqual([True, False, False, True], [callback.is_triggered(ACTION, now) for now in (0, 1, 4.9, 5)])
+        self.assertFalse(callback.is_triggered(TEARDOWN, 10))
+
+    def test_navigation_runs_callbacks(self):
+        """Test that visiting a page runs the navigation callbacks"""
+        dw = WebDriverWrapper(FakeDriver(), action_callbacks=[ActionCallback(self.record('navigation'),
+                                                                             on_navigation=True)])
+        dw.visit('http://example.com')
+        self.assertEqual(['navigation'], self.calls)
+
+    def test_background_callbacks(self):
+        """Test that background callbacks run off the calling thread and errors are collected, not raised"""
+        threads = []
+
+        def collect(driver_wrapper):
+            threads.append(threading.current_thread())
+            raise ValueError('collection failed')
+
+        dw = WebDriverWrapper(FakeDriver(), action_callbacks=[ActionCallback(collect, background=True)])
+        dw.callback_pipeline.run(ACTION)
+        dw.callback_pipeline.teardown()
+
+        self.assertEqual(1, len(threads))
+        self.assertIsNot(threading.current_thread(), threads[0])
+        self.assertEqual(1, len(dw.callback_pipeline.errors))
@@ -0,0 +1,51 @@
+import unittest
+from coyote_framework.tests.webdriverwrapper.fakedriver import FakeDriver
+from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import WebDriverWrapper, BROWSER_LOG_LEVEL_SEVERE
+from coyote_framework.webdriver.webdriverwrapper.support.BrowserLog import BrowserLogBuffer, EVICT_LOWEST_LEVEL
+
+__author__ = 'justin@shapeways.com'
+
+
+def entry(level, message):
+    return {u'level': level, u'message': message}
+
+
+class TestBrowserLog(unittest.TestCase):
+
+    def test_buffer_is_bounded(self):
+        """Test that the oldest entries are evicted once the buffer is full"""
+        buffer = BrowserLogBuffer(maxlen=3)
+        buffer.extend(entry(u'INFO', str(i)) for i in range(5))
+
+        self.assertEqual(['2', '3', '4'], [e[u'message'] for e in buffer])
+        self.assertEqual(2, buffer.evicted)
+
+    def test_lowest_level_eviction_keeps_errors(self):
+        """Test that lowest-level eviction drops debug and info entries before severe ones"""
+        buffer = BrowserLogBuffer(maxlen=2, eviction=EVICT_LOWEST_LEVEL)
+        buffer.extend([entry(u'SEVERE', 'error'), entry(u'INFO', 'info'), entry(u'DEBUG', 'debug')])
+
+        self.assertEqual(['error', 'info'], [e[u'message'] for e in buffer])
+
+    def test_consumers_read_incrementally(self):
+        """Test that each consumer only sees entries it has not read yet, filtered by level"""
+        buffer = BrowserLogBuffer()
+        buffer.extend([entry(u'SEVERE', 'a'), entry(u'INFO', 'b')])
+        self.assertEqual(['a'], [e[u'message'] for e in buffer.read('errors', [u'SEVERE'])])
+
+        buffer.extend([entry(u'SEVERE', 'c')])
+        self.assertEqual(['c'], [e[u'message'] for e in buffer.read('errors', [u'SEVERE'])])
+        self.assertEqual([], buffer.read('errors'))
+        self.assertEqual(['a', 'b', 'c'], [e[u'message'] for e in buffer.read('everything')])
+
+    def test_get_browser_log_consumers(self):
+        """Test that a consumer of get_browser_log sees entries fetched by other callers"""
+        driver = FakeDriver()
+        fetches = [[entry(u'SEVERE', 'first')], [entry(u'SEVERE', 'second')], []]
+        driver.get_log = lambda log_type: fetches.pop(0)
+        dw = WebDriverWrapper(driver, browser_log_size=10)
+
+        self.assertEqual(1, len(dw.get_browser_log()))
+        self.assertEqual(['first', 'second'], [e[u'message'] for e in dw.get_browser_log(
+            levels=[BROWSER_LOG_LEVEL_SEVERE], consumer='console_errors')])
+        self.assertEqual([], dw.get_browser_log(consumer='console_errors'))
@@ -0,0 +1,45 @@
+import unittest
+from coyote_framework.tests.webdriverwrapper.fakedriver import FakeDriver, FakeElement
+from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import WebDriverWrapper
+from coyote_framework.webdriver.webdriverwrapper.support.locator import DynamicLocator, Locator
+
+__author__ = 'justin@shapeways.com'
+
+
+class TestDynamicLocator(unittest.TestCase):
+
+    def setUp(self):
+        super(TestDynamicLocator, self).setUp()
+        self.cell = DynamicLocator('css', 'tr[data-row="{row}"] td.{column}', 'table cell')
+
+    def test_build_substitutes_all_variables(self):
+        """Test that a dynamic locator builds the same locator as str.format"""
+        built = self.cell.build(row=3, column='price')
+
+        self.assertIsInstance(built, Locator)
+        self.assertEqual('tr[data-row="3"] td.price', built.locator)
+        self.assertEqual('table cell', built.description)
+
+    def test_build_with_format_spec(self):
+        """Test that templates with format specs fall back to str.format"""
+        self.assertEqual('#row-007', DynamicLocator('css', '#row-{row:03d}').build(row=7).locator)
+
+    def test_build_missing_variable(self):
+        self.assertRaises(KeyError, self.cell.build, row=3)
+
+    def test_string_template_substitutes_every_variable(self):
+        """Test that every %variable of a string template is replaced, not just the last one"""
+        dw = WebDriverWrapper(FakeDriver())
+        locator = dw.build_dynamic_locator('#%id_suffix .%id', {'id': 'a', 'id_suffix': 'b'})
+        self.assertEqual('#b .a', locator)
+
+    def test_batch_resolves_in_one_script(self):
+        """Test that the batch form finds every row with a single script execution"""
+        rows = dict(('tr[data-row="{}"] td.price'.format(row), [FakeElement(row)]) for row in range(5))
+        driver = FakeDriver(script_handler=lambda script, args: [rows.get(selector) for selector in args[0]])
+        dw = WebDriverWrapper(driver)
+
+        cells = dw.find_many_by_dynamic_locator(self.cell, [{'row': row, 'column': 'price'} for row in range(5)])
+
+        self.assertEqual(range(5), [cell.element.name for cell in cells])
+        self.assertEqual(1, len(driver.commands))
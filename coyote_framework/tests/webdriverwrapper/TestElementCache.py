@@ -0,0 +1,100 @@
+import unittest
+from coyote_framework.tests.webdriverwrapper.fakedriver import FakeDriver, FakeElement
+from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import WebDriverWrapper
+from coyote_framework.webdriver.webdriverwrapper.support.locator import Locator
+
+__author__ = 'justin@shapeways.com'
+
+
+class TestElementCache(unittest.TestCase):
+
+    def setUp(self):
+        super(TestElementCache, self).setUp()
+        self.dom_changed = False
+        self.element = FakeElement('title')
+        self.locator = Locator('css', '.title', 'title')
+        self.driver = FakeDriver(elements={('css selector', '.title'): [self.element]},
+                                 script_handler=lambda script, *args: self.dom_changed)
+
+    def finds(self):
+        return len([command for command in self.driver.commands if command[0] == 'find_elements'])
+
+    def probes(self):
+        return len([command for command in self.driver.commands if command[0] == 'execute_script'])
+
+    def test_repeated_finds_are_cached(self):
+        """Test that finding the same locator twice only queries the browser once"""
+        dw = WebDriverWrapper(self.driver, use_element_cache=True, observe_dom_mutations=False)
+
+        self.assertIs(self.element, dw.find(self.locator).element)
+        self.assertIs(self.element, dw.find(self.locator).element)
+
+        self.assertEqual(1, self.finds())
+        self.assertEqual({'hits': 1, 'misses': 1, 'invalidations': 0, 'size': 1}, dw.element_cache.stats())
+
+    def test_navigation_invalidates(self):
+        """Test that visiting a page clears the cache"""
+        dw = WebDriverWrapper(self.driver, use_element_cache=True, observe_dom_mutations=False)
+
+        dw.find(self.locator)
+        dw.visit('http://example.com')
+        dw.find(self.locator)
+
+        self.assertEqual(2, self.finds())
+        self.assertEqual(1, dw.element_cache.invalidations)
+
+    def test_dom_mutation_invalidates(self):
+        """Test that a DOM change reported by the observer clears the cache, which by default probes every find"""
+        dw = WebDriverWrapper(self.driver, use_element_cache=True)
+
+        dw.find(self.locator)
+        dw.find(self.locator)
+        self.dom_changed = True
+        dw.find(self.locator)
+
+        self.assertEqual(2, self.finds())
+        self.assertEqual(1, dw.element_cache.hits)
+
+    def test_cache_disabled_by_default(self):
+        """Test that the cache is opt-in"""
+        dw = WebDriverWrapper(self.driver)
+
+        dw.find(self.locator)
+        dw.find(self.locator)
+
+        self.assertIsNone(dw.element_cache)
+        self.assertEqual(2, self.finds())
+
+    def test_recent_probe_vouches_for_hits(self):
+        """Test that hits within the probe interval do not run the observer script"""
+        dw = WebDriverWrapper(self.driver, use_element_cache=True, dom_probe_interval=60)
+
+        for _ in range(5):
+            dw.find(self.locator)
+
+        self.assertEqual(1, self.finds())
+        self.assertEqual(1, self.probes())
+        self.assertEqual(4, dw.element_cache.hits)
+
+    def test_detected_mutation_probes_once(self):
+        """Test that a find which detects a mutation does not probe again before re-finding"""
+        dw = WebDriverWrapper(self.driver, use_element_cache=True, dom_probe_interval=0)
+
+        dw.find(self.locator)
+        self.dom_changed = True
+        dw.find(self.locator)
+
+        self.assertEqual(2, self.finds())
+        self.assertEqual(2, self.probes())
+
+    def test_element_action_expires_probe(self):
+        """Test that an action which may change the page makes the next hit probe again"""
+        dw = WebDriverWrapper(self.driver, use_element_cache=True, dom_probe_interval=60)
+
+        element = dw.find(self.locator)
+        element.click()
+        self.dom_changed = True
+        dw.find(self.locator)
+
+        self.assertEqual(2, self.finds())
+        self.assertEqual(2, self.probes())
@@ -0,0 +1,46 @@
+import unittest
+from coyote_framework.tests.webdriverwrapper.fakedriver import FakeDriver, FakeElement
+from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import WebDriverWrapper
+from coyote_framework.webdriver.webdriverwrapper.support.locator import Locator
+
+__author__ = 'justin@shapeways.com'
+
+
+class TestFindMany(unittest.TestCase):
+
+    def setUp(self):
+        super(TestFindMany, self).setUp()
+        self.title = FakeElement('title')
+        self.button = FakeElement('button')
+        self.link = FakeElement('link')
+
+        css_dom = {'.title': [self.title], '.button': [self.button]}
+
+        def querySelectorAll(script, args):
+            selectors, root, first_only = args
+            return [css_dom.get(selector, []) for selector in selectors]
+
+        self.driver = FakeDriver(elements={('xpath', '//a'): [self.link]}, script_handler=querySelectorAll)
+        self.dw = WebDriverWrapper(self.driver, find_attempts=0)
+
+    def test_css_locators_resolve_in_one_script(self):
+        """Test that all css locators are found with a single execute_script and no WebDriver finds"""
+        found = self.dw.find_many({
+            'title': Locator('css', '.title', 'title'),
+            'button': '.button',
+        })
+
+        self.assertIs(self.title, found['title'].element)
+        self.assertIs(self.button, found['button'].element)
+        self.assertEqual(1, len(self.driver.commands))
+        self.assertEqual('execute_script', self.driver.commands[0][0])
+
+    def test_non_css_locators_fall_back_to_find(self):
+        """Test that non-css locators are found with a regular find"""
+        found = self.dw.find_many({
+            'title': Locator('css', '.title', 'title'),
+            'link': Locator('xpath', '//a', 'link'),
+        })
+
+        self.assertIs(self.link, found['link'].element)
+        self.assertEqual(['execute_script', 'find_elements'], [command[0] for command in self.driver.commands])
@@ -0,0 +1,79 @@
+import unittest
+from selenium.common.exceptions import StaleElementReferenceException
+from selenium.webdriver.common.by import By
+from coyote_framework.tests.webdriverwrapper.fakedriver import FakeDriver, FakeElement
+from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import WebDriverWrapper
+from coyote_framework.webdriver.webdriverwrapper.support.locator import Locator
+
+__author__ = 'justin@shapeways.com'
+
+
+class TestFramePaths(unittest.TestCase):
+
+    def setUp(self):
+        self.outer = FakeElement('outer')
+        self.inner = FakeElement('inner')
+        self.button = FakeElement('button')
+        self.driver = FakeDriver({
+            (By.CSS_SELECTOR, '#outer'): [self.outer],
+            (By.CSS_SELECTOR, '#inner'): [self.inner],
+            (By.CSS_SELECTOR, '.button'): [self.button],
+        }, script_handler=lambda script, arguments: [self.button])
+        self.dw = WebDriverWrapper(self.driver, find_attempts=0)
+        self.button_locator = Locator('css', '.button', 'button in nested frame', frames=('#outer', '#inner'))
+
+    def commands(self):
+        commands = [command[0] if command[0] != 'switch_to_frame' else command[1].name
+                    for command in self.driver.commands]
+        del self.driver.commands[:]
+        return commands
+
+    def test_frames_are_switched_only_when_needed(self):
+        """Test that a framed locator switches through its frames once, and not again while already there"""
+        self.assertIs(self.button, self.dw.find(self.button_locator).element)
+        self.assertEqual(['find_elements', 'outer', 'find_elements', 'inner', 'find_elements'], self.commands())
+
+        self.dw.find(self.button_locator)
+        self.assertEqual(['find_elements'], self.commands())
+
+        self.dw.find(Locator('css', '.button', frames=()))
+        self.assertEqual(['switch_to_default_content', 'find_elements'], self.commands())
+
+    def test_frame_elements_are_cached_until_navigation(self):
+        """Test that frame elements are reused when switching back, and found again after navigation"""
+        self.dw.find(self.button_locator)
+        self.dw.switch_to_default_content()
+        self.commands()
+
+        self.dw.find(self.button_locator)
+        self.assertEqual(['outer', 'inner', 'find_elements'], self.commands())
+
+        self.dw.visit('http://example.com')
+        self.commands()
+        self.dw.find(self.button_locator)
+        self.assertEqual(['find_elements', 'outer', 'find_elements', 'inner', 'find_elements'], self.commands())
+
+    def test_stale_frame_is_found_again(self):
+        """Test that a stale cached frame element is dropped and the path is found again from the top"""
+        self.dw.find(self.button_locator)
+        self.dw.switch_to_default_content()
+
+        switch_to_frame = self.driver.switch_to_frame
+        stale = [self.outer]
+
+        def switch_to_stale_frame(frame):
+            if stale and frame is stale.pop():
+                raise StaleElementReferenceException('frame was reloaded')
+            switch_to_frame(frame)
+        self.driver.switch_to_frame = switch_to_stale_frame
+
+        self.assertIs(self.button, self.dw.find(self.button_locator).element)
+        self.assertEqual(('#outer', '#inner'), tuple(s.value for s in self.dw.current_frame_path))
+
+    def test_shadow_roots(self):
+        """Test that locators with shadow roots are found with a script, and must be css"""
+        locator = Locator('css', '.button', shadow_roots=['my-app', 'my-dialog'])
+        self.assertIs(self.button, self.dw.find(locator).element)
+        self.assertEqual(([['my-app', 'my-dialog'], '.button', None],), self.driver.commands[-1][1])
+
+        self.assertRaises(ValueError, self.dw.find, Locator('xpath', '//button', shadow_roots=['my-app']))
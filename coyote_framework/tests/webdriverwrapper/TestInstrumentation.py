@@ -0,0 +1,69 @@
+import unittest
+from selenium.common.exceptions import StaleElementReferenceException
+from selenium.webdriver.common.by import By
+from coyote_framework.tests.webdriverwrapper.fakedriver import FakeDriver, FakeElement
+from coyote_framework.util.pageobjects.web.webobjects import WebComponent
+from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import WebDriverWrapper
+from coyote_framework.webdriver.webdriverwrapper.support.Instrumentation import Instrumentation, Histogram
+from coyote_framework.webdriver.webdriverwrapper.support.locator import Locator
+
+__author__ = 'justin@shapeways.com'
+
+
+class SearchForm(WebComponent):
+
+    submit_button = Locator('css', '.submit', 'submit button')
+
+    def submit(self):
+        return self.driver_wrapper.find(self.submit_button)
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.button = FakeElement('submit')
+        self.driver = FakeDriver({(By.CSS_SELECTOR, '.submit'): [self.button]})
+        self.dw = WebDriverWrapper(self.driver, find_attempts=1, instrumentation=Instrumentation())
+
+    def test_actions_are_tagged_by_locator_and_page_object(self):
+        """Test that finds are recorded with the locator description and the calling page object class"""
+        form = SearchForm(element=self.dw.find('.submit'), driver_wrapper=self.dw)
+        form.submit()
+        form.submit()
+
+        rows = dict(((row['action'], row['page_object']), row) for row in self.dw.instrumentation.report())
+        self.assertEqual(1, rows[('find', None)]['count'])
+        self.assertEqual(2, rows[('find', 'SearchForm')]['count'])
+        self.assertEqual('submit button', rows[('find', 'SearchForm')]['locator'])
+
+    def test_stale_recoveries_are_counted(self):
+        """Test that element actions record the stale element recoveries they needed"""
+        element = self.dw.find('.submit')
+        calls = []
+
+        def stale_once():
+            calls.append(1)
+            if len(calls) == 1:
+                raise StaleElementReferenceException('stale')
+            return 'clicked'
+
+        self.assertEqual('clicked', element.execute_and_handle_webelement_exceptions(stale_once, 'click'))
+        click = [row for row in self.dw.instrumentation.report() if row['action'] == 'click'][0]
+        self.assertEqual((1, 1, 1, 0), (click['count'], click['retries'], click['stale_recoveries'],
+                                        click['failures']))
+
+    def test_disabled_by_default(self):
+        """Test that nothing is recorded without an instrumentation"""
+        dw = WebDriverWrapper(self.driver)
+        self.assertIsNone(dw.instrumentation)
+        self.assertIs(self.button, dw.find('.submit').element)
+
+    def test_histogram_percentiles(self):
+        """Test that percentiles report the bucket bound, capped by the slowest duration"""
+        histogram = Histogram()
+        for duration in [0.0015] * 9 + [0.5]:
+            histogram.add(duration)
+
+        self.assertEqual(0.002, histogram.percentile(50))
+        self.assertEqual(0.5, histogram.percentile(100))
+        self.assertAlmostEqual(0.05135, histogram.mean())
@@ -0,0 +1,41 @@
+import unittest
+from selenium.webdriver.common.by import By
+from coyote_framework.tests.webdriverwrapper.fakedriver import FakeDriver, FakeElement
+from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import WebDriverWrapper
+
+__author__ = 'justin@shapeways.com'
+
+
+class TestPresenceNoWait(unittest.TestCase):
+
+    def setUp(self):
+        def query_selectors(script, arguments):
+            selectors = arguments[0]
+            return [self.driver.children.get((By.CSS_SELECTOR, selector), [])[:1] for selector in selectors]
+
+        self.driver = FakeDriver({
+            (By.CSS_SELECTOR, '.spinner'): [FakeElement('spinner')],
+            (By.XPATH, '//form'): [FakeElement('form')],
+        }, script_handler=query_selectors)
+        self.dw = WebDriverWrapper(self.driver, implicit_wait=5)
+
+    def test_css_presence_is_probed_in_javascript(self):
+        """Test that css presence checks run one script and never touch the implicit wait"""
+        self.assertTrue(self.dw.is_present_no_wait('.spinner'))
+        self.assertFalse(self.dw.is_present_no_wait('.error'))
+        self.assertEqual(['execute_script', 'execute_script'], [command[0] for command in self.driver.commands])
+        self.assertEqual([5], self.driver.implicit_waits)
+
+    def test_other_presence_zeroes_implicit_wait(self):
+        """Test that non-css presence checks zero the implicit wait and restore it afterwards"""
+        self.assertTrue(self.dw.is_present_no_wait('xpath=//form'))
+        self.assertEqual([5, 0, 5], self.driver.implicit_waits)
+
+    def test_batched_presence(self):
+        """Test that many locators are checked with one script plus one zero-wait window for the rest"""
+        present = self.dw.are_present_no_wait({
+            'spinner': '.spinner', 'error': '.error', 'form': 'xpath=//form', 'table': 'xpath=//table'})
+
+        self.assertEqual({'spinner': True, 'error': False, 'form': True, 'table': False}, present)
+        self.assertEqual(1, len([command for command in self.driver.commands if command[0] == 'execute_script']))
+        self.assertEqual([5, 0, 5], self.driver.implicit_waits)
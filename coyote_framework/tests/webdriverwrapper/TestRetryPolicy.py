@@ -0,0 +1,53 @@
+import time
+import unittest
+from coyote_framework.tests.webdriverwrapper.fakedriver import FakeDriver, FakeElement
+from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import WebDriverWrapper
+from coyote_framework.webdriver.webdriverwrapper.support.RetryPolicy import RetryPolicy
+
+__author__ = 'justin@shapeways.com'
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_attempts_stop_at_deadline(self):
+        """Test that attempts back off and stop once the deadline has passed"""
+        policy = RetryPolicy(initial_delay=0.01, multiplier=2, jitter=0, deadline=0.1)
+
+        start = time.time()
+        attempts = list(policy.attempts())
+        elapsed = time.time() - start
+
+        self.assertTrue(3 <= len(attempts) <= 6, 'Unexpected number of attempts: {}'.format(len(attempts)))
+        self.assertTrue(elapsed < 0.5, 'Policy ran past its deadline: {}s'.format(elapsed))
+
+    def test_max_attempts(self):
+        """Test that max_attempts caps the number of attempts"""
+        policy = RetryPolicy(initial_delay=0, deadline=10, max_attempts=3)
+        self.assertEqual([0, 1, 2], list(policy.attempts()))
+
+    def test_invalid_settings(self):
+        """Test that nonsensical policies are rejected"""
+        self.assertRaises(ValueError, RetryPolicy, multiplier=0.5)
+        self.assertRaises(ValueError, RetryPolicy, jitter=1.5)
+        self.assertRaises(ValueError, RetryPolicy, deadline=-1)
+
+    def test_find_polls_without_implicit_wait(self):
+        """Test that a wrapper with a retry policy disables the implicit wait and polls until the element appears"""
+        driver = FakeDriver()
+        dw = WebDriverWrapper(driver, retry_policy=RetryPolicy(initial_delay=0.001, jitter=0, deadline=5))
+        self.assertEqual([0], driver.implicit_waits)
+
+        element = FakeElement('late')
+        original_find_elements = driver.find_elements
+
+        def find_elements(by, value):
+            if len(driver.commands) == 3:
+                driver.children[(by, value)] = [element]
+            return original_find_elements(by, value)
+        driver.find_elements = find_elements
+
+        self.assertIs(element, dw.find('.late').element)
+        self.assertEqual(4, len(driver.commands))
+
+        dw.set_retry_policy(None)
+        self.assertEqual([0, 1], driver.implicit_waits)
@@ -0,0 +1,40 @@
+import unittest
+from selenium.webdriver.common.by import By
+from coyote_framework.tests.webdriverwrapper.fakedriver import FakeDriver, FakeElement
+from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import WebDriverWrapper
+
+__author__ = 'justin@shapeways.com'
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.cells = [FakeElement('cell{}'.format(i), text='Cell {}'.format(i)) for i in range(3)]
+
+        def read_fields(script, arguments):
+            elements, fields = arguments
+            return [[{'text': e.text, 'data-id': e.name}[field] for field in fields] for e in elements]
+
+        self.driver = FakeDriver({(By.CSS_SELECTOR, 'td'): self.cells}, script_handler=read_fields)
+        self.dw = WebDriverWrapper(self.driver, find_attempts=0)
+
+    def test_snapshot_reads_all_elements_in_one_script(self):
+        """Test that a snapshot of many elements is a single script execution returning one record per element"""
+        cells = self.dw.find_all('td')
+        del self.driver.commands[:]
+
+        records = self.dw.snapshot(cells, fields=['text', 'data-id'])
+
+        self.assertEqual(1, len(self.driver.commands))
+        self.assertEqual(['Cell 0', 'Cell 1', 'Cell 2'], [record.text for record in records])
+        self.assertEqual('cell1', records[1].data_id)
+        self.assertEqual(('Cell 2', 'cell2'), records[2])
+
+    def test_snapshot_by_locator(self):
+        """Test that a snapshot can find its elements from a locator"""
+        self.assertEqual(['Cell 0', 'Cell 1', 'Cell 2'], [text for text, in self.dw.snapshot('td')])
+
+    def test_empty_snapshot(self):
+        """Test that a snapshot of no elements does not run a script"""
+        self.assertEqual([], self.dw.snapshot([], fields=['text']))
+        self.assertEqual([], self.driver.commands)
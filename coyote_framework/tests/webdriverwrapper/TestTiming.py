@@ -0,0 +1,50 @@
+import threading
+import unittest
+from coyote_framework.tests.webdriverwrapper.fakedriver import FakeDriver
+from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import WebDriverWrapper
+
+__author__ = 'justin@shapeways.com'
+
+
+class TestTiming(unittest.TestCase):
+
+    def setUp(self):
+        self.driver = FakeDriver()
+        self.dw = WebDriverWrapper(self.driver, implicit_wait=5, find_attempts=2)
+
+    def test_nested_timing_restores_settings(self):
+        """Test that nested timing contexts set and restore both the wrapper and the browser settings"""
+        with self.dw.timing(implicit_wait=0, find_attempts=1):
+            self.assertEqual((0, 1), (self.dw.implicit_wait, self.dw.find_attempts))
+            with self.dw.timing(implicit_wait=0, find_attempts=0):
+                self.assertEqual(0, self.dw.find_attempts)
+            self.assertEqual(1, self.dw.find_attempts)
+
+        self.assertEqual((5, 2), (self.dw.implicit_wait, self.dw.find_attempts))
+        # the inner context did not change the implicit wait, so it made no WebDriver calls
+        self.assertEqual([5, 0, 5], self.driver.implicit_waits)
+
+    def test_timing_restores_after_error(self):
+        """Test that settings are restored when the block raises"""
+        with self.assertRaises(KeyError):
+            with self.dw.timing(implicit_wait=1):
+                raise KeyError()
+        self.assertEqual(5, self.dw.implicit_wait)
+        self.assertEqual(5, self.dw.browser_implicit_wait)
+
+    def test_other_threads_wait_for_timing(self):
+        """Test that another thread cannot enter timing() while one is active"""
+        seen = []
+
+        def other_thread():
+            with self.dw.timing(find_attempts=7):
+                seen.append(self.dw.implicit_wait)
+
+        with self.dw.timing(implicit_wait=0):
+            thread = threading.Thread(target=other_thread)
+            thread.start()
+            thread.join(0.05)
+            self.assertEqual([], seen)
+        thread.join()
+
+        self.assertEqual([5], seen)
@@ -0,0 +1,45 @@
+import unittest
+from selenium.webdriver.common.by import By
+from coyote_framework.tests.webdriverwrapper.fakedriver import FakeDriver, FakeElement
+from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import WebDriverWrapper
+from coyote_framework.webdriver.webdriverwrapper.exceptions.WebDriverWrapperException import WebDriverWrapperException
+
+__author__ = 'justin@shapeways.com'
+
+
+class TestVisibilityFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.hidden = FakeElement('hidden', displayed=False)
+        self.shown = FakeElement('shown')
+
+        def filter_displayed(script, arguments):
+            selector_or_elements, root, require_visible = arguments[:3]
+            if isinstance(selector_or_elements, basestring):
+                selector_or_elements = self.driver.children.get((By.CSS_SELECTOR, selector_or_elements), [])
+            filtered = [e for e in selector_or_elements if e.displayed or not require_visible]
+            return [filtered, len(selector_or_elements)]
+
+        self.driver = FakeDriver({
+            (By.CSS_SELECTOR, '.item'): [self.hidden, self.shown],
+            (By.XPATH, '//item'): [self.hidden, self.shown],
+            (By.CSS_SELECTOR, '.hidden'): [self.hidden],
+        }, script_handler=filter_displayed)
+        self.dw = WebDriverWrapper(self.driver, find_attempts=0)
+
+    def test_css_filter_runs_in_one_script(self):
+        """Test that a css find excluding invisible elements queries and filters in a single script"""
+        self.assertIs(self.shown, self.dw.find('.item', exclude_invisible=True).element)
+        self.assertEqual(['execute_script'], [command[0] for command in self.driver.commands])
+
+    def test_non_css_filter_finds_then_filters(self):
+        """Test that non-css locators are found normally, then filtered with one script for the whole list"""
+        elements = self.dw.find('xpath=//item', find_all=True, exclude_invisible=True)
+        self.assertEqual([self.shown], [e.element for e in elements])
+        self.assertEqual(['find_elements', 'execute_script'], [command[0] for command in self.driver.commands])
+
+    def test_error_names_filters(self):
+        """Test that the error explains elements were found but filtered out"""
+        with self.assertRaises(WebDriverWrapperException) as context:
+            self.dw.find('.hidden', exclude_invisible=True)
+        self.assertIn('none were visible', str(context.exception))
@@ -0,0 +1,48 @@
+import unittest
+from selenium.webdriver.common.by import By
+from coyote_framework.tests.webdriverwrapper.fakedriver import FakeDriver, FakeElement
+from coyote_framework.webdriver.webdriverwrapper.WebDriverWrapper import WebDriverWrapper
+from coyote_framework.webdriver.webdriverwrapper.WebElementWrapper import WebElementWrapper, WebElementWrapperList
+
+__author__ = 'justin@shapeways.com'
+
+
+class TestWebElementWrapperList(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [FakeElement('row{}'.format(i)) for i in range(1000)]
+        self.driver = FakeDriver({(By.CSS_SELECTOR, 'tr'): self.rows})
+        self.dw = WebDriverWrapper(self.driver, find_attempts=0)
+
+    def test_elements_are_wrapped_on_access(self):
+        """Test that find_all wraps only the elements that are accessed, and wraps each one once"""
+        rows = self.dw.find_all('tr')
+
+        self.assertIsInstance(rows, WebElementWrapperList)
+        self.assertEqual(1000, len(rows))
+        self.assertEqual(0, sum(1 for wrapper in rows._wrapped if wrapper is not None))
+
+        self.assertIs(self.rows[5], rows[5].element)
+        self.assertIs(rows[5], rows[5])
+        self.assertEqual(1, sum(1 for wrapper in rows._wrapped if wrapper is not None))
+
+    def test_slicing_is_lazy(self):
+        """Test that slices are lazy lists over the same elements"""
+        rows = self.dw.find_all('tr')
+        first = rows[:3]
+
+        self.assertIsInstance(first, WebElementWrapperList)
+        self.assertEqual(self.rows[:3], [row.element for row in first])
+        self.assertEqual(self.rows[-2:], rows[-2:].elements)
+        self.assertEqual(0, sum(1 for wrapper in rows._wrapped if wrapper is not None))
+
+    def test_list_behaviour(self):
+        """Test that the lazy list can still be used like the list find_all used to return"""
+        rows = self.dw.find_all('tr')[:2]
+        extra = WebElementWrapper(self.dw, 'tr', FakeElement('extra'))
+        rows.append(extra)
+
+        self.assertEqual(['row0', 'row1', 'extra'], [row.element.name for row in rows])
+        self.assertEqual(rows, list(rows))
+        self.assertIsInstance(list(rows), list)
+        self.assertEqual([], self.dw.find_all('.missing'))
@@ -0,0 +1,93 @@
+"""
+In-memory stand-ins for selenium WebDriver and WebElement, used to test WebDriverWrapper without a browser
+"""
+from selenium.common.exceptions import NoSuchElementException
+
+__author__ = 'justin@shapeways.com'
+
+
+class FakeElement(object):
+
+    def __init__(self, name, displayed=True, text=''):
+        self.name = name
+        self.displayed = displayed
+        self.text = text
+        self.children = {}
+        self.clicks = 0
+
+    def __repr__(self):
+        return 'FakeElement({})'.format(self.name)
+
+    def is_displayed(self):
+        return self.displayed
+
+    def click(self):
+        self.clicks += 1
+
+    def find_elements(self, by, value):
+        return list(self.children.get((by, value), []))
+
+    def find_element(self, by, value):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException('No element for {}={}'.format(by, value))
+        return elements[0]
+
+
+class FakeDriver(FakeElement):
+    """Fake driver whose DOM is a dictionary of (By, value) to lists of FakeElements
+
+    Every call that would be a WebDriver round trip is appended to `commands`
+    """
+
+    class command_executor(object):
+        _url = 'http://fake-webdriver'
+
+    title = 'Fake Page'
+    current_url = 'about:blank'
+
+    def __init__(self, elements=None, script_handler=None):
+        super(FakeDriver, self).__init__('driver')
+        self.children = elements if elements is not None else {}
+        self.script_handler = script_handler
+        self.commands = []
+        self.implicit_waits = []
+
+    def find_elements(self, by, value):
+        self.commands.append(('find_elements', by, value))
+        return super(FakeDriver, self).find_elements(by, value)
+
+    def execute_script(self, script, *args):
+        self.commands.append(('execute_script', args))
+        if self.script_handler is not None:
+            return self.script_handler(script, *args)
+
+    def get(self, url):
+        self.commands.append(('get', url))
+
+    window_handles = ['main']
+    current_window_handle = 'main'
+
+    def switch_to_window(self, window_name):
+        self.commands.append(('switch_to_window', window_name))
+
+    def close(self):
+        self.commands.append(('close',))
+
+    def delete_all_cookies(self):
+        self.commands.append(('delete_all_cookies',))
+
+    def quit(self):
+        self.commands.append(('quit',))
+
+    def switch_to_frame(self, frame):
+        self.commands.append(('switch_to_frame', frame))
+
+    def switch_to_default_content(self):
+        self.commands.append(('switch_to_default_content',))
+
+    def implicitly_wait(self, seconds):
+        self.implicit_waits.append(seconds)
+
+    def set_page_load_timeout(self, seconds):
+        pass
@@ -1,7 +1,26 @@
 from multiprocessing import Process, Queue
+from Queue import Empty
+from collections import deque
+import Queue as thread_queue
+import cPickle
+import itertools
+import os
+import threading
+import time
+import traceback
 import warnings
 
 
+PROCESS = 'process'
+THREAD = 'thread'
+
+# Seconds between checks for timed out tasks and dead workers while waiting for results
+POLL_INTERVAL = 0.1
+
+# Most workers run_parallel starts when it is not given a number of workers
+MAX_WORKERS = 32
+
+
 class ErrorInProcessException(RuntimeError):
     """Exception raised when one or more parallel processes raises an exception"""
 
@@ -14,7 +33,318 @@ class ErrorInProcessException(RuntimeError):
         return '{}({}, {})'.format(self.__class__.__name__, self.message, self.errors)
 
 
-def run_parallel(*functions):
+class TaskTimeoutError(RuntimeError):
+    """Raised (within an ErrorInProcessException) for a function that did not finish within its timeout"""
+
+
+class WorkerDiedError(RuntimeError):
+    """Raised (within an ErrorInProcessException) for a function whose worker process exited without a result"""
+
+
+def _picklable(value):
+    try:
+        cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+        return True
+    except Exception:
+        return False
+
+
+def _work(tasks, results, functions, worker_id=None, pickle_results=True):
+    """Worker loop: runs the tasks of its own queue until it gets None. A task is (call, index, function), where a
+    function of None means the function at that index of the functions the worker was started with, and call
+    identifies the pool call the task belongs to. Each result is sent as (worker id, call, index, succeeded, value);
+    failures are sent with their formatted traceback attached to the exception. Process workers are identified by
+    their pid
+    """
+    worker_id = worker_id or os.getpid()
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        call, index, function = task
+        try:
+            value = (function or functions[index])()
+            succeeded = True
+            if pickle_results and not _picklable(value):
+                value = TypeError('Result of parallel function {} could not be pickled: {!r}'.format(index, value))
+                succeeded = False
+        except Exception, e:  # Swallow errors or else the process will hang
+            warnings.warn('Exception raised in parallel threads: {}'.format(e))
+            value, succeeded = e, False
+            formatted = traceback.format_exc()
+            if pickle_results and not _picklable(value):
+                value = RuntimeError(repr(e))
+            value.traceback = formatted
+        results.put((worker_id, call, index, succeeded, value))
+
+
+class ParallelPool(object):
+    """Pool of worker processes that can be reused for many parallel calls
+
+        >>> with ParallelPool(workers=4, timeout=60) as pool:
+        >>>     users = pool.run(create_user, create_user)
+        >>>     for index, order in pool.iter_results(*order_functions):
+        >>>         print index, order
+
+    Functions given to a pool after its workers started are pickled, so they must be importable (module level
+    functions, not lambdas or closures), and a function that can not be pickled fails with a TypeError; run_parallel
+    has no such limit, as it forks its workers after the functions exist. Each worker has its own task queue, and the pool only hands a task to an idle worker, so it always knows
+    which task a worker is running, even if the worker dies before saying anything
+    """
+    _pickles_tasks = True  # tasks go through a multiprocessing queue, whose feeder thread only prints pickling errors
+
+    def __init__(self, workers=4, timeout=None, functions=()):
+        """
+        @type workers: int
+        @param workers: Number of worker processes
+        @type timeout: float
+        @param timeout: Seconds each function may run before its worker is killed (and replaced), or None
+        @param functions: Functions the workers are forked with; tasks for these are sent by index, not pickled
+        """
+        if workers < 1:
+            raise ValueError('A parallel pool needs at least 1 worker, was {}'.format(workers))
+        self.workers = workers
+        self.timeout = timeout
+        self.functions = list(functions)
+        self.handles = []  # the worker processes (or threads), each with its worker_id and its own tasks queue
+        self._results = None
+        self._assigned = {}  # worker id to the (call, index) of the task it runs, and when the task was handed to it
+        self._calls = itertools.count(1)  # ids of iter_results calls, so results of earlier calls are never taken
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _new_queue(self):
+        return Queue()
+
+    def _start_worker(self):
+        tasks = self._new_queue()
+        process = Process(target=_work, args=(tasks, self._results, self.functions))
+        process.daemon = True
+        process.start()
+        process.worker_id = process.pid
+        process.tasks = tasks
+        self.handles.append(process)
+        return process
+
+    def _stop_worker(self, worker_id):
+        for process in self.handles:
+            if process.worker_id == worker_id:
+                process.terminate()
+                process.join()
+
+    def _ensure_workers(self):
+        if self._results is None:
+            self._results = self._new_queue()
+        self.handles = [handle for handle in self.handles if handle.is_alive()]
+        while len(self.handles) < self.workers:
+            self._start_worker()
+
+    def _dispatch(self, backlog):
+        """Hands the next tasks of the backlog to the idle workers"""
+        for handle in self.handles:
+            if not backlog:
+                return
+            if handle.worker_id not in self._assigned:
+                task = backlog.popleft()
+                self._assigned[handle.worker_id] = (task[:2], time.time())
+                handle.tasks.put(task)
+
+    def iter_results(self, *functions):
+        """Runs functions on the workers, yielding (index, result) as each one completes. Results are read as they
+        arrive, so large results never block the workers
+
+        @param functions: The functions to run; None runs the function at that index of the pool's own functions
+        @raise: ErrorInProcessException once every function finished, if any of them raised or timed out
+        """
+        self._ensure_workers()
+        call = next(self._calls)
+        pending = set(range(len(functions)))
+        backlog = deque()
+        errors = []
+        for index, function in enumerate(functions):
+            if function is not None and index < len(self.functions) and function is self.functions[index]:
+                function = None  # the workers have it already
+            if function is not None and self._pickles_tasks and not _picklable(function):
+                errors.append(TypeError('Parallel function {} could not be pickled; give the pool importable '
+                                        'functions: {!r}'.format(index, function)))
+                pending.discard(index)
+                continue
+            backlog.append((call, index, function))
+
+        try:
+            self._dispatch(backlog)
+            while pending:
+                try:
+                    worker_id, result_call, index, succeeded, value = self._results.get(timeout=POLL_INTERVAL)
+                except Empty:
+                    self._check_workers(pending, errors)
+                    self._dispatch(backlog)
+                    continue
+
+                if self._assigned.get(worker_id, (None,))[0] != (result_call, index):
+                    # a late result of a task that already timed out, possibly in an earlier call on this pool
+                    continue
+                del self._assigned[worker_id]
+                pending.discard(index)
+                self._dispatch(backlog)
+                if succeeded:
+                    yield index, value
+                else:
+                    errors.append(value)
+        except GeneratorExit:
+            # the caller stopped reading; workers still busy with abandoned tasks are replaced
+            self.close()
+            raise
+
+        if errors:
+            raise ErrorInProcessException('Exceptions raised in parallel threads: {}'.format(
+                ['{!r}\n{}'.format(error, getattr(error, 'traceback', '')) for error in errors]), errors=errors)
+
+    def _check_workers(self, pending, errors):
+        """Kills the workers of timed out tasks, and replaces dead workers; the tasks they were running fail"""
+        now = time.time()
+        replace = False
+        for worker_id, ((_, index), start) in self._assigned.items():
+            if self.timeout is not None and now - start > self.timeout:
+                errors.append(TaskTimeoutError('Parallel function {} did not finish within {} seconds'.format(
+                    index, self.timeout)))
+                pending.discard(index)
+                del self._assigned[worker_id]
+                self._stop_worker(worker_id)
+                replace = True
+
+        for handle in self.handles:
+            if not handle.is_alive():
+                replace = True
+                if handle.worker_id in self._assigned:
+                    (_, index), _ = self._assigned.pop(handle.worker_id)
+                    errors.append(WorkerDiedError(
+                        'Worker running parallel function {} exited without a result'.format(index)))
+                    pending.discard(index)
+        if replace:
+            self._ensure_workers()
+
+    def run(self, *functions):
+        """Runs functions on the workers
+
+        @return: List of results for those functions, in the order of the functions
+        @raise: ErrorInProcessException
+        """
+        results = [None] * len(functions)
+        for index, result in self.iter_results(*functions):
+            results[index] = result
+        return results
+
+    def close(self):
+        """Stops the workers: idle workers exit, and workers still running a task after a second are killed"""
+        if self._results is None:
+            return
+        for handle in self.handles:
+            handle.tasks.put(None)
+        for handle in self.handles:
+            handle.join(1)
+        self.terminate()
+
+    def terminate(self):
+        """Kills the workers, and drops their queues"""
+        for process in self.handles:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        self.handles = []
+        self._results = None
+        self._assigned = {}
+
+
+class ParallelThreadPool(ParallelPool):
+    """Pool of worker threads, for I/O bound functions (HTTP requests, database queries): nothing is forked or
+    pickled, so any function can be given to it at any time
+
+        >>> with ParallelThreadPool(workers=8) as pool:
+        >>>     responses = pool.run(lambda: driver.get(url1), lambda: driver.get(url2))
+
+    Threads can not be killed: a function that times out is failed and left to finish in the background, and its
+    thread is replaced and exits once the function returns
+    """
+    _pickles_tasks = False
+
+    def __init__(self, workers=4, timeout=None, functions=()):
+        super(ParallelThreadPool, self).__init__(workers=workers, timeout=timeout, functions=functions)
+        self._worker_ids = itertools.count(1)
+
+    def _new_queue(self):
+        return thread_queue.Queue()
+
+    def _start_worker(self):
+        worker_id = next(self._worker_ids)
+        tasks = self._new_queue()
+        thread = threading.Thread(
+            target=_work,
+            args=(tasks, self._results, self.functions),
+            kwargs={'worker_id': worker_id, 'pickle_results': False},
+            name='parallel-worker-{}'.format(worker_id)
+        )
+        thread.worker_id = worker_id
+        thread.tasks = tasks
+        thread.daemon = True
+        thread.start()
+        self.handles.append(thread)
+        return thread
+
+    def _stop_worker(self, worker_id):
+        # the thread gets no more tasks, and exits once its current function returns
+        for thread in self.handles:
+            if thread.worker_id == worker_id:
+                thread.tasks.put(None)
+        self.handles = [thread for thread in self.handles if thread.worker_id != worker_id]
+
+    def terminate(self):
+        """Retires the workers (they exit after their current function), and drops their queues"""
+        for thread in self.handles:
+            thread.tasks.put(None)
+        self.handles = []
+        self._results = None
+        self._assigned = {}
+
+
+EXECUTORS = {
+    PROCESS: ParallelPool,
+    THREAD: ParallelThreadPool,
+}
+
+
+def iter_parallel(*functions, **kwargs):
+    """Runs a series of functions in parallel, yielding (index, result) as each one completes, fastest first
+
+        >>> for index, result in iter_parallel(fn1, fn2, workers=2):
+        >>>     print index, result
+
+    @param functions: The functions to run specified as individual arguments
+    @param executor: PROCESS (the default) or THREAD
+    @param workers: Maximum number of functions running at once; defaults to one per function, up to MAX_WORKERS
+    @param timeout: Seconds each function may run before it is killed (or abandoned, for threads), or None
+    @raise: ErrorInProcessException once every function finished, if any of them raised or timed out
+    """
+    executor = kwargs.get('executor', PROCESS)
+    if executor not in EXECUTORS:
+        raise ValueError('Unknown executor "{}"; use one of {}'.format(executor, sorted(EXECUTORS)))
+    workers = kwargs.get('workers') or min(len(functions), MAX_WORKERS)
+    if not functions:
+        return
+    pool = EXECUTORS[executor](workers=min(workers, len(functions)), timeout=kwargs.get('timeout'),
+                               functions=functions)
+    try:
+        for index, result in pool.iter_results(*([None] * len(functions))):
+            yield index, result
+    finally:
+        pool.close()
+
+
+def run_parallel(*functions, **kwargs):
     """Runs a series of functions in parallel. Return values are ordered by the order in which their functions
     were passed.
 
@@ -23,9 +353,20 @@ def run_parallel(*functions):
         >>>     lambda: 0
         >>> )
 
+    The functions run in worker processes forked after they exist, so lambdas and closures work. By default there is
+    one worker per function (up to MAX_WORKERS); pass workers to bound the number of functions running at once (each
+    worker then runs several functions), and timeout to kill functions that run for too long:
+
+        >>> results = run_parallel(*functions, workers=4, timeout=60)
+
+    I/O bound functions (HTTP requests, database queries) can run on threads instead, which saves forking a process
+    per worker and pickling the results:
+
+        >>> responses = run_parallel(*requests, executor=THREAD, workers=8)
+
     If an exception is raised within one of the processes, that exception will be caught at the process
     level and raised by the parent process as an ErrorInProcessException, which will track all errors raised in all
-    processes.
+    processes. Each error carries the formatted traceback from its process as its traceback attribute.
 
     You can catch the exception raised for more details into the process exceptions:
 
@@ -35,6 +376,9 @@ def run_parallel(*functions):
         >>>     print.e.errors
 
     @param functions: The functions to run specified as individual arguments
+    @param executor: PROCESS (the default) or THREAD
+    @param workers: Maximum number of functions running at once; defaults to one per function, up to MAX_WORKERS
+    @param timeout: Seconds each function may run before it is killed (or abandoned, for threads), or None
     @return: List of results for those functions. Unpacking is recommended if you do not need to iterate over the
     results as it enforces the number of functions you pass in.
 
@@ -43,34 +387,7 @@ def run_parallel(*functions):
 
     @raise: ErrorInProcessException
     """
-    def target(fn):
-        def wrapped(results_queue, error_queue, index):
-            result = None
-            try:
-                result = fn()
-            except Exception, e:  # Swallow errors or else the process will hang
-                error_queue.put(e)
-                warnings.warn('Exception raised in parallel threads: {}'.format(e))
-            results_queue.put((index, result))
-        return wrapped
-
-    errors = Queue()
-    queue = Queue()
-
-    jobs = list()
-    for i, function in enumerate(functions):
-        jobs.append(Process(target=target(function), args=(queue, errors, i)))
-
-    [job.start() for job in jobs]
-    [job.join() for job in jobs]
-
-    # Get the results in the queue and put them back in the order in which the function was specified in the args
-    results = [queue.get() for _ in jobs]
-    results = sorted(results, key=lambda x: x[0])
-
-    if not errors.empty():
-        error_list = list()
-        while not errors.empty():
-            error_list.append(errors.get())
-        raise ErrorInProcessException('Exceptions raised in parallel threads: {}'.format(error_list), errors=error_list)
-    return [r[1] for r in results]
\ No newline at end of file
+    results = [None] * len(functions)
+    for index, result in iter_parallel(*functions, **kwargs):
+        results[index] = result
+    return results
@@ -1,5 +1,20 @@
+from collections import Mapping
+
 from selenium.webdriver import DesiredCapabilities
 
+# Browser names (as in driverfactory) to their DesiredCapabilities entry
+DESIRED_CAPABILITIES = {
+    'firefox': 'FIREFOX',
+    'chrome': 'CHROME',
+    'chrome_headless': 'CHROME',
+    'ie': 'INTERNETEXPLORER',
+    'opera': 'OPERA',
+    'phantomjs': 'PHANTOMJS',
+    'safari': 'SAFARI',
+}
+
+_capabilities_cache = {}
+
 
 def copy_and_update(dictionary, update):
     """Returns an updated copy of the dictionary without modifying the original"""
@@ -20,56 +35,48 @@ class Capabilities(dict):
         return self
 
 
+class LazyCapabilities(Mapping):
+    """Capabilities of one browser keyed by version, built on first use and cached
+
+    @param base: name of the DesiredCapabilities entry the versions are built from
+    @param versions: version to the settings added to the base
+    """
+    def __init__(self, base, versions):
+        self.base = base
+        self.versions = versions
+        self._built = {}
+
+    def __getitem__(self, version):
+        capabilities = self._built.get(version)
+        if capabilities is None:
+            capabilities = copy_and_update(getattr(DesiredCapabilities, self.base), self.versions[version])
+            self._built[version] = capabilities
+        return capabilities
+
+    def __iter__(self):
+        return iter(self.versions)
+
+    def __len__(self):
+        return len(self.versions)
+
+
+def versions(*names):
+    return dict((name, {'version': name}) for name in names)
+
+
 class Browser():
 
-    FIREFOX = {
-        '23':   copy_and_update(DesiredCapabilities.FIREFOX, {'version': '23'}),
-        '22':   copy_and_update(DesiredCapabilities.FIREFOX, {'version': '22'}),
-        '21':   copy_and_update(DesiredCapabilities.FIREFOX, {'version': '21'}),
-        '20':   copy_and_update(DesiredCapabilities.FIREFOX, {'version': '20'}),
-        '19':   copy_and_update(DesiredCapabilities.FIREFOX, {'version': '19'}),
-        '18':   copy_and_update(DesiredCapabilities.FIREFOX, {'version': '18'}),
-        '17':   copy_and_update(DesiredCapabilities.FIREFOX, {'version': '17'}),
-        '16':   copy_and_update(DesiredCapabilities.FIREFOX, {'version': '16'}),
-        '15':   copy_and_update(DesiredCapabilities.FIREFOX, {'version': '15'}),
-        '14':   copy_and_update(DesiredCapabilities.FIREFOX, {'version': '14'}),
-        '13':   copy_and_update(DesiredCapabilities.FIREFOX, {'version': '13'}),
-        '12':   copy_and_update(DesiredCapabilities.FIREFOX, {'version': '12'}),
-        '11':   copy_and_update(DesiredCapabilities.FIREFOX, {'version': '11'}),
-        '10':   copy_and_update(DesiredCapabilities.FIREFOX, {'version': '10'}),
-        '9':    copy_and_update(DesiredCapabilities.FIREFOX, {'version': '9'}),
-        '8':    copy_and_update(DesiredCapabilities.FIREFOX, {'version': '8'}),
-        '7':    copy_and_update(DesiredCapabilities.FIREFOX, {'version': '7'}),
-        '6':    copy_and_update(DesiredCapabilities.FIREFOX, {'version': '6'}),
-        '5':    copy_and_update(DesiredCapabilities.FIREFOX, {'version': '5'}),
-        '4':    copy_and_update(DesiredCapabilities.FIREFOX, {'version': '4'}),
-        '3.6':  copy_and_update(DesiredCapabilities.FIREFOX, {'version': '3.6'}),
-        '3.5':  copy_and_update(DesiredCapabilities.FIREFOX, {'version': '3.5'}),
-        '3.0':  copy_and_update(DesiredCapabilities.FIREFOX, {'version': '3.0'})
-    }
+    FIREFOX = LazyCapabilities('FIREFOX', versions(
+        '23', '22', '21', '20', '19', '18', '17', '16', '15', '14', '13', '12', '11', '10', '9', '8', '7', '6', '5',
+        '4', '3.6', '3.5', '3.0'))
 
-    IE = {
-        '10': copy_and_update(DesiredCapabilities.INTERNETEXPLORER, {'version': '10'}),
-        '9':  copy_and_update(DesiredCapabilities.INTERNETEXPLORER, {'version': '9'}),
-        '8':  copy_and_update(DesiredCapabilities.INTERNETEXPLORER, {'version': '8'}),
-        '7':  copy_and_update(DesiredCapabilities.INTERNETEXPLORER, {'version': '7'}),
-        '6':  copy_and_update(DesiredCapabilities.INTERNETEXPLORER, {'version': '6'})
-    }
+    IE = LazyCapabilities('INTERNETEXPLORER', versions('10', '9', '8', '7', '6'))
 
-    CHROME = {
-        '28': copy_and_update(DesiredCapabilities.CHROME, {'version': '28'}),
-        '27': copy_and_update(DesiredCapabilities.CHROME, {'version': '27'})
-    }
+    CHROME = LazyCapabilities('CHROME', versions('28', '27'))
 
-    OPERA = {
-        '12': copy_and_update(DesiredCapabilities.OPERA, {'version': '12'}),
-        '11': copy_and_update(DesiredCapabilities.OPERA, {'version': '11'})
-    }
+    OPERA = LazyCapabilities('OPERA', versions('12', '11'))
 
-    SAFARI = {
-        '6': copy_and_update(DesiredCapabilities.SAFARI, {'version': '6'}),
-        '5': copy_and_update(DesiredCapabilities.SAFARI, {'version': '5'})
-    }
+    SAFARI = LazyCapabilities('SAFARI', versions('6', '5'))
 
 
 class Platform():
@@ -92,19 +99,9 @@ class Platform():
         '4':   {'platform': 'OSX 10.8', 'version': '4'}
     }
 
-    IPHONE = {
-        '6':   copy_and_update(DesiredCapabilities.IPHONE, IOS['6']),
-        '5.1': copy_and_update(DesiredCapabilities.IPHONE, IOS['5.1']),
-        '5.0': copy_and_update(DesiredCapabilities.IPHONE, IOS['5.0']),
-        '4':   copy_and_update(DesiredCapabilities.IPHONE, IOS['4'])
-    }
+    IPHONE = LazyCapabilities('IPHONE', IOS)
 
-    IPAD = {
-        '6':   copy_and_update(DesiredCapabilities.IPAD, IOS['6']),
-        '5.1': copy_and_update(DesiredCapabilities.IPAD, IOS['5.1']),
-        '5.0': copy_and_update(DesiredCapabilities.IPAD, IOS['5.0']),
-        '4':   copy_and_update(DesiredCapabilities.IPAD, IOS['4'])
-    }
+    IPAD = LazyCapabilities('IPAD', IOS)
 
     ANDROID = {
         '4.0': {'platform': 'Linux', 'version': '4.0'}
@@ -113,3 +110,26 @@ class Platform():
     ANROID_TABLET = {
         '4.0': copy_and_update(ANDROID['4.0'], {'device-type': 'tablet'})
     }
+
+
+def get_capabilities(browser_name, version=None, **settings):
+    """Gets the capabilities of a browser; the base capabilities are built once and cached, and each call returns a
+    copy that is safe to modify
+
+    >>> get_capabilities('firefox', unexpectedAlertBehaviour='ignore')
+
+    @type browser_name: str
+    @param browser_name: name of the browser, as in driverfactory
+    @type version: str
+    @param version: browser version to request, if any
+    @param settings: more capabilities to set
+    @rtype: Capabilities
+    """
+    key = (browser_name, version)
+    capabilities = _capabilities_cache.get(key)
+    if capabilities is None:
+        capabilities = dict(getattr(DesiredCapabilities, DESIRED_CAPABILITIES[browser_name]))
+        if version is not None:
+            capabilities['version'] = version
+        _capabilities_cache[key] = capabilities
+    return Capabilities(capabilities, settings)
@@ -4,36 +4,98 @@ from selenium import webdriver
 
 FIREFOX = 'firefox'
 CHROME = 'chrome'
+CHROME_HEADLESS = 'chrome_headless'
 IE = 'ie'
 OPERA = 'opera'
 REMOTE = 'remote'
 PHANTOMJS = 'phantomjs'
 
+# Backends that run without a display, so no virtual display has to be started for them. There is no native headless
+# Firefox backend: -headless needs Firefox 56+, which the legacy extension driver of selenium 2.x cannot drive, so
+# headless Firefox runs on a virtual display
+HEADLESS_BACKENDS = set([CHROME_HEADLESS, PHANTOMJS])
+
 
 class DriverFactory(object):
+    """
+    Creates WebDriver instances through a registry of backends, keyed by browser name
+
+        >>> driver = DriverFactory().new_driver(browser_name=CHROME_HEADLESS)
+
+    Backends are functions taking the driver's arguments and returning the driver; more can be added with
+    DriverFactory.register(name, backend)
+    """
+    backends = {}
+
+    @classmethod
+    def register(cls, browser_name, backend=None):
+        """Registers a backend for a browser name, replacing any previous one; usable as a decorator
+
+        @type browser_name: str
+        @type backend: types.FunctionType
+        @param backend: called with the arguments of new_driver, returns the driver
+        """
+        if backend is None:
+            return lambda function: cls.register(browser_name, function)
+        cls.backends[browser_name] = backend
+        return backend
+
+    @classmethod
+    def new_driver(cls, browser_name, *args, **kwargs):
+        """Instantiates a new WebDriver instance from the backend registered for the browser name; unknown names
+        are sent to the remote backend
+        """
+        backend = cls.backends.get(browser_name, cls.backends[REMOTE])
+        return backend(*args, **kwargs)
 
     @staticmethod
-    def new_driver(browser_name, *args, **kwargs):
-        """Instantiates a new WebDriver instance, determining class by environment variables
+    def is_headless(browser_name):
+        """
+        @rtype: bool
+        @return: True if the browser runs without a display
         """
-        if browser_name == FIREFOX:
-            return webdriver.Firefox(*args, **kwargs)
-
-        # elif options['local'] and options['browser_name'] == CHROME:
-        #     return webdriver.Chrome(*args, **kwargs)
-        #
-        # elif options['local'] and options['browser_name'] == IE:
-        #     return webdriver.Ie(*args, **kwargs)
-        #
-        # elif options['local'] and options['browser_name'] == OPERA:
-        #     return webdriver.Opera(*args, **kwargs)
-
-        elif browser_name == PHANTOMJS:
-            executable_path = os.path.join(os.path.dirname(__file__), 'phantomjs/executable/phantomjs_64bit')
-            driver = webdriver.PhantomJS(executable_path=executable_path, **kwargs)
-            driver.set_window_size(1280, 800)  # Set a default because phantom needs it
-            return driver
-
-        else:  # remote
-            driver = webdriver.Remote(*args, **kwargs)
-            return driver
\ No newline at end of file
+        return browser_name in HEADLESS_BACKENDS
+
+
+@DriverFactory.register(FIREFOX)
+def new_firefox(*args, **kwargs):
+    return webdriver.Firefox(*args, **kwargs)
+
+
+@DriverFactory.register(CHROME)
+def new_chrome(*args, **kwargs):
+    return webdriver.Chrome(*args, **kwargs)
+
+
+@DriverFactory.register(CHROME_HEADLESS)
+def new_headless_chrome(*args, **kwargs):
+    """Chrome in its native headless mode (Chrome 59+); takes an extra window_size keyword, defaulting to 1280x1024"""
+    chrome_options = kwargs.pop('chrome_options', None) or webdriver.ChromeOptions()
+    window_size = kwargs.pop('window_size', (1280, 1024))
+    chrome_options.add_argument('--headless')
+    chrome_options.add_argument('--disable-gpu')
+    chrome_options.add_argument('--window-size={},{}'.format(*window_size))
+    return webdriver.Chrome(chrome_options=chrome_options, *args, **kwargs)
+
+
+@DriverFactory.register(IE)
+def new_ie(*args, **kwargs):
+    return webdriver.Ie(*args, **kwargs)
+
+
+@DriverFactory.register(OPERA)
+def new_opera(*args, **kwargs):
+    return webdriver.Opera(*args, **kwargs)
+
+
+@DriverFactory.register(PHANTOMJS)
+def new_phantomjs(*args, **kwargs):
+    executable_path = os.path.join(os.path.dirname(__file__), 'phantomjs/executable/phantomjs_64bit')
+    driver = webdriver.PhantomJS(executable_path=executable_path, **kwargs)
+    driver.set_window_size(1280, 800)  # Set a default because phantom needs it
+    return driver
+
+
+@DriverFactory.register(REMOTE)
+def new_remote(*args, **kwargs):
+    return webdriver.Remote(*args, **kwargs)
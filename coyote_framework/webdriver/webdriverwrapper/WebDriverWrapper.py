@@ -8,9 +8,15 @@ import httplib
 import logging
 import signal
 import os
+import sys
+import threading
+import time
+import re
+from contextlib import contextmanager
 from urlparse import urlparse, urljoin
 
-from selenium.common.exceptions import TimeoutException, NoAlertPresentException, UnexpectedAlertPresentException
+from selenium.common.exceptions import TimeoutException, NoAlertPresentException, UnexpectedAlertPresentException, \
+    StaleElementReferenceException, NoSuchFrameException
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
@@ -21,6 +27,10 @@ from coyote_framework.webdriver.webdriverwrapper.support import LocatorHandler a
 from coyote_framework.webdriver.webdriverwrapper.support.locator import Locator
 from coyote_framework.webdriver.webdriverwrapper.support import WebDriverWrapperAssertion as Assertion
 from coyote_framework.webdriver.webdriverwrapper.support import JavascriptExecutor as JE
+from coyote_framework.webdriver.webdriverwrapper.support.ElementCache import ElementCache, DEFAULT_PROBE_INTERVAL
+from coyote_framework.webdriver.webdriverwrapper.support import ElementSnapshot
+from coyote_framework.webdriver.webdriverwrapper.support import ActionCallbacks
+from coyote_framework.webdriver.webdriverwrapper.support.BrowserLog import BrowserLogBuffer, EVICT_OLDEST
 
 
 BROWSER_LOG_LEVEL_INFO = u'INFO'
@@ -89,16 +99,32 @@ class WebDriverWrapper(object):
         self.maximize_window = options['maximize_window'] if 'maximize_window' in options else False
         self.page_load_timeout = options['page_load_timeout'] if 'page_load_timeout' in options else self.timeout
         self.ignore_page_load_timeouts = options['ignore_page_load_timeouts'] if 'ignore_page_load_timeouts' in options else False
-        self.browser_logs = []
+        self.retry_policy = options.get('retry_policy')  # RetryPolicy used to poll for elements, if any
+        self.browser_logs = BrowserLogBuffer(maxlen=options.get('browser_log_size', 1000),
+                                             eviction=options.get('browser_log_eviction', EVICT_OLDEST))
         self.locator_handler = LH.LocatorHandler
         self.js_executor = JE.JavascriptExecutor(self)
         self.assertion = Assertion.WebDriverWrapperAssertion(self, self.timeout, self.implicit_wait)
 
-        self.action_callbacks = options.get('action_callbacks') or []  # Functions to call at the end of each action
+        # Opt-in cache of found elements, cleared on navigation and window/frame switches
+        self.element_cache = None
+        if options.get('use_element_cache'):
+            self.enable_element_cache(observe_mutations=options.get('observe_dom_mutations', True),
+                                      probe_interval=options.get('dom_probe_interval', DEFAULT_PROBE_INTERVAL))
+
+        self.action_callbacks = options.get('action_callbacks') or []  # Functions or ActionCallbacks to run
+        self.callback_pipeline = ActionCallbacks.ActionCallbackPipeline(self)  # decides when action_callbacks run
+        self.instrumentation = options.get('instrumentation')  # Instrumentation recording each action, if any
+
+        # Path of frame locators the driver is switched to (None if unknown), and the frame elements found on the way
+        self.current_frame_path = ()
+        self.frame_elements = {}
         self.paused = False
+        self.browser_implicit_wait = None  # implicit wait last sent to the driver
+        self.timing_lock = threading.RLock()  # held while timing() overrides the wait settings
 
-        # configure driver based on settings
-        self.driver.implicitly_wait(self.implicit_wait)
+        # configure driver based on settings; a retry policy does its own polling, so it needs no implicit wait
+        self.set_browser_implicit_wait(0 if self.retry_policy is not None else self.implicit_wait)
         self.driver.set_page_load_timeout(self.page_load_timeout)
         if self.maximize_window is True:
             self.driver.maximize_window()
@@ -109,7 +135,8 @@ class WebDriverWrapper(object):
         try:
             message += "timeout: " + str(self.timeout) + ", "
             message += "implicit_wait: " + str(self.implicit_wait) + ", "
-            message += "find_attempts: " + str(self.find_attempts) + " "
+            message += "find_attempts: " + str(self.find_attempts) + ", "
+            message += "retry_policy: " + str(self.retry_policy) + " "
         except Exception:
             message += ' -- (properties omitted)'
         finally:
@@ -123,6 +150,192 @@ class WebDriverWrapper(object):
         """
         return self.__str__()
 
+    def set_retry_policy(self, retry_policy):
+        """Sets the policy used to poll for elements; the driver's implicit wait is disabled while a policy is set,
+        and restored to the wrapper's implicit_wait when the policy is removed
+
+        @type retry_policy:     RetryPolicy
+        @param retry_policy:    The retry policy, or None to retry find_attempts times using the implicit wait
+        @return: None
+        """
+        self.retry_policy = retry_policy
+        self.set_browser_implicit_wait(0 if retry_policy is not None else self.implicit_wait)
+
+    def set_browser_implicit_wait(self, seconds):
+        """Sets the driver's implicit wait, skipping the WebDriver call if it is already set to that value
+
+        @type seconds:  int
+        @param seconds: implicit wait, in seconds
+        @return: None
+        """
+        if seconds != self.browser_implicit_wait:
+            self.driver.implicitly_wait(seconds)
+            self.browser_implicit_wait = seconds
+
+    @contextmanager
+    def timing(self, implicit_wait=None, find_attempts=None, timeout=None):
+        """Context that overrides the wait settings of the wrapper and the driver, restoring them on exit (even if the
+        block raised).  Contexts can be nested; the settings are shared by every thread using this wrapper, so other
+        threads entering timing() wait until the block is done
+
+        >>> with dw.timing(implicit_wait=0, find_attempts=1):
+        >>>     dw.find(locators.optional_banner)
+
+        @type implicit_wait:    int
+        @param implicit_wait:   implicit wait in seconds, or None to keep the current value
+        @type find_attempts:    int
+        @param find_attempts:   number of find retries, or None to keep the current value
+        @type timeout:          int
+        @param timeout:         timeout of the wait methods in seconds, or None to keep the current value
+        """
+        with self.timing_lock:
+            previous = (self.implicit_wait, self.find_attempts, self.timeout, self.browser_implicit_wait)
+            try:
+                if implicit_wait is not None:
+                    self.implicit_wait = implicit_wait
+                    if self.retry_policy is None:
+                        self.set_browser_implicit_wait(implicit_wait)
+                if find_attempts is not None:
+                    self.find_attempts = find_attempts
+                if timeout is not None:
+                    self.timeout = timeout
+
+                yield self
+
+            finally:
+                self.implicit_wait, self.find_attempts, self.timeout, browser_implicit_wait = previous
+                self.set_browser_implicit_wait(browser_implicit_wait)
+
+    def no_implicit_wait(self):
+        """Context in which the driver's implicit wait is zero; shorthand for timing(implicit_wait=0)
+
+        >>> with dw.no_implicit_wait():
+        >>>     dw.driver.find_elements_by_css_selector('.spinner')
+        """
+        return self.timing(implicit_wait=0)
+
+    def record_action(self, action, started, locator=None, retries=0, stale_recoveries=0, succeeded=True):
+        """Records an action with the instrumentation, if enabled
+
+        @type action:               str
+        @param action:              name of the action
+        @type started:              float
+        @param started:             time.time() when the action started
+        @param locator:             locator the action was performed on, if any
+        @type retries:              int
+        @param retries:             number of attempts after the first
+        @type stale_recoveries:     int
+        @param stale_recoveries:    number of times a stale element was found again
+        @type succeeded:            bool
+        @param succeeded:           False if the action raised
+        @return: None
+        """
+        if self.instrumentation is not None:
+            self.instrumentation.record(action, time.time() - started, locator, retries=retries,
+                                        stale_recoveries=stale_recoveries, succeeded=succeeded)
+
+    def iter_attempts(self):
+        """Iterates over the attempts allowed for finding an element: driven by the retry policy if one is set,
+        otherwise find_attempts retries under the driver's implicit wait
+
+        @rtype:     iterable
+        @return:    Attempt numbers, starting at 0
+        """
+        if self.retry_policy is not None:
+            return self.retry_policy.attempts()
+        return xrange(self.find_attempts + 1)
+
+    def enable_element_cache(self, observe_mutations=True, probe_interval=DEFAULT_PROBE_INTERVAL):
+        """Starts caching the elements found by find(), keyed by locator and search object
+
+        @type observe_mutations:    bool
+        @param observe_mutations:   If True, cache hits are checked (with one script execution) against a DOM mutation
+                                    observer; if False, the cache is only cleared on navigation and window/frame switches
+        @type probe_interval:       float
+        @param probe_interval:      Seconds a mutation check vouches for the cache, unless an element action or script
+                                    may have changed the page in the meantime; 0 (the default) checks on every find,
+                                    use more only on pages whose own scripts do not change them
+        @rtype:                     ElementCache
+        @return:                    The element cache, which exposes hit/miss counters through stats()
+        """
+        self.element_cache = ElementCache(self, observe_mutations=observe_mutations, probe_interval=probe_interval)
+        return self.element_cache
+
+    def disable_element_cache(self):
+        """Stops caching found elements
+
+        @return: None
+        """
+        self.element_cache = None
+
+    def invalidate_element_cache(self):
+        """Clears the element cache, if enabled; called whenever the current page or frame changes
+
+        @return: None
+        """
+        if self.element_cache is not None:
+            self.element_cache.clear()
+
+    def forget_frames(self, current_frame_path=None):
+        """Clears the cached frame elements; called whenever the current page or window changes
+
+        @type current_frame_path:   tuple
+        @param current_frame_path:  the frame path the driver is now in, or None if it is unknown
+        @return: None
+        """
+        self.frame_elements.clear()
+        self.current_frame_path = current_frame_path
+
+    def switch_to_frame_path(self, frames):
+        """Switches to a (nested) iframe given by a path of frame locators from the top document; does nothing if the
+        driver is already there, and only descends from the current frame when the path continues it.  Frame elements
+        are cached until the page changes
+
+        @type frames:   tuple
+        @param frames:  locators (or css strings) of the frames to switch through; () for the top document
+        @return: None
+        """
+        path = tuple(self.locator_handler.compile_locator(frame) for frame in frames)
+        if path == self.current_frame_path:
+            return
+
+        self.invalidate_element_cache()
+        try:
+            self._descend_frames(frames, path)
+        except (StaleElementReferenceException, NoSuchFrameException):
+            # A cached frame was reloaded or removed; find every frame again from the top
+            self.forget_frames()
+            self._descend_frames(frames, path)
+
+    def enter_frames(self, locator, search_object=None):
+        """Switches to the frame path of a locator, if it has one and is searched from the top of the page
+
+        @type locator:          webdriverwrapper.support.locator.Locator
+        @param locator:         the locator or css string about to be searched
+        @param search_object:   the WebDriver or WebElement the search starts from
+        @return: None
+        """
+        frames = getattr(locator, 'frames', None)
+        if frames is not None and (search_object is None or search_object is self.driver):
+            self.switch_to_frame_path(frames)
+
+    def _descend_frames(self, frames, path):
+        current = self.current_frame_path
+        if current is None or path[:len(current)] != current:
+            self.driver.switch_to_default_content()
+            current = self.current_frame_path = ()
+
+        for depth in xrange(len(current), len(path)):
+            key = path[:depth + 1]
+            frame_element = self.frame_elements.get(key)
+            if frame_element is None:
+                frame_element = self.locator_handler.find_by_locator(self.driver, frames[depth])
+                self.frame_elements[key] = frame_element
+            # the driver is in an unknown frame until the switch succeeds
+            self.current_frame_path = None
+            self.driver.switch_to_frame(frame_element)
+            self.current_frame_path = key
+
     def wrap_driver(self, driver):
         """
         @type driver webdriver
@@ -213,6 +426,8 @@ class WebDriverWrapper(object):
                 base_url = str(parsed_url.scheme) + '://' + str(parsed_url.netloc)
                 url = urljoin(base_url, path)
 
+            self.invalidate_element_cache()
+            self.forget_frames(())
             try:
                 return self.driver.get(url)
             except TimeoutException:
@@ -221,13 +436,18 @@ class WebDriverWrapper(object):
                 else:
                     raise PageTimeoutException.PageTimeoutException(self, url)
 
-        return self.execute_and_handle_webdriver_exceptions(lambda: _visit(url))
+        return self.execute_and_handle_webdriver_exceptions(
+            lambda: _visit(url), callback_event=ActionCallbacks.NAVIGATION)
 
     def back(self):
         """
         Navigate to the previous page
         """
-        return self.driver.back()
+        self.invalidate_element_cache()
+        self.forget_frames()
+        result = self.driver.back()
+        self.callback_pipeline.run(ActionCallbacks.NAVIGATION)
+        return result
 
     def close(self):
         """
@@ -239,13 +459,21 @@ class WebDriverWrapper(object):
         """
         Navigate forward
         """
-        return self.driver.forward()
+        self.invalidate_element_cache()
+        self.forget_frames()
+        result = self.driver.forward()
+        self.callback_pipeline.run(ActionCallbacks.NAVIGATION)
+        return result
 
     def refresh(self):
         """
         Refresh the current page
         """
-        return self.driver.refresh()
+        self.invalidate_element_cache()
+        self.forget_frames()
+        result = self.driver.refresh()
+        self.callback_pipeline.run(ActionCallbacks.NAVIGATION)
+        return result
 
     def switch_to_iframe(self, iframe):
         """
@@ -253,6 +481,8 @@ class WebDriverWrapper(object):
         @param iframe:  iframe to select
         @return:        driver w/ selected iframe
         """
+        self.invalidate_element_cache()
+        self.current_frame_path = None
         return self.driver.switch_to_frame(iframe.element)
 
     def is_alert_present(self):
@@ -289,6 +519,8 @@ class WebDriverWrapper(object):
         @param window_name: name of the window
         @return:            the new window handle
         """
+        self.invalidate_element_cache()
+        self.forget_frames()
         return self.driver.switch_to_window(window_name)
 
     def switch_to_default_content(self):
@@ -296,6 +528,8 @@ class WebDriverWrapper(object):
 
         @return: driver w/ default content
         """
+        self.invalidate_element_cache()
+        self.current_frame_path = ()
         return self.driver.switch_to_default_content()
 
     def current_window_handle(self):
@@ -315,76 +549,141 @@ class WebDriverWrapper(object):
     # WebDriver Finds
     #
 
-    def find(self, locator, find_all=False, search_object=None, force_find=False, exclude_invisible=False):
+    def find(self, locator, find_all=False, search_object=None, force_find=False, exclude_invisible=False,
+             exclude_disabled=False, exclude_offscreen=False):
         """
         Attempts to locate an element, trying the number of times specified by the driver wrapper;
         Will throw a WebDriverWrapperException if no element is found
 
-        @type locator:          webdriverwrapper.support.locator.Locator
-        @param locator:         the locator or css string used to query the element
-        @type find_all:         bool
-        @param find_all:        set to True to locate all located elements as a list
-        @type search_object:    webdriverwrapper.WebElementWrapper
-        @param force_find:      If true will use javascript to find elements
-        @type force_find:       bool
-        @param search_object:   A WebDriver or WebElement object to call find_element(s)_by_xxxxx
+        The exclude_* filters are evaluated in the browser with one script execution for all matched elements
+        (css locators are also queried by that same script)
+
+        @type locator:              webdriverwrapper.support.locator.Locator
+        @param locator:             the locator or css string used to query the element
+        @type find_all:             bool
+        @param find_all:            set to True to locate all located elements as a list
+        @type search_object:        webdriverwrapper.WebElementWrapper
+        @param force_find:          If true will use javascript to find elements
+        @type force_find:           bool
+        @param search_object:       A WebDriver or WebElement object to call find_element(s)_by_xxxxx
+        @type exclude_invisible:    bool
+        @param exclude_invisible:   If true, only elements that are displayed are found
+        @type exclude_disabled:     bool
+        @param exclude_disabled:    If true, only elements that are enabled are found
+        @type exclude_offscreen:    bool
+        @param exclude_offscreen:   If true, only elements within the viewport are found
         """
         search_object = self.driver if search_object is None else search_object
+        started = time.time() if self.instrumentation is not None else None
         attempts = 0
-
-        while attempts < self.find_attempts + 1:
-            if bool(force_find):
-                js_locator = self.locator_handler.parse_locator(locator)
-
-                if js_locator.By != 'css selector':
+        match_count = 0
+        elements = []
+        filters = (bool(exclude_invisible), bool(exclude_disabled), bool(exclude_offscreen))
+        strategy = self.locator_handler.parse_locator(locator)
+        shadow_roots = getattr(locator, 'shadow_roots', ())
+        filter_in_browser = (any(filters) and not force_find and self.element_cache is None and
+                             strategy.By == 'css selector' and not shadow_roots)
+        self.enter_frames(locator, search_object)
+
+        for attempts in self.iter_attempts():
+            if filter_in_browser:
+                elements, match_count = self._filter_displayed(strategy.value, search_object, filters)
+                if match_count == 0 and self.retry_policy is None:
+                    # Nothing matched yet; use a regular find so that the implicit wait still applies
+                    elements, match_count = self._filter_displayed(
+                        self.locator_handler.find_by_locator(search_object, locator, True), search_object, filters)
+            elif shadow_roots:
+                elements = self._find_in_shadow_roots(locator, search_object)
+            elif bool(force_find):
+                if strategy.By != 'css selector':
                     raise ValueError(
                         'You must use a css locator in order to force find an element; this was "{}"'.format(
-                            js_locator))
+                            strategy))
 
                 elements = self.js_executor.execute_template_and_return_result(
-                    'getElementsTemplate.js', variables={'selector': js_locator.value})
+                    'getElementsTemplate.js', variables={'selector': strategy.value})
+            elif self.element_cache is not None:
+                elements = self.element_cache.find(search_object, locator)
             else:
                 elements = self.locator_handler.find_by_locator(search_object, locator, True)
 
-            # Save original elements found before applying filters to the list
-            all_elements = elements
-
-            # Check for only visible elements
-            visible_elements = elements
-            if exclude_invisible:
-                visible_elements = [element for element in all_elements if element.is_displayed()]
-                elements = visible_elements
+            if not filter_in_browser:
+                # Save the number of elements found before applying filters to the list
+                match_count = len(elements)
+                if any(filters):
+                    elements, match_count = self._filter_displayed(elements, search_object, filters)
 
             if len(elements) > 0:
-                if find_all is True:
-                    # return list of wrapped elements
-                    for index in range(len(elements)):
-                        elements[index] = WebElementWrapper.WebElementWrapper(self, locator, elements[index],
-                                                                              search_object=search_object)
+                break
 
-                    return elements
+        if started is not None:
+            self.record_action('find', started, locator, retries=attempts,
+                               succeeded=len(elements) > 0 or find_all is True)
 
-                elif find_all is False:
-                    # return first element
-                    return WebElementWrapper.WebElementWrapper(self, locator, elements[0], search_object=search_object)
+        if find_all is True:
+            # return list of elements (possibly empty), wrapped as they are accessed
+            return WebElementWrapper.WebElementWrapperList(self, locator, elements, search_object)
+        elif len(elements) > 0:
+            # return first element
+            return WebElementWrapper.WebElementWrapper(self, locator, elements[0], search_object=search_object)
+        else:  # raise exception if attempting to find one element
+            error_message = "Unable to find element after {0} attempts with locator: {1}".format(
+                attempts + 1,
+                locator
+            )
 
-            else:
-                if attempts >= self.find_attempts:
-                    if find_all is True:  # returns an empty list if finding all elements
-                        return []
-                    else:  # raise exception if attempting to find one element
-                        error_message = "Unable to find element after {0} attempts with locator: {1}".format(
-                            attempts,
-                            locator
-                        )
-
-                        # Check if filters limited the results
-                        if exclude_invisible and len(visible_elements) == 0 and len(all_elements) > 0:
-                            error_message = "Elements found using locator {}, but none were visible".format(locator)
-
-                        raise WebDriverWrapperException.WebDriverWrapperException(self, error_message)
-                else:
-                    attempts += 1
+            # Check if filters limited the results
+            if any(filters) and match_count > 0:
+                error_message = "Elements found using locator {}, but none were {}".format(
+                    locator,
+                    ' and '.join(name for name, active in zip(('visible', 'enabled', 'on screen'), filters) if active)
+                )
+
+            raise WebDriverWrapperException.WebDriverWrapperException(self, error_message)
+
+    def _filter_displayed(self, selector_or_elements, search_object, filters):
+        """
+        Filters elements by visibility, enabled state and/or viewport position with a single script execution
+
+        @param selector_or_elements:    css selector to query, or list of WebElements to filter
+        @param search_object:           WebDriver or WebElement to query the selector under
+        @type filters:                  tuple
+        @param filters:                 (exclude_invisible, exclude_disabled, exclude_offscreen)
+
+        @rtype:                         tuple
+        @return:                        (list of WebElements passing the filters, number of elements before filtering)
+        """
+        if not isinstance(selector_or_elements, basestring) and len(selector_or_elements) == 0:
+            return [], 0
+
+        root = None if search_object is self.driver else search_object
+        elements, match_count = self.js_executor.execute_template_and_return_result(
+            'filterDisplayedElements.js', {}, [selector_or_elements, root] + list(filters))
+        return list(elements), match_count
+
+    def _find_in_shadow_roots(self, locator, search_object):
+        """
+        Finds all elements matching a css locator inside the shadow roots given by locator.shadow_roots
+
+        @type locator:          webdriverwrapper.support.locator.Locator
+        @param locator:         css Locator with shadow_roots
+        @param search_object:   WebDriver or WebElement to start the search under
+
+        @rtype:                 list
+        @return:                list of WebElements
+        """
+        selectors = []
+        for selector in locator.shadow_roots + (locator,):
+            strategy = self.locator_handler.parse_locator(selector)
+            if strategy.By != 'css selector':
+                raise ValueError(
+                    'You must use css locators in order to find elements in shadow roots; this was "{}"'.format(
+                        strategy))
+            selectors.append(strategy.value)
+
+        root = None if search_object is self.driver else search_object
+        return self.js_executor.execute_template_and_return_result(
+            'findInShadowRootsTemplate.js', {}, [selectors[:-1], selectors[-1], root]) or []
 
     def _find_immediately(self, locator, search_object=None):
         '''
@@ -400,8 +699,27 @@ class WebDriverWrapper(object):
                                 list of WebElementWrappers if find_all is True
         '''
         search_object = self.driver if search_object is None else search_object
-        elements = self.locator_handler.find_by_locator(search_object, locator, True)
-        return [WebElementWrapper.WebElementWrapper(self, locator, element) for element in elements]
+        elements = self._find_elements(locator, search_object)
+        return WebElementWrapper.WebElementWrapperList(self, locator, elements)
+
+    def _find_elements(self, locator, search_object):
+        """
+        Single lookup of all elements matching locator, in its frames and shadow roots (if any)
+
+        @rtype:     list
+        @return:    list of WebElements
+        """
+        self.enter_frames(locator, search_object)
+        if getattr(locator, 'shadow_roots', ()):
+            return self._find_in_shadow_roots(locator, search_object)
+        return self.locator_handler.find_by_locator(search_object, locator, True)
+
+    def _is_batchable(self, locator, strategy):
+        """
+        @return:    True if the locator can be queried by a batched script in the current frame
+        """
+        return (strategy.By == 'css selector' and getattr(locator, 'frames', None) is None and
+                not getattr(locator, 'shadow_roots', ()))
 
     def find_all(self, locator, search_object=None, force_find=False):
         '''
@@ -415,6 +733,121 @@ class WebDriverWrapper(object):
         '''
         return self.find(locator=locator, find_all=True, search_object=search_object, force_find=force_find)
 
+    def find_many(self, locators, find_all=False, search_object=None):
+        '''
+        Finds several elements at once; all css locators are resolved in a single javascript execution, and
+        other locators (non-css, with frames or shadow roots, or with no matches) fall back to a regular find
+
+            >>> elements = dw.find_many({'title': locators.title, 'submit': locators.submit_button})
+            >>> elements['submit'].click()
+
+        @type locators:         dict
+        @param locators:        Dictionary of names to locators or css strings
+        @type find_all:         bool
+        @param find_all:        set to True to locate all matching elements of each locator as a list
+        @type search_object:    webdriverwrapper.WebElementWrapper
+        @param search_object:   Optional WebElement to start search with.  If null, search will be on self.driver
+
+        @rtype:                 dict
+        @return:                Dictionary of names to WebElementWrappers (or lists of them if find_all is True)
+        '''
+        if not isinstance(locators, dict):
+            raise TypeError('You must use a dictionary of names to locators to find many elements')
+
+        search_object = self.driver if search_object is None else search_object
+        root = None if search_object is self.driver else search_object
+
+        css_names = []
+        css_selectors = []
+        for name, locator in locators.iteritems():
+            strategy = self.locator_handler.parse_locator(locator)
+            if self._is_batchable(locator, strategy):
+                css_names.append(name)
+                css_selectors.append(strategy.value)
+
+        found = {}
+        if css_selectors:
+            results = self.js_executor.execute_template_and_return_result(
+                'getManyElementsTemplate.js', {}, [css_selectors, root, not find_all])
+
+            for name, elements in zip(css_names, results):
+                if elements:
+                    wrapped = WebElementWrapper.WebElementWrapperList(self, locators[name], elements, search_object)
+                    found[name] = wrapped if find_all else wrapped[0]
+
+        # Anything not resolved in the browser goes through the regular find (waits, retries and errors)
+        for name, locator in locators.iteritems():
+            if name not in found:
+                found[name] = self.find(locator, find_all=find_all, search_object=search_object)
+
+        return found
+
+    def snapshot(self, elements, fields=('text',), search_object=None):
+        '''
+        Reads several properties of many elements in a single javascript execution
+
+            >>> rows = dw.snapshot(dw.find_all(locators.table_rows), fields=['text', 'data-id', 'displayed'])
+            >>> rows[0].text, rows[0].data_id
+
+        The fields text, tag_name, value, location, size, displayed, enabled and selected mirror the WebElement
+        properties of the same name; any other field is read as an attribute.  Text is approximated with innerText,
+        so whitespace may differ slightly from WebElementWrapper.text()
+
+        @type elements:         list[WebElementWrapper] or webdriverwrapper.support.locator.Locator
+        @param elements:        WebElementWrappers or WebElements to read, or a locator to find them with
+        @type fields:           list
+        @param fields:          names of the properties to read
+        @type search_object:    webdriverwrapper.WebElementWrapper
+        @param search_object:   Optional WebElement to start search with, if elements is a locator
+
+        @rtype:                 list
+        @return:                one record (a namedtuple of the fields) per element, in order
+        '''
+        if isinstance(elements, (basestring, Locator)):
+            elements = self.find_all(elements, search_object=search_object)
+
+        fields = tuple(fields)
+        if not elements:
+            return []
+
+        if isinstance(elements, WebElementWrapper.WebElementWrapperList):
+            raw_elements = elements.elements
+        else:
+            raw_elements = [getattr(element, 'element', element) for element in elements]
+        rows = self.js_executor.execute_template_and_return_result(
+            'snapshotElementsTemplate.js', {}, [raw_elements, list(fields)])
+        return ElementSnapshot.build_records(fields, rows)
+
+    def build_dynamic_locator(self, template_locator, variables):
+        '''
+        Builds a locator from a template: Locator (and DynamicLocator) templates are formatted with their '{name}'
+        fields, and string templates have every '%name' variable replaced in a single pass
+
+        @type template_locator:         webdriverwrapper.support.locator.Locator
+        @param template_locator:        Template locator w/ formatting bits to insert
+        @type variables:                dict
+        @param variables:               Dictionary of variable substitutions
+
+        @rtype:                         webdriverwrapper.support.locator.Locator or str
+        @return:                        The locator with all variables substituted
+        '''
+        template_variable_character = '%'
+        # raise an exception if user passed non-dictionary variables
+        if not isinstance(variables, dict):
+            raise TypeError('You must use a dictionary to populate locator variables')
+
+        if isinstance(template_locator, Locator):
+            return template_locator.build(**variables)
+
+        if not variables:
+            return template_locator
+
+        # replace all variables that match the keys in 'variables' dict; longest keys first so that '%id' does not
+        # replace the beginning of '%id_suffix'
+        keys = sorted(variables.keys(), key=len, reverse=True)
+        pattern = re.escape(template_variable_character) + '(' + '|'.join(re.escape(key) for key in keys) + ')'
+        return re.sub(pattern, lambda match: str(variables[match.group(1)]), template_locator)
+
     def find_by_dynamic_locator(self, template_locator, variables, find_all=False, search_object=None):
         '''
         Find with dynamic locator
@@ -433,17 +866,34 @@ class WebDriverWrapper(object):
         @return:                        Single WebElemetnWrapper if find_all is False,
                                         list of WebElementWrappers if find_all is True
         '''
-        template_variable_character = '%'
-        # raise an exception if user passed non-dictionary variables
-        if not isinstance(variables, dict):
-            raise TypeError('You must use a dictionary to populate locator variables')
+        locator = self.build_dynamic_locator(template_locator, variables)
+        return self.find(locator, find_all, search_object)
 
-        # replace all variables that match the keys in 'variables' dict
-        locator = ""
-        for key in variables.keys():
-            locator = template_locator.replace(template_variable_character + key, variables[key])
+    def find_many_by_dynamic_locator(self, template_locator, variables_list, find_all=False, search_object=None):
+        '''
+        Finds the elements of a template locator for each set of variables; all resulting css locators are resolved in
+        a single javascript execution (see find_many)
 
-        return self.find(locator, find_all, search_object)
+            >>> cells = dw.find_many_by_dynamic_locator(row_cell, [{'row': i, 'column': 'price'} for i in range(50)])
+
+        @type template_locator:         webdriverwrapper.support.locator.DynamicLocator
+        @param template_locator:        Template locator w/ formatting bits to insert
+        @type variables_list:           list[dict]
+        @param variables_list:          List of dictionaries of variable substitutions
+        @type find_all:                 bool
+        @param find_all:                True to find all elements of each locator, False for first element only
+        @type search_object:            webdriverwrapper.WebElementWrapper
+        @param search_object:           Optional WebElement to start search with.
+                                        If null, search will be on self.driver
+
+        @rtype:                         list
+        @return:                        WebElementWrappers (or lists of them if find_all is True), in the order of
+                                        variables_list
+        '''
+        locators = dict((index, self.build_dynamic_locator(template_locator, variables))
+                        for index, variables in enumerate(variables_list))
+        found = self.find_many(locators, find_all=find_all, search_object=search_object)
+        return [found[index] for index in xrange(len(variables_list))]
 
     def find_all_by_dynamic_locator(self, template_locator, variables):
         '''
@@ -463,6 +913,7 @@ class WebDriverWrapper(object):
     def is_present(self, locator, search_object=None):
         """
         Determines whether an element is present on the page, retrying once if unable to locate
+        (or polling until the retry policy's deadline, if a retry policy is set)
 
         @type locator:                  webdriverwrapper.support.locator.Locator
         @param locator:                 the locator or css string used to query the element
@@ -470,6 +921,12 @@ class WebDriverWrapper(object):
         @param search_object:           Optional WebElement to start search with.
                                         If null, search will be on self.driver
         """
+        if self.retry_policy is not None:
+            for _ in self.retry_policy.attempts():
+                if self._find_immediately(locator, search_object=search_object):
+                    return True
+            return False
+
         all_elements = self._find_immediately(locator, search_object=search_object)
 
         if all_elements is not None and len(all_elements) > 0:
@@ -478,25 +935,68 @@ class WebDriverWrapper(object):
             return False
 
 
-    def is_present_no_wait(self, locator):
+    def is_present_no_wait(self, locator, search_object=None):
         """
-        Determines whether an element is present on the page with no wait
+        Determines whether an element is present on the page right now, without waiting: css locators are probed
+        with a javascript querySelector, anything else is found with the implicit wait set to zero
 
-        @type locator:  webdriverwrapper.support.locator.Locator
-        @param locator: the locator or css string used to query the element
+        @type locator:                  webdriverwrapper.support.locator.Locator
+        @param locator:                 the locator or css string used to query the element
+        @type search_object:            webdriverwrapper.WebElementWrapper
+        @param search_object:           Optional WebElement to start search with.
+                                        If null, search will be on self.driver
+
+        @rtype:                         bool
+        @return:                        True if at least one element matches the locator
+        """
+        return self.are_present_no_wait({locator: locator}, search_object=search_object)[locator]
+
+    def are_present_no_wait(self, locators, search_object=None):
         """
+        Determines whether elements are present on the page right now, without waiting; all css locators are probed in
+        a single javascript execution
 
-        # first attempt to locate the element
+            >>> present = dw.are_present_no_wait({'spinner': locators.spinner, 'error': locators.error_banner})
+
+        @type locators:                 dict
+        @param locators:                Dictionary of names to locators or css strings
+        @type search_object:            webdriverwrapper.WebElementWrapper
+        @param search_object:           Optional WebElement to start search with.
+                                        If null, search will be on self.driver
+
+        @rtype:                         dict
+        @return:                        Dictionary of names to True if the locator matched any element
+        """
+        search_object = self.driver if search_object is None else search_object
+        root = None if search_object is self.driver else search_object
+
+        css_names = []
+        css_selectors = []
+        for name, locator in locators.iteritems():
+            strategy = self.locator_handler.parse_locator(locator)
+            if self._is_batchable(locator, strategy):
+                css_names.append(name)
+                css_selectors.append(strategy.value)
 
         def execute():
-            '''
-            Generic function to execute wait
-            '''
-            return True if len(self.locator_handler.find_by_locator(self.driver, locator, True)) < 0 else False
+            present = {}
+            if css_selectors:
+                results = self.js_executor.execute_template_and_return_result(
+                    'getManyElementsTemplate.js', {}, [css_selectors, root, True])
+                for name, elements in zip(css_names, results):
+                    # a selector the browser could not query is left to a regular find below
+                    if elements is not None:
+                        present[name] = len(elements) > 0
+
+            remaining = [name for name in locators if name not in present]
+            if remaining:
+                with self.no_implicit_wait():
+                    for name in remaining:
+                        present[name] = len(self._find_elements(locators[name], search_object)) > 0
+            return present
 
         return self.execute_and_handle_webdriver_exceptions(
-            execute, timeout=0, locator=locator, failure_message='Error running webdriver.find_all.')
-
+            execute, timeout=0, locator=locators.values(), failure_message='Error checking element presence.')
 
     #
     # WebDriver Waits
@@ -559,8 +1059,9 @@ class WebDriverWrapper(object):
             '''
             Wait function passed to executor
             '''
+            self.enter_frames(locator)
             element = WebDriverWait(self.driver, timeout).until(EC.presence_of_element_located(
-                (self.locator_handler.parse_locator(locator).By, self.locator_handler.parse_locator(locator).value)))
+                self.locator_handler.parse_locator(locator)))
             return WebElementWrapper.WebElementWrapper(self, locator, element)
 
         return self.execute_and_handle_webdriver_exceptions(
@@ -610,8 +1111,9 @@ class WebDriverWrapper(object):
             '''
             Wait function passed to executor
             '''
+            self.enter_frames(locator)
             element = WebDriverWait(self.driver, timeout).until(EC.visibility_of_element_located(
-                (self.locator_handler.parse_locator(locator).By, self.locator_handler.parse_locator(locator).value)))
+                self.locator_handler.parse_locator(locator)))
             return WebElementWrapper.WebElementWrapper(self, locator, element)
 
         return self.execute_and_handle_webdriver_exceptions(
@@ -639,8 +1141,9 @@ class WebDriverWrapper(object):
             '''
             Wait function passed to executor
             '''
+            self.enter_frames(locator)
             element = WebDriverWait(self.driver, timeout).until(EC.invisibility_of_element_located(
-                (self.locator_handler.parse_locator(locator).By, self.locator_handler.parse_locator(locator).value)))
+                self.locator_handler.parse_locator(locator)))
             return WebElementWrapper.WebElementWrapper(self, locator, element)
 
         return self.execute_and_handle_webdriver_exceptions(
@@ -664,8 +1167,9 @@ class WebDriverWrapper(object):
             '''
             Wait function passed to executor
             '''
+            self.enter_frames(locator)
             element = WebDriverWait(self.driver, timeout).until(EC.element_to_be_clickable(
-                (self.locator_handler.parse_locator(locator).By, self.locator_handler.parse_locator(locator).value)))
+                self.locator_handler.parse_locator(locator)))
 
             return WebElementWrapper.WebElementWrapper(self, locator, element)
 
@@ -691,7 +1195,7 @@ class WebDriverWrapper(object):
             Wait function passed to executor
             '''
             element = WebDriverWait(self.driver, timeout).until(EC.staleness_of(
-                (self.locator_handler.parse_locator(locator).By, self.locator_handler.parse_locator(locator).value)))
+                self.locator_handler.parse_locator(locator)))
 
             return WebElementWrapper.WebElementWrapper(self, locator, element)
 
@@ -894,7 +1398,8 @@ class WebDriverWrapper(object):
         return self.execute_and_handle_webdriver_exceptions(
             wait, timeout, None, 'Timeout waiting for all jQuery AJAX requests to close')
 
-    def execute_and_handle_webdriver_exceptions(self, function_to_execute, timeout=None, locator=None, failure_message=None):
+    def execute_and_handle_webdriver_exceptions(self, function_to_execute, timeout=None, locator=None, failure_message=None,
+                                                callback_event=ActionCallbacks.ACTION):
         """
         Executor for wait functions
 
@@ -906,15 +1411,20 @@ class WebDriverWrapper(object):
         @param locator:             locator used to find element
         @type failure_message:      str
         @param failure_message:     message shown in exception if wait fails
+        @type callback_event:       str
+        @param callback_event:      event to run the action callbacks for afterwards, or None to run none
 
         @rtype:                 webdriverwrapper.WebElementWrapper
         @return:                Returns the element found
         """
         logger = logging.getLogger(__name__)
+        started = time.time() if self.instrumentation is not None else None
+        succeeded = False
         try:
             val = function_to_execute()
-            for cb in self.action_callbacks:
-                cb.__call__(self)
+            succeeded = True
+            if callback_event is not None:
+                self.callback_pipeline.run(callback_event)
             return val
 
         except TimeoutException:
@@ -947,6 +1457,11 @@ class WebDriverWrapper(object):
                 logger.error('Unexpected alert raised on a WebDriver action; alert message was: {}'.format(msg))
                 raise UnexpectedAlertPresentException('Unexpected alert on page, alert message was: "{}"'.format(msg))
 
+        finally:
+            if started is not None:
+                # named after the wrapper method that ran the action, e.g. "wait_until_visible"
+                self.record_action(sys._getframe(1).f_code.co_name, started, locator, succeeded=succeeded)
+
     #
     # Browser Interaction
     #
@@ -970,6 +1485,8 @@ class WebDriverWrapper(object):
         @rtype:                 webdriverwrapper.WebElementWrapper
         @return:                Returns the element found
         """
+        if self.element_cache is not None:
+            self.element_cache.expire()
         return self.js_executor.execute_script(script, args)
 
     def pause_and_wait_for_user(self, timeout=None, prompt_text='Click to resume (WebDriver is paused)'):
@@ -1090,14 +1607,19 @@ class WebDriverWrapper(object):
         """
         return self.driver.get_cookies()
 
-    def get_browser_log(self, levels=None):
-        """Gets the console log of the browser
+    def get_browser_log(self, levels=None, consumer=None):
+        """Gets the console log of the browser; every fetched entry is also kept in the bounded browser_logs buffer
 
-        @type levels:
+        @type levels:       list
+        @param levels:      levels of the entries to return (e.g. [BROWSER_LOG_LEVEL_SEVERE]), or None for all levels
+        @param consumer:    name of the reader; if given, returns every buffered entry this consumer has not read yet
+                            (including entries fetched by other readers), instead of only the newly fetched entries
         @return: List of browser log entries
         """
         logs = self.driver.get_log('browser')
-        self.browser_logs += logs
+        self.browser_logs.extend(logs)
+        if consumer is not None:
+            return self.browser_logs.read(consumer, levels)
         if levels is not None:
             logs = [entry for entry in logs if entry.get(u'level') in levels]
         return logs
@@ -1121,6 +1643,14 @@ class WebDriverWrapper(object):
         """Close driver and kill all associated displays
 
         """
+        # Run the teardown callbacks while the browser is still up; the browser and display must be shut down even if
+        # one of them fails (e.g. on console errors), and that failure is raised once they are
+        teardown_error = None
+        try:
+            self.callback_pipeline.teardown()
+        except Exception:
+            teardown_error = sys.exc_info()
+
         # Kill the driver
 
         def _quit():
@@ -1135,6 +1665,17 @@ class WebDriverWrapper(object):
                     if self.display:
                         self.display.stop()
                 except Exception, err_display:
-                    os.kill(self.display_pid, signal.SIGKILL)
+                    # a shared display (e.g. a DisplayLease) still serves other browsers, so only kill our own
+                    if not getattr(self.display, 'shared', False):
+                        os.kill(self.display_pid, signal.SIGKILL)
                     raise
-        return self.execute_and_handle_webdriver_exceptions(_quit)
+
+        try:
+            result = self.execute_and_handle_webdriver_exceptions(_quit, callback_event=None)
+        except Exception:
+            if teardown_error is None:
+                raise
+            logging.getLogger(__name__).exception('Error quitting driver after a teardown callback failed')
+        if teardown_error is not None:
+            raise teardown_error[0], teardown_error[1], teardown_error[2]
+        return result
@@ -1,9 +1,11 @@
 """
 Module representing the web element wrapper
 """
+from collections import MutableSequence
 from httplib import BadStatusLine
 import logging
 import re
+import time
 
 __author__ = 'justin'
 
@@ -18,10 +20,12 @@ from coyote_framework.webdriver.webdriverwrapper.exceptions import WebElementDoe
     WebDriverTimeoutException
 
 
-class WebElementWrapper():
+class WebElementWrapper(object):
     """
     WebElementWrapper class -- wraps selenium webelement to operate with webdriverwrapper
     """
+    __slots__ = ('driver_wrapper', 'driver', 'locator', 'element', 'search_object')
+
     def __init__(self, driver_wrapper, locator, element=None, search_object=None):
         """
         @type driver_wrapper: WebDriverWrapper
@@ -103,7 +107,7 @@ class WebElementWrapper():
             Wrapper to clear element
             """
             return self.element.clear()
-        self.execute_and_handle_webelement_exceptions(clear_element, 'clear')
+        self.execute_and_handle_webelement_exceptions(clear_element, 'clear', mutates_dom=True)
         return self
 
     def delete_content(self, max_chars=100):
@@ -121,7 +125,7 @@ class WebElementWrapper():
                 self.send_keys(Keys.DELETE)
                 chars_deleted += 1
 
-        self.execute_and_handle_webelement_exceptions(delete_content_element, 'delete input contents')
+        self.execute_and_handle_webelement_exceptions(delete_content_element, 'delete input contents', mutates_dom=True)
         return self
 
     def click(self, force_click=False):
@@ -150,9 +154,9 @@ class WebElementWrapper():
             return True
 
         if force_click:
-            self.execute_and_handle_webelement_exceptions(force_click_element, 'click element by javascript')
+            self.execute_and_handle_webelement_exceptions(force_click_element, 'click element by javascript', mutates_dom=True)
         else:
-            self.execute_and_handle_webelement_exceptions(click_element, 'click')
+            self.execute_and_handle_webelement_exceptions(click_element, 'click', mutates_dom=True)
 
         return self
 
@@ -290,7 +294,7 @@ class WebElementWrapper():
             Wrapper to send keys
             """
             return self.element.send_keys(value)
-        self.execute_and_handle_webelement_exceptions(send_keys_element, 'send keys')
+        self.execute_and_handle_webelement_exceptions(send_keys_element, 'send keys', mutates_dom=True)
         return self
 
     def send_keys(self, value):
@@ -305,7 +309,7 @@ class WebElementWrapper():
             Wrapper to send keys
             """
             return self.element.send_keys(value)
-        self.execute_and_handle_webelement_exceptions(send_keys_element, 'send keys')
+        self.execute_and_handle_webelement_exceptions(send_keys_element, 'send keys', mutates_dom=True)
         return self
 
     def set(self, val, force_set=False):
@@ -336,7 +340,7 @@ class WebElementWrapper():
                     """
                     js_executor.execute_template('setValueTemplate', {'value': val}, self.element)
                     return True
-                self.execute_and_handle_webelement_exceptions(force_set_element, 'set element by javascript')
+                self.execute_and_handle_webelement_exceptions(force_set_element, 'set element by javascript', mutates_dom=True)
             else:
                 self.driver_wrapper.assertion.fail(
                     'Setting text field failed because final text did not match input value: "{}" != "{}"'.format(
@@ -358,7 +362,7 @@ class WebElementWrapper():
             Wrapper to submit element
             """
             return self.element.submit()
-        self.execute_and_handle_webelement_exceptions(submit_element, 'send keys')
+        self.execute_and_handle_webelement_exceptions(submit_element, 'send keys', mutates_dom=True)
         return self
 
     def value_of_css_property(self, property_name):
@@ -576,7 +580,7 @@ class WebElementWrapper():
             Perform selection
             """
             return self.set_select('select', value, text, index)
-        return self.execute_and_handle_webelement_exceptions(do_select, 'select option')
+        return self.execute_and_handle_webelement_exceptions(do_select, 'select option', mutates_dom=True)
 
     def deselect_option(self, value=None, text=None, index=None):
         """
@@ -597,7 +601,7 @@ class WebElementWrapper():
             Perform selection
             """
             return self.set_select('deselect', value, text, index)
-        return self.execute_and_handle_webelement_exceptions(do_deselect, 'deselect option')
+        return self.execute_and_handle_webelement_exceptions(do_deselect, 'deselect option', mutates_dom=True)
 
     def deselect_all(self):
         """
@@ -611,7 +615,7 @@ class WebElementWrapper():
             Perform selection
             """
             return self.set_select('deselect all')
-        return self.execute_and_handle_webelement_exceptions(do_deselect_all, 'deselect all')
+        return self.execute_and_handle_webelement_exceptions(do_deselect_all, 'deselect all', mutates_dom=True)
 
     def set_select(self, select_or_deselect = 'select', value=None, text=None, index=None):
         """
@@ -683,7 +687,7 @@ class WebElementWrapper():
             Perform hover
             """
             ActionChains(self.driver_wrapper.driver).move_to_element(self.element).perform()
-        return self.execute_and_handle_webelement_exceptions(do_hover, 'hover')
+        return self.execute_and_handle_webelement_exceptions(do_hover, 'hover', mutates_dom=True)
 
     def find(self, locator, find_all=False, search_object=None, exclude_invisible=None, *args, **kwargs):
         """
@@ -704,7 +708,8 @@ class WebElementWrapper():
             locator,
             find_all,
             search_object=search_object,
-            exclude_invisible=exclude_invisible
+            exclude_invisible=exclude_invisible,
+            **kwargs
         )
 
     def find_once(self, locator):
@@ -719,20 +724,8 @@ class WebElementWrapper():
         @rtype:                 WebElementWrapper or list[WebElementWrapper]
         @return:                Either a single WebElementWrapper, or a list of WebElementWrappers
         """
-        params = []
-        params.append(self.driver_wrapper.find_attempts)
-        params.append(self.driver_wrapper.implicit_wait)
-
-        self.driver_wrapper.find_attempts = 1
-        self.driver_wrapper.implicit_wait = 0
-
-        result = self.driver_wrapper._find_immediately(locator, self.element)
-
-        # restore the original params
-        self.driver_wrapper.implicit_wait = params.pop()
-        self.driver_wrapper.find_attempts = params.pop()
-
-        return result
+        with self.driver_wrapper.timing(implicit_wait=0, find_attempts=1):
+            return self.driver_wrapper._find_immediately(locator, self.element)
 
     def find_all(self, locator):
         """
@@ -746,6 +739,18 @@ class WebElementWrapper():
         """
         return self.driver_wrapper.find(locator, True, self.element)
 
+    def find_many(self, locators, find_all=False):
+        """
+        Find wrapper, finds several elements within this element in as few round trips as possible
+
+        @type locators:         dict
+        @param locators:        Dictionary of names to locators
+
+        @rtype:                 dict
+        @return:                Dictionary of names to WebElementWrappers (or lists of them if find_all is True)
+        """
+        return self.driver_wrapper.find_many(locators, find_all=find_all, search_object=self.element)
+
     def is_present(self, locator):
         """
         Tests to see if an element is present
@@ -792,7 +797,7 @@ class WebElementWrapper():
 
         return self.execute_and_handle_webelement_exceptions(wait, 'wait for staleness')
 
-    def execute_and_handle_webelement_exceptions(self, function_to_execute, name_of_action):
+    def execute_and_handle_webelement_exceptions(self, function_to_execute, name_of_action, mutates_dom=False):
         """
         Private method to be called by other methods to handle common WebDriverExceptions or throw
         a custom exception
@@ -801,50 +806,152 @@ class WebElementWrapper():
         @param function_to_execute:     A function containing some webdriver calls
         @type name_of_action:           str
         @param name_of_action:          The name of the action you are trying to perform for building the error message
+        @type mutates_dom:              bool
+        @param mutates_dom:             True if the action may change the page, so the element cache must re-check it
         """
         if self.element is not None:
             attempts = 0
-            while attempts < self.driver_wrapper.find_attempts+1:
-                try:
-                    attempts = attempts + 1
-                    val = function_to_execute()
-                    for cb in self.driver_wrapper.action_callbacks:
-                        cb.__call__(self.driver_wrapper)
-                    return val
-                except StaleElementReferenceException:
-                    self.element = self.driver_wrapper.find(self.locator, search_object=self.search_object).element
-                except ElementNotVisibleException:
-                    raise WebElementNotVisibleException.WebElementNotVisibleException(self,
-                        'WebElement with locator: {} was not visible, so could not {}'.format(
-                            self.locator, name_of_action))
-                except MoveTargetOutOfBoundsException:
-                    raise WebElementNotVisibleException.WebElementNotVisibleException(self,
-                        'WebElement with locator: {} was out of window, so could not {}'.format(
-                            self.locator, name_of_action))
-                except TimeoutException:
-                    raise WebDriverTimeoutException.WebDriverTimeoutException(
-                        self.driver_wrapper, timeout=self.driver_wrapper.timeout, locator=self.locator,
-                        msg='Timeout on action: {}'.format(name_of_action))
-                except UnexpectedAlertPresentException:
-                    msg = 'failed to parse message from alert'
+            stale_recoveries = 0
+            started = time.time() if self.driver_wrapper.instrumentation is not None else None
+            succeeded = False
+            self.driver_wrapper.enter_frames(self.locator, self.search_object)
+            try:
+                for attempts in self.driver_wrapper.iter_attempts():
                     try:
-                        a = self.driver.switch_to_alert()
-                        msg = a.text
-                    finally:
-                        raise UnexpectedAlertPresentException('Unexpected alert on page: {}'.format(msg))
-                except BadStatusLine, e:
-                    logging.getLogger(__name__).error('{} error raised on action: {} (line: {}, args:{}, message: {})'.format(
-                        BadStatusLine.__class__.__name__,
-                        name_of_action,
-                        e.line,
-                        e.args,
-                        e.message
-                    ))
-                    raise
-
-            raise StaleWebElementException.StaleWebElementException(self,
-                'Cannot {} element with locator: {}; the reference to the WebElement was stale ({} attempts)'
-                .format(name_of_action, self.locator, self.driver_wrapper.find_attempts))
+                        val = function_to_execute()
+                        succeeded = True
+                        self.driver_wrapper.callback_pipeline.run()
+                        return val
+                    except StaleElementReferenceException:
+                        stale_recoveries += 1
+                        if self.driver_wrapper.element_cache is not None:
+                            # Never re-find from the cache that may have served the stale reference
+                            self.driver_wrapper.element_cache.discard(self.locator, self.search_object)
+                        self.element = self.driver_wrapper.find(self.locator, search_object=self.search_object).element
+                    except ElementNotVisibleException:
+                        raise WebElementNotVisibleException.WebElementNotVisibleException(self,
+                            'WebElement with locator: {} was not visible, so could not {}'.format(
+                                self.locator, name_of_action))
+                    except MoveTargetOutOfBoundsException:
+                        raise WebElementNotVisibleException.WebElementNotVisibleException(self,
+                            'WebElement with locator: {} was out of window, so could not {}'.format(
+                                self.locator, name_of_action))
+                    except TimeoutException:
+                        raise WebDriverTimeoutException.WebDriverTimeoutException(
+                            self.driver_wrapper, timeout=self.driver_wrapper.timeout, locator=self.locator,
+                            msg='Timeout on action: {}'.format(name_of_action))
+                    except UnexpectedAlertPresentException:
+                        msg = 'failed to parse message from alert'
+                        try:
+                            a = self.driver.switch_to_alert()
+                            msg = a.text
+                        finally:
+                            raise UnexpectedAlertPresentException('Unexpected alert on page: {}'.format(msg))
+                    except BadStatusLine, e:
+                        logging.getLogger(__name__).error('{} error raised on action: {} (line: {}, args:{}, message: {})'.format(
+                            BadStatusLine.__class__.__name__,
+                            name_of_action,
+                            e.line,
+                            e.args,
+                            e.message
+                        ))
+                        raise
+
+                raise StaleWebElementException.StaleWebElementException(self,
+                    'Cannot {} element with locator: {}; the reference to the WebElement was stale ({} attempts)'
+                    .format(name_of_action, self.locator, attempts + 1))
+            finally:
+                if mutates_dom and self.driver_wrapper.element_cache is not None:
+                    self.driver_wrapper.element_cache.expire()
+                if started is not None:
+                    self.driver_wrapper.record_action(name_of_action, started, self.locator, retries=attempts,
+                                                      stale_recoveries=stale_recoveries, succeeded=succeeded)
         else:
             raise WebElementDoesNotExist.WebElementDoesNotExist(self,
-                'Cannot {} element with locator: {}; it does not exist'.format(name_of_action, self.locator))
\ No newline at end of file
+                'Cannot {} element with locator: {}; it does not exist'.format(name_of_action, self.locator))
+
+
+class WebElementWrapperList(MutableSequence):
+    """
+    List of found elements that are wrapped in WebElementWrappers only when accessed
+
+    Slicing returns another lazy list over the same elements, so e.g. elements[:3] never wraps the rest. It is a
+    MutableSequence rather than a list subclass, so isinstance(elements, list) is False; use list(elements) where a
+    real list is required
+    """
+
+    def __init__(self, driver_wrapper, locator, elements, search_object=None):
+        """
+        @type driver_wrapper:   WebDriverWrapper
+        @param locator:         locator the elements were found with
+        @type elements:         list
+        @param elements:        selenium WebElements
+        @param search_object:   WebDriver or WebElement the elements were found under
+        """
+        self.driver_wrapper = driver_wrapper
+        self.locator = locator
+        self.search_object = search_object
+        self._elements = list(elements)
+        self._wrapped = [None] * len(self._elements)
+
+    def _wrap(self, index):
+        wrapper = self._wrapped[index]
+        if wrapper is None:
+            wrapper = self._wrapped[index] = WebElementWrapper(
+                self.driver_wrapper, self.locator, self._elements[index], search_object=self.search_object)
+        return wrapper
+
+    def __len__(self):
+        return len(self._elements)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            sliced = WebElementWrapperList(self.driver_wrapper, self.locator, (), self.search_object)
+            sliced._elements = self._elements[index]
+            sliced._wrapped = self._wrapped[index]
+            return sliced
+        return self._wrap(index)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            self._elements[index] = [getattr(wrapper, 'element', wrapper) for wrapper in value]
+            self._wrapped[index] = value
+        else:
+            self._elements[index] = getattr(value, 'element', value)
+            self._wrapped[index] = value
+
+    def __delitem__(self, index):
+        del self._elements[index]
+        del self._wrapped[index]
+
+    def insert(self, index, value):
+        self._elements.insert(index, getattr(value, 'element', value))
+        self._wrapped.insert(index, value)
+
+    def __iter__(self):
+        for index in xrange(len(self._elements)):
+            yield self._wrap(index)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        return isinstance(other, (list, WebElementWrapperList)) and list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<WebElementWrapperList: {} elements with locator {}>'.format(len(self), self.locator)
+
+    @property
+    def elements(self):
+        """
+        @rtype:     list
+        @return:    the underlying selenium WebElements, without wrapping them
+        """
+        return list(self._elements)
@@ -0,0 +1,174 @@
+"""
+Action callback module -- decides when WebDriverWrapper runs its action callbacks, and where
+"""
+import logging
+import threading
+import time
+from Queue import Queue
+
+__author__ = 'justin'
+
+ACTION = 'action'
+NAVIGATION = 'navigation'
+TEARDOWN = 'teardown'
+
+
+class ActionCallback(object):
+    """
+    A function called with the WebDriverWrapper after actions, when its triggers say so
+
+        >>> ActionCallback(check_console, on_navigation=True, debounce=2, on_teardown=True)
+        >>> ActionCallback(collect_timings, every=10, background=True)
+
+    With no triggers, the callback runs after every action (like a plain function in action_callbacks). Otherwise it
+    runs after every `every`th action, at most once every `debounce` seconds of actions, after every navigation if
+    on_navigation, and when the driver quits if on_teardown. Background callbacks run on a worker thread, so they
+    should only collect data; their errors are logged rather than raised
+    """
+    __slots__ = ('function', 'every', 'on_navigation', 'debounce', 'on_teardown', 'background', 'actions',
+                 'last_run')
+
+    def __init__(self, function, every=None, on_navigation=False, debounce=None, on_teardown=False, background=False):
+        """
+        @type function:         types.FunctionType
+        @param function:        called with the WebDriverWrapper
+        @type every:            int
+        @param every:           run after every Nth action
+        @type on_navigation:    bool
+        @param on_navigation:   run after every navigation
+        @type debounce:         float
+        @param debounce:        run after an action at most once per this many seconds
+        @type on_teardown:      bool
+        @param on_teardown:     run when the driver quits
+        @type background:       bool
+        @param background:      run on the background worker instead of blocking the action
+        """
+        if every is not None and every < 1:
+            raise ValueError('Action callbacks must run at least every 1 action, was {}'.format(every))
+        if every is None and debounce is None and not on_navigation and not on_teardown:
+            every = 1
+
+        self.function = function
+        self.every = every
+        self.on_navigation = on_navigation
+        self.debounce = debounce
+        self.on_teardown = on_teardown
+        self.background = background
+        self.actions = 0
+        self.last_run = None
+
+    def __repr__(self):
+        return 'ActionCallback({}, every={}, on_navigation={}, debounce={}, on_teardown={}, background={})'.format(
+            getattr(self.function, '__name__', self.function), self.every, self.on_navigation, self.debounce,
+            self.on_teardown, self.background)
+
+    def is_triggered(self, event, now):
+        """
+        @type event:    str
+        @param event:   ACTION, NAVIGATION or TEARDOWN
+        @type now:      float
+        @param now:     time.time() of the event
+
+        @rtype:         bool
+        @return:        True if the callback should run for this event; updates the action count and last run time
+        """
+        if event == TEARDOWN:
+            triggered = self.on_teardown
+        elif event == NAVIGATION and self.on_navigation:
+            triggered = True
+        elif self.every is None and self.debounce is None:
+            triggered = False
+        else:
+            self.actions += 1
+            triggered = ((self.every is None or self.actions % self.every == 0) and
+                         (self.debounce is None or self.last_run is None or now - self.last_run >= self.debounce))
+
+        if triggered:
+            self.last_run = now
+        return triggered
+
+
+class ActionCallbackPipeline(object):
+    """
+    Runs a WebDriverWrapper's action_callbacks (plain functions or ActionCallbacks) for each event
+    """
+    def __init__(self, driver_wrapper):
+        """
+        @type driver_wrapper:   WebDriverWrapper
+        """
+        self.driver_wrapper = driver_wrapper
+        self.errors = []  # exceptions raised by background callbacks
+        self.torn_down = False
+        self._queue = None
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def run(self, event=ACTION):
+        """
+        Runs the callbacks triggered by an event; foreground callbacks run (and raise) immediately
+
+        @type event:    str
+        @param event:   ACTION, NAVIGATION or TEARDOWN
+        """
+        callbacks = self.driver_wrapper.action_callbacks
+        if not callbacks:
+            return
+
+        now = time.time()
+        for callback in callbacks:
+            if not isinstance(callback, ActionCallback):
+                if event != TEARDOWN:
+                    callback(self.driver_wrapper)
+            elif callback.is_triggered(event, now):
+                if callback.background:
+                    self._submit(callback.function)
+                else:
+                    callback.function(self.driver_wrapper)
+
+    def teardown(self, timeout=10):
+        """
+        Runs the teardown callbacks, then waits for the background worker to finish its queue and stops it; only the
+        first call does anything, so a driver can be torn down by the test and quit later (e.g. in the background)
+
+        @type timeout:  float
+        @param timeout: seconds to wait for the background worker
+        """
+        if self.torn_down:
+            return
+        self.torn_down = True
+        try:
+            self.run(TEARDOWN)
+        finally:
+            with self._lock:
+                worker, queue = self._worker, self._queue
+                self._worker = self._queue = None
+            if worker is not None:
+                queue.put(None)
+                worker.join(timeout)
+
+    def reopen(self):
+        """
+        Lets the teardown callbacks run again after teardown(), e.g. when a pooled driver is leased to the next test
+        """
+        self.torn_down = False
+
+    def _submit(self, function):
+        with self._lock:
+            if self._worker is None:
+                self._queue = Queue()
+                self._worker = threading.Thread(target=self._work, args=(self._queue,),
+                                                name='action-callback-worker')
+                self._worker.daemon = True
+                self._worker.start()
+            self._queue.put(function)
+
+    def _work(self, queue):
+        while True:
+            function = queue.get()
+            if function is None:
+                return
+            try:
+                function(self.driver_wrapper)
+            except Exception, e:
+                logging.getLogger(__name__).warn('Background action callback {} failed: {}'.format(function, e))
+                self.errors.append(e)
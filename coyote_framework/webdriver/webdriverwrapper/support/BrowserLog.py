@@ -0,0 +1,139 @@
+"""
+Browser log module -- bounded buffer of browser console entries with incremental reads
+"""
+import heapq
+import itertools
+import threading
+from collections import deque
+
+__author__ = 'justin'
+
+EVICT_OLDEST = 'oldest'
+EVICT_LOWEST_LEVEL = 'lowest_level'
+
+# Eviction order for EVICT_LOWEST_LEVEL; unknown levels are evicted with INFO
+LEVEL_PRIORITY = {u'DEBUG': 0, u'INFO': 1, u'WARNING': 2, u'SEVERE': 3}
+
+
+class BrowserLogBuffer(object):
+    """
+    Ring buffer of browser log entries, indexed by level, holding at most `maxlen` entries.
+
+    When full, either the oldest entry is evicted (EVICT_OLDEST), or the oldest entry of the lowest level present
+    (EVICT_LOWEST_LEVEL, which keeps SEVERE entries the longest). Each named consumer has a cursor, so that
+    read(consumer) only returns the entries added since that consumer's last read
+
+        >>> buffer.extend(driver.get_log('browser'))
+        >>> errors = buffer.read('console_errors', levels=[u'SEVERE'])
+    """
+    def __init__(self, maxlen=1000, eviction=EVICT_OLDEST):
+        """
+        @type maxlen:       int
+        @param maxlen:      maximum number of entries kept
+        @type eviction:     str
+        @param eviction:    EVICT_OLDEST or EVICT_LOWEST_LEVEL
+        """
+        if maxlen < 1:
+            raise ValueError('Browser log buffer must hold at least 1 entry, was {}'.format(maxlen))
+        if eviction not in (EVICT_OLDEST, EVICT_LOWEST_LEVEL):
+            raise ValueError('Unknown browser log eviction "{}"'.format(eviction))
+
+        self.maxlen = maxlen
+        self.eviction = eviction
+        self.evicted = 0
+        self._levels = {}  # level to deque of (sequence number, entry)
+        self._size = 0
+        self._sequence = itertools.count()
+        self._next = 0  # sequence number of the next entry added
+        self._cursors = {}  # consumer to the sequence number of the next entry it has not read
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        """Iterates over all buffered entries, oldest first"""
+        return iter(self.entries())
+
+    def entries(self, levels=None):
+        """
+        @type levels:   list
+        @param levels:  levels to return, or None for all levels
+
+        @rtype:         list
+        @return:        buffered entries of those levels, oldest first
+        """
+        with self._lock:
+            return self._since(0, levels)
+
+    def extend(self, entries):
+        """
+        Adds entries (dicts with a u'level' key, as returned by WebDriver), evicting old ones if the buffer is full
+        """
+        with self._lock:
+            for entry in entries:
+                sequence = next(self._sequence)
+                level = entry.get(u'level')
+                entries_of_level = self._levels.get(level)
+                if entries_of_level is None:
+                    entries_of_level = self._levels[level] = deque()
+                entries_of_level.append((sequence, entry))
+                self._size += 1
+                self._next = sequence + 1
+
+                if self._size > self.maxlen:
+                    self._evict()
+
+    def read(self, consumer, levels=None):
+        """
+        Reads the entries added since this consumer's last read; a new consumer reads everything still buffered
+
+        @param consumer:    any hashable name of the reader
+        @type levels:       list
+        @param levels:      levels to return, or None for all levels
+
+        @rtype:             list
+        @return:            new entries of those levels, oldest first
+        """
+        with self._lock:
+            entries = self._since(self._cursors.get(consumer, 0), levels)
+            self._cursors[consumer] = self._next
+            return entries
+
+    def clear(self):
+        """
+        Discards all buffered entries; consumer cursors stay where they are
+        """
+        with self._lock:
+            self._levels.clear()
+            self._size = 0
+
+    def _since(self, position, levels):
+        level_names = self._levels.keys() if levels is None else levels
+        new_entries = []
+        for level in level_names:
+            entries_of_level = self._levels.get(level)
+            if not entries_of_level:
+                continue
+            # entries are appended in order, so new entries are found by walking back from the end
+            newest = []
+            for sequence, entry in reversed(entries_of_level):
+                if sequence < position:
+                    break
+                newest.append((sequence, entry))
+            newest.reverse()
+            new_entries.append(newest)
+        return [entry for _, entry in heapq.merge(*new_entries)]
+
+    def _evict(self):
+        candidates = []
+        for level, entries in self._levels.iteritems():
+            if entries:
+                oldest_sequence = entries[0][0]
+                if self.eviction == EVICT_LOWEST_LEVEL:
+                    candidates.append((LEVEL_PRIORITY.get(level, 1), oldest_sequence, level))
+                else:
+                    candidates.append((oldest_sequence, level))
+        self._levels[min(candidates)[-1]].popleft()
+        self._size -= 1
+        self.evicted += 1
@@ -0,0 +1,123 @@
+"""
+Element cache module -- remembers WebElement references found on the current page
+"""
+import time
+
+from coyote_framework.webdriver.webdriverwrapper.support.LocatorHandler import LocatorHandler
+
+__author__ = 'justin'
+
+DEFAULT_PROBE_INTERVAL = 0
+
+
+class ElementCache(object):
+    """
+    Per-page cache of found WebElements, keyed by (compiled locator, search object).
+
+    The cache is cleared by WebDriverWrapper on navigation and window/frame switches; if observe_mutations is True,
+    it also asks an injected MutationObserver whether nodes or attributes changed, and clears the cache if they did.
+    By default every find probes; on pages known to be static, a probe_interval lets one probe vouch for the cache
+    for that many seconds, or until expire() is called after an action that may have changed the page, so that hits
+    in between cost no round trip. Empty results are never cached. Stale references that slip through are re-found
+    by WebElementWrapper.
+    """
+    def __init__(self, driver_wrapper, observe_mutations=True, probe_interval=DEFAULT_PROBE_INTERVAL):
+        """
+        @type driver_wrapper:       WebDriverWrapper
+        @type observe_mutations:    bool
+        @param observe_mutations:   check for DOM mutations (one script execution) before serving hits
+        @type probe_interval:       float
+        @param probe_interval:      seconds a probe that found no mutations vouches for the cache; 0 (the default)
+                                    probes every find, as changes made by the page's own scripts would be missed
+        """
+        self.driver_wrapper = driver_wrapper
+        self.observe_mutations = observe_mutations
+        self.probe_interval = probe_interval
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = {}
+        self._probed_at = None  # time.time() of the last probe, or None if the next find must probe
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return '<ElementCache: {}>'.format(self.stats())
+
+    def stats(self):
+        """
+        @rtype:     dict
+        @return:    Counters of cache hits, misses, invalidations and the number of cached entries
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations, 'size': len(self)}
+
+    def clear(self):
+        """
+        Invalidates all cached elements, e.g. because the page or frame changed; the next find probes the DOM again
+        """
+        self._probed_at = None
+        self._drop_entries()
+
+    def expire(self):
+        """
+        Makes the next find probe for DOM mutations, e.g. after an action that may have changed the page
+        """
+        self._probed_at = None
+
+    def _drop_entries(self):
+        if self._entries:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def discard(self, locator, search_object):
+        """
+        Removes a single cached result, e.g. because its element went stale
+        """
+        self._entries.pop((LocatorHandler.compile_locator(locator), search_object), None)
+
+    def is_dom_changed(self):
+        """
+        @rtype:     bool
+        @return:    True if nodes or attributes changed since the last check (or could have, if it was not yet
+                    observed)
+        """
+        return bool(self.driver_wrapper.js_executor.execute_template_and_return_result('isDomChanged.js', {}))
+
+    def _probe_if_due(self):
+        """
+        Checks the observer unless a recent probe still vouches for the cache, dropping every entry if the DOM changed
+        """
+        now = time.time()
+        if self._probed_at is not None and now - self._probed_at < self.probe_interval:
+            return
+        # The probe also (re)arms the observer, so entries cached from here on are covered by the next one
+        if self.is_dom_changed():
+            self._drop_entries()
+        self._probed_at = now
+
+    def find(self, search_object, locator):
+        """
+        Finds all elements matching locator, serving them from the cache when possible
+
+        @param search_object:   WebDriver or WebElement used for search
+        @type locator:          webdriverwrapper.support.locator.Locator
+        @param locator:         locator used in search
+
+        @rtype:                 list
+        @return:                list of WebElements (a new list on every call)
+        """
+        key = (LocatorHandler.compile_locator(locator), search_object)
+        if self.observe_mutations:
+            self._probe_if_due()
+
+        elements = self._entries.get(key)
+        if elements is not None:
+            self.hits += 1
+            return list(elements)
+
+        self.misses += 1
+        elements = self.driver_wrapper.locator_handler.find_by_locator(search_object, locator, True)
+        if elements:
+            self._entries[key] = list(elements)
+        return elements
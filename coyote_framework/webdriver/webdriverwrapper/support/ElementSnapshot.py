@@ -0,0 +1,45 @@
+"""
+Element snapshot module -- compact records of element properties gathered in bulk
+"""
+import re
+from collections import namedtuple
+
+__author__ = 'justin'
+
+
+_record_types = {}
+
+
+def record_type(fields):
+    """
+    Gets the record type (a namedtuple) for a sequence of fields; attribute fields that are not valid python
+    identifiers are renamed, e.g. 'data-id' is available as record.data_id
+
+    @type fields:   tuple
+    @param fields:  names of the snapshot fields
+
+    @rtype:         type
+    @return:        namedtuple class with one item per field
+    """
+    fields = tuple(fields)
+    snapshot_type = _record_types.get(fields)
+    if snapshot_type is None:
+        names = [re.sub(r'\W', '_', field) for field in fields]
+        snapshot_type = _record_types[fields] = namedtuple('ElementSnapshot', names, rename=True)
+    return snapshot_type
+
+
+def build_records(fields, rows):
+    """
+    Converts the rows returned by snapshotElementsTemplate.js into records
+
+    @type fields:   tuple
+    @param fields:  names of the snapshot fields
+    @type rows:     list
+    @param rows:    list of lists of values, one list per element
+
+    @rtype:         list
+    @return:        list of records, in the order of rows
+    """
+    snapshot_type = record_type(fields)
+    return [snapshot_type._make(row) for row in rows]
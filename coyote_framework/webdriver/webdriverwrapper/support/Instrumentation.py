@@ -0,0 +1,180 @@
+"""
+Instrumentation module -- records how long WebDriverWrapper actions take, and where that time goes
+"""
+import bisect
+import sys
+import threading
+
+from coyote_framework.util.pageobjects.web.webobjects import WebPage, WebComponent
+
+__author__ = 'justin'
+
+
+# Histogram bucket upper bounds in seconds: 1ms doubling up to ~65s, plus a catch-all bucket
+BUCKETS = tuple(0.001 * 2 ** i for i in xrange(17)) + (float('inf'),)
+
+# How many frames up the stack to look for the page object that called an action
+PAGE_OBJECT_SEARCH_DEPTH = 12
+
+
+class Histogram(object):
+    """
+    Fixed-bucket latency histogram; percentiles are reported as the upper bound of the bucket they fall in
+    """
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, duration):
+        """
+        @type duration:     float
+        @param duration:    duration in seconds
+        """
+        self.counts[bisect.bisect_left(BUCKETS, duration)] += 1
+        self.count += 1
+        self.total += duration
+        self.min = duration if self.min is None else min(self.min, duration)
+        self.max = duration if self.max is None else max(self.max, duration)
+
+    def percentile(self, percent):
+        """
+        @type percent:  float
+        @param percent: percentile to report, between 0 and 100
+
+        @rtype:         float
+        @return:        upper bound of the bucket holding that percentile (capped at the maximum), or None if empty
+        """
+        if not self.count:
+            return None
+        rank = max(1, int(round(self.count * percent / 100.0)))
+        seen = 0
+        for bound, bucket_count in zip(BUCKETS, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class ActionStats(object):
+    """
+    Statistics of one action (e.g. "click") on one locator from one page object
+    """
+    __slots__ = ('histogram', 'retries', 'stale_recoveries', 'failures')
+
+    def __init__(self):
+        self.histogram = Histogram()
+        self.retries = 0
+        self.stale_recoveries = 0
+        self.failures = 0
+
+
+class Instrumentation(object):
+    """
+    In-memory recorder of WebDriverWrapper actions, tagged by action name, locator description and the class of the
+    page object (WebPage or WebComponent) that performed the action
+
+        >>> dw = WebDriverWrapper(driver, instrumentation=Instrumentation())
+        >>> ...
+        >>> for row in dw.instrumentation.report()[:10]:
+        >>>     print row
+
+    Any object with the same record() method can be passed to WebDriverWrapper instead, e.g. to export to a metrics
+    service; instrumentation is disabled (and costs one None check per action) when no recorder is set
+    """
+    def __init__(self, find_page_objects=True):
+        """
+        @type find_page_objects:    bool
+        @param find_page_objects:   tag actions with the page object that performed them (walks the call stack)
+        """
+        self.find_page_objects = find_page_objects
+        self.actions = {}
+        self._lock = threading.Lock()
+
+    def record(self, action, duration, locator=None, retries=0, stale_recoveries=0, succeeded=True):
+        """
+        Records one action
+
+        @type action:               str
+        @param action:              name of the action, e.g. "click" or "wait_until_visible"
+        @type duration:             float
+        @param duration:            seconds the action took, including retries and waits
+        @param locator:             locator the action was performed on, if any
+        @type retries:              int
+        @param retries:             number of attempts after the first
+        @type stale_recoveries:     int
+        @param stale_recoveries:    number of times a stale element was found again
+        @type succeeded:            bool
+        @param succeeded:           False if the action raised
+        """
+        page_object = self.calling_page_object() if self.find_page_objects else None
+        description = getattr(locator, 'description', locator)
+        key = (action, str(description) if description is not None else None, page_object)
+
+        with self._lock:
+            stats = self.actions.get(key)
+            if stats is None:
+                stats = self.actions[key] = ActionStats()
+            stats.histogram.add(duration)
+            stats.retries += retries
+            stats.stale_recoveries += stale_recoveries
+            if not succeeded:
+                stats.failures += 1
+
+    @staticmethod
+    def calling_page_object():
+        """
+        @rtype:     str
+        @return:    class name of the nearest WebPage or WebComponent on the call stack, or None
+        """
+        frame = sys._getframe(2)
+        for _ in xrange(PAGE_OBJECT_SEARCH_DEPTH):
+            if frame is None:
+                break
+            instance = frame.f_locals.get('self')
+            if isinstance(instance, (WebPage, WebComponent)):
+                return instance.__class__.__name__
+            frame = frame.f_back
+        return None
+
+    def clear(self):
+        """
+        Discards everything recorded so far
+        """
+        with self._lock:
+            self.actions.clear()
+
+    def report(self):
+        """
+        @rtype:     list
+        @return:    one dict per (action, locator, page object), slowest total time first
+        """
+        with self._lock:
+            items = self.actions.items()
+
+        rows = []
+        for (action, locator, page_object), stats in items:
+            histogram = stats.histogram
+            rows.append({
+                'action': action,
+                'locator': locator,
+                'page_object': page_object,
+                'count': histogram.count,
+                'total': histogram.total,
+                'mean': histogram.mean(),
+                'p50': histogram.percentile(50),
+                'p95': histogram.percentile(95),
+                'max': histogram.max,
+                'retries': stats.retries,
+                'stale_recoveries': stats.stale_recoveries,
+                'failures': stats.failures,
+            })
+        rows.sort(key=lambda row: row['total'], reverse=True)
+        return rows
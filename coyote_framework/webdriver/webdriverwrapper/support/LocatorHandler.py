@@ -5,35 +5,144 @@ from coyote_framework.webdriver.webdriverwrapper.support import locator as loc
 
 __author__ = 'justin'
 
+import heapq
+import itertools
+import threading
 from collections import namedtuple
 
+from selenium.webdriver.common.by import By
+
+
+# Immutable, parsed form of a locator; unpacks directly into find_element(s) and expected_conditions
+LocatorStrategy = namedtuple('LocatorStrategy', 'By value')
+
+# Maps every supported locator prefix (e.g. the "xpath" in "xpath=//div") to a selenium By strategy
+STRATEGIES = {
+    'css': By.CSS_SELECTOR,
+    'css_selector': By.CSS_SELECTOR,
+    'css selector': By.CSS_SELECTOR,
+    'id': By.ID,
+    'xpath': By.XPATH,
+    'class_name': By.CLASS_NAME,
+    'class name': By.CLASS_NAME,
+    'link_text': By.LINK_TEXT,
+    'link text': By.LINK_TEXT,
+    'partial_link_text': By.PARTIAL_LINK_TEXT,
+    'partial link text': By.PARTIAL_LINK_TEXT,
+    'name': By.NAME,
+    'tag_name': By.TAG_NAME,
+    'tag name': By.TAG_NAME,
+}
+
+DEFAULT_CACHE_SIZE = 1024
+
+
+class LocatorCache(object):
+    """
+    Thread-safe, bounded least-recently-used cache of compiled locator strategies; recency updates, inserts
+    and the (rare) eviction of the least recently used entries all happen under one lock
+    """
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = {}
+        self._last_used = {}
+        self._clock = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Returns the cached value for key (marking it as most recently used), or None if it is not cached
+        """
+        value = self._entries.get(key)
+        if value is not None:
+            with self._lock:
+                # The entry may have been evicted since the unlocked read; don't resurrect its recency
+                if key in self._entries:
+                    self._last_used[key] = next(self._clock)
+        return value
+
+    def put(self, key, value):
+        """
+        Caches value for key, evicting the least recently used entry if the cache is full
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._last_used[key] = next(self._clock)
+            if len(self._entries) > self.maxsize:
+                # Evict a batch of the least recently used entries so that eviction cost is amortized
+                evict_count = len(self._entries) - self.maxsize + self.maxsize // 8
+                for oldest in heapq.nsmallest(evict_count, self._last_used, key=self._last_used.get):
+                    del self._entries[oldest]
+                    del self._last_used[oldest]
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._last_used.clear()
+
 
 class LocatorHandler():
     """
     Class to handle locators
     """
+    cache = LocatorCache()
+
     @staticmethod
-    def parse_locator(locator):
+    def compile_locator_string(locator):
         """
-        Parses a valid selenium By and value from a locator;
-        returns as a named tuple with properties 'By' and 'value'
+        Parses a raw locator string into a LocatorStrategy without consulting the cache;
+        strings should follow the convention "css=.class" or "xpath=//div", and strings without
+        a recognized strategy prefix are treated as css selectors
 
-        locator -- a valid element locator or css string
+        locator -- a locator string such as "xpath=//div" or a css selector
         """
+        prefix, separator, value = locator.partition('=')
+        if separator:
+            by = STRATEGIES.get(prefix)
+            if by is not None:
+                return LocatorStrategy(by, value)
+        return LocatorStrategy(By.CSS_SELECTOR, locator)
 
-        # handle backwards compatibility to support new Locator class
+    @staticmethod
+    def compile_locator(locator):
+        """
+        Resolves a locator to its compiled LocatorStrategy; the result is memoized on Locator instances
+        and in a bounded LRU cache for raw strings, so each distinct locator is only parsed once
+
+        locator -- a valid element locator or css string
+        """
         if isinstance(locator, loc.Locator):
-            locator = '{by}={locator}'.format(by=locator.by, locator=locator.locator)
+            compiled = locator._compiled
+            if compiled is not None and compiled[0] == locator.by and compiled[1] == locator.locator:
+                return compiled[2]
 
-        locator_tuple = namedtuple('Locator', 'By value')
+            by = STRATEGIES.get(locator.by)
+            if by is not None:
+                strategy = LocatorStrategy(by, locator.locator)
+            else:
+                strategy = LocatorHandler.compile_locator_string(
+                    '{by}={locator}'.format(by=locator.by, locator=locator.locator))
+            locator._compiled = (locator.by, locator.locator, strategy)
+            return strategy
 
-        if locator.count('=') > 0 and locator.count('css=') < 1:
-            by = locator[:locator.find('=')].replace('_', ' ')
-            value = locator[locator.find('=')+1:]
-            return locator_tuple(by, value)
-        else:  # assume default is css selector
-            value = locator[locator.find('=')+1:]
-            return locator_tuple('css selector', value)
+        strategy = LocatorHandler.cache.get(locator)
+        if strategy is None:
+            strategy = LocatorHandler.cache.put(locator, LocatorHandler.compile_locator_string(locator))
+        return strategy
+
+    @staticmethod
+    def parse_locator(locator):
+        """
+        Parses a valid selenium By and value from a locator;
+        returns as a named tuple with properties 'By' and 'value'
+
+        locator -- a valid element locator or css string
+        """
+        return LocatorHandler.compile_locator(locator)
 
     @staticmethod
     def find_by_locator(webdriver_or_element, locator, find_all_elements=False):
@@ -49,63 +158,8 @@ class LocatorHandler():
         @return:                        either a single WebElement or a list of WebElements
 
         """
-        # handle backwards compatibility to support new Locator class
-        if isinstance(locator, loc.Locator):
-            locator = '{by}={locator}'.format(by=locator.by, locator=locator.locator)
-
-        # use the appropriate find method given the locator type;
-        # locators should follow the convention "css=.class" or "xpath=//div"
-        # if locator type is unspecified, it will default to css
-        if (locator.count('css=') > 0  or locator.count('css_selector=')) and len(locator.split('=', 1)) > 1:
-            if find_all_elements:
-                return webdriver_or_element.find_elements_by_css_selector(locator.split('=', 1)[-1])
-            else:
-                return webdriver_or_element.find_element_by_css_selector(locator.split('=', 1)[-1])
-
-        elif locator.count('id=') > 0 and len(locator.split('=')) > 1:
-            if find_all_elements:
-                return webdriver_or_element.find_elements_by_id(locator.split('=', 1)[-1])
-            else:
-                return webdriver_or_element.find_element_by_id(locator.split('=', 1)[-1])
-
-        elif locator.count('xpath=') > 0 and len(locator.split('=')) > 1:
-            if find_all_elements:
-                return webdriver_or_element.find_elements_by_xpath(locator.split('=', 1)[-1])
-            else:
-                return webdriver_or_element.find_element_by_xpath(locator.split('=', 1)[-1])
-
-        elif locator.count('class_name=') > 0 and len(locator.split('=')) > 1:
-            if find_all_elements:
-                return webdriver_or_element.find_elements_by_class_name(locator.split('=', 1)[-1])
-            else:
-                return webdriver_or_element.find_element_by_class_name(locator.split('=', 1)[-1])
-
-        elif locator.count('link_text=') > 0 and len(locator.split('=')) > 1:
-            if find_all_elements:
-                return webdriver_or_element.find_elements_by_link_text(locator.split('=', 1)[-1])
-            else:
-                return webdriver_or_element.find_element_by_link_text(locator.split('=', 1)[-1])
-
-        elif locator.count('partial_link_text=') > 0 and len(locator.split('=')) > 1:
-            if find_all_elements:
-                return webdriver_or_element.find_elements_by_partial_link_text(locator.split('=', 1)[-1])
-            else:
-                return webdriver_or_element.find_element_by_partial_link_text(locator.split('=', 1)[-1])
-
-        elif locator.count('name=') > 0 and len(locator.split('=')) > 1:
-            if find_all_elements:
-                return webdriver_or_element.find_elements_by_name(locator.split('=', 1)[-1])
-            else:
-                return webdriver_or_element.find_element_by_name(locator.split('=', 1)[-1])
-
-        elif locator.count('tag_name=') > 0 and len(locator.split('=')) > 1:
-            if find_all_elements:
-                return webdriver_or_element.find_elements_by_tag_name(locator.split('=', 1)[-1])
-            else:
-                return webdriver_or_element.find_element_by_tag_name(locator.split('=', 1)[-1])
-
-        else:   # default to css
-            if find_all_elements:
-                return webdriver_or_element.find_elements_by_css_selector(locator)
-            else:
-                return webdriver_or_element.find_element_by_css_selector(locator)
+        strategy = LocatorHandler.compile_locator(locator)
+        if find_all_elements:
+            return webdriver_or_element.find_elements(strategy.By, strategy.value)
+        else:
+            return webdriver_or_element.find_element(strategy.By, strategy.value)
@@ -0,0 +1,90 @@
+"""
+Retry policy module -- controls how WebDriverWrapper polls for elements
+"""
+import random
+import time
+
+__author__ = 'justin'
+
+
+class RetryPolicy(object):
+    """
+    Exponential backoff policy used to poll for elements instead of relying on the driver's implicit wait.
+
+    The first attempt is made immediately; each following attempt waits `initial_delay` seconds, multiplied
+    by `multiplier` after every attempt (capped at `max_delay`) and randomized by +/- `jitter` (a fraction of the
+    delay). Attempts stop once `deadline` seconds have elapsed, with a final attempt made at the deadline.
+
+        >>> policy = RetryPolicy(initial_delay=0.05, multiplier=2, deadline=5)
+        >>> for attempt in policy.attempts():
+        >>>     if find_something():
+        >>>         break
+    """
+    def __init__(self, initial_delay=0.05, multiplier=2.0, max_delay=1.0, jitter=0.1, deadline=3.0,
+                 max_attempts=None):
+        """
+        @type initial_delay:    float
+        @param initial_delay:   seconds to wait after the first attempt
+        @type multiplier:       float
+        @param multiplier:      factor the delay grows by after each attempt
+        @type max_delay:        float
+        @param max_delay:       upper bound of a single delay, in seconds
+        @type jitter:           float
+        @param jitter:          fraction of each delay to randomize by (0.1 means +/- 10%)
+        @type deadline:         float
+        @param deadline:        total seconds to keep retrying for
+        @type max_attempts:     int
+        @param max_attempts:    optional cap on the number of attempts
+        """
+        if initial_delay < 0 or max_delay < 0 or deadline < 0:
+            raise ValueError('Retry policy delays and deadline must not be negative')
+        if multiplier < 1:
+            raise ValueError('Retry policy multiplier must be at least 1, was {}'.format(multiplier))
+        if not 0 <= jitter < 1:
+            raise ValueError('Retry policy jitter must be a fraction between 0 and 1, was {}'.format(jitter))
+
+        self.initial_delay = initial_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+
+    def __repr__(self):
+        return '{}(initial_delay={}, multiplier={}, max_delay={}, jitter={}, deadline={}, max_attempts={})'.format(
+            self.__class__.__name__, self.initial_delay, self.multiplier, self.max_delay, self.jitter, self.deadline,
+            self.max_attempts)
+
+    def delays(self):
+        """
+        Yields the (jittered) delay to wait before each retry, without regard to the deadline
+        """
+        delay = self.initial_delay
+        while True:
+            if self.jitter:
+                yield delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+            else:
+                yield delay
+            delay = min(delay * self.multiplier, self.max_delay)
+
+    def attempts(self):
+        """
+        Yields the attempt number (starting at 0) for every attempt permitted by the policy, sleeping between them
+
+        @rtype: generator
+        """
+        end_time = time.time() + self.deadline
+        delays = self.delays()
+        attempt = 0
+
+        while True:
+            yield attempt
+            attempt += 1
+
+            if self.max_attempts is not None and attempt >= self.max_attempts:
+                return
+
+            remaining = end_time - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(min(next(delays), remaining))
@@ -0,0 +1,41 @@
+/* Usage: execute with a single argument: [selectorOrElements, root, requireVisible, requireEnabled, requireOnScreen] */
+
+/* selectorOrElements: a css selector to query, or a list of WebElements to filter */
+/* root: WebElement to search under (when querying a selector), or null to search the whole document */
+/* requireVisible, requireEnabled, requireOnScreen: the filters to apply */
+
+var selectorOrElements = arguments[0][0];
+var root = arguments[0][1] || document;
+var requireVisible = arguments[0][2];
+var requireEnabled = arguments[0][3];
+var requireOnScreen = arguments[0][4];
+
+function isVisible(element) {
+    if (!(element.offsetWidth || element.offsetHeight || element.getClientRects().length)) {
+        return false;
+    }
+    var style = window.getComputedStyle(element);
+    return style.visibility !== 'hidden' && style.visibility !== 'collapse' && parseFloat(style.opacity) !== 0;
+}
+
+function isOnScreen(element) {
+    var rect = element.getBoundingClientRect();
+    var width = window.innerWidth || document.documentElement.clientWidth;
+    var height = window.innerHeight || document.documentElement.clientHeight;
+    return rect.right > 0 && rect.bottom > 0 && rect.left < width && rect.top < height;
+}
+
+var elements = typeof selectorOrElements === 'string' ?
+    root.querySelectorAll(selectorOrElements) : selectorOrElements;
+
+/* Returns [elements passing every filter, number of elements before filtering] */
+var filtered = [];
+for (var i = 0; i < elements.length; i++) {
+    var element = elements[i];
+    if (requireVisible && !isVisible(element)) { continue; }
+    if (requireEnabled && element.disabled) { continue; }
+    if (requireOnScreen && !isOnScreen(element)) { continue; }
+    filtered.push(element);
+}
+
+return [filtered, elements.length];
@@ -0,0 +1,30 @@
+/* Usage: execute with a single argument: [hosts, selector, root] */
+
+/* hosts: list of css selectors of the nested shadow hosts, outermost first */
+/* selector: css selector of the elements to find inside the innermost shadow roots */
+/* root: WebElement to search under, or null to search the whole document */
+
+var hosts = arguments[0][0];
+var selector = arguments[0][1];
+var roots = [arguments[0][2] || document];
+
+for (var i = 0; i < hosts.length; i++) {
+    var shadowRoots = [];
+    for (var j = 0; j < roots.length; j++) {
+        var found = roots[j].querySelectorAll(hosts[i]);
+        for (var k = 0; k < found.length; k++) {
+            if (found[k].shadowRoot) {
+                shadowRoots.push(found[k].shadowRoot);
+            }
+        }
+    }
+    roots = shadowRoots;
+}
+
+/* Returns the list of matching elements, in document order of their shadow roots */
+var elements = [];
+for (var r = 0; r < roots.length; r++) {
+    elements.push.apply(elements, Array.prototype.slice.call(roots[r].querySelectorAll(selector)));
+}
+
+return elements;
@@ -0,0 +1,27 @@
+/* Usage: execute with a single argument: [selectors, root, firstOnly] */
+
+/* selectors: list of css selectors to query */
+/* root: WebElement to search under, or null to search the whole document */
+/* firstOnly: if true, only the first match of each selector is returned */
+
+var selectors = arguments[0][0];
+var root = arguments[0][1] || document;
+var firstOnly = arguments[0][2];
+
+/* Returns a list with one entry per selector: the list of matching elements, or null if the selector failed */
+var results = [];
+for (var i = 0; i < selectors.length; i++) {
+    try {
+        if (firstOnly) {
+            var element = root.querySelector(selectors[i]);
+            results.push(element ? [element] : []);
+        } else {
+            results.push(Array.prototype.slice.call(root.querySelectorAll(selectors[i])));
+        }
+    } catch (ex) {
+        /* let the caller fall back to a regular find, which reports the error */
+        results.push(null);
+    }
+}
+
+return results;
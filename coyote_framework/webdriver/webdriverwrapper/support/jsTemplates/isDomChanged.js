@@ -0,0 +1,25 @@
+/* Reports whether nodes or attributes changed since the last call; installs a MutationObserver on the first call per page */
+
+try {
+    var state = window.__webdriverDomObserver;
+
+    if (!state) {
+        state = window.__webdriverDomObserver = {changed: false};
+        var observer = new MutationObserver(function () {
+            state.changed = true;
+        });
+        /* attribute changes (e.g. class, aria-* or data-* toggles) change which elements a selector matches */
+        observer.observe(document, {childList: true, subtree: true, attributes: true});
+
+        /* nothing was observing this page before, so it may have changed */
+        return true;
+    }
+
+    var changed = state.changed;
+    state.changed = false;
+    return changed;
+
+} catch (ex) {
+    /* if the page cannot be observed, always report a change */
+    return true;
+}
@@ -0,0 +1,53 @@
+/* Usage: execute with a single argument: [elements, fields] */
+
+/* elements: list of WebElements to read */
+/* fields: list of property names (text, tag_name, value, location, size, displayed, enabled, selected) or
+   attribute names */
+
+var elements = arguments[0][0];
+var fields = arguments[0][1];
+
+function isVisible(element) {
+    if (!(element.offsetWidth || element.offsetHeight || element.getClientRects().length)) {
+        return false;
+    }
+    var style = window.getComputedStyle(element);
+    return style.visibility !== 'hidden' && style.visibility !== 'collapse' && parseFloat(style.opacity) !== 0;
+}
+
+function readField(element, field) {
+    switch (field) {
+        case 'text':
+            return isVisible(element) ? (element.innerText || element.textContent || '').trim() : '';
+        case 'tag_name':
+            return element.tagName.toLowerCase();
+        case 'value':
+            return element.value === undefined ? null : element.value;
+        case 'location':
+            var position = element.getBoundingClientRect();
+            return {x: Math.round(position.left + window.pageXOffset), y: Math.round(position.top + window.pageYOffset)};
+        case 'size':
+            var box = element.getBoundingClientRect();
+            return {width: Math.round(box.width), height: Math.round(box.height)};
+        case 'displayed':
+            return isVisible(element);
+        case 'enabled':
+            return !element.disabled;
+        case 'selected':
+            return !!(element.checked || element.selected);
+        default:
+            return element.getAttribute(field);
+    }
+}
+
+/* Returns a list with one list of values (in the order of fields) per element */
+var rows = [];
+for (var i = 0; i < elements.length; i++) {
+    var row = [];
+    for (var j = 0; j < fields.length; j++) {
+        row.push(readField(elements[i], fields[j]));
+    }
+    rows.push(row);
+}
+
+return rows;
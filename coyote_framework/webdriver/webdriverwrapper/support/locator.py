@@ -1,5 +1,10 @@
+import re
+from string import Formatter
+
 __author__ = 'justin'
 
+IDENTIFIER = re.compile(r'^[A-Za-z_]\w*$')
+
 
 class Locator(object):
 
@@ -14,21 +19,69 @@ class Locator(object):
     TEXT = 'text'
     PARTIAL_TEXT = 'partial_text'
 
-    def __init__(self, by, locator, description=None):
+    _compiled = None  # (by, locator, strategy) memoized by LocatorHandler.compile_locator
+
+    def __init__(self, by, locator, description=None, frames=None, shadow_roots=None):
         """
             by -- the method used to select the locator
             locator -- the actual string used to locate the element
             description -- a description of what the locator is used for
+            frames -- locators of the (nested) iframes the element lives in, starting from the top document;
+                      () for the top document itself, or None to search whichever frame is current
+            shadow_roots -- css selectors of the (nested) shadow hosts the element lives in; the locator must be css
         """
         self.by = by
         self.locator = locator
         self.description = description if description is not None else 'no description'
+        self.frames = tuple(frames) if frames is not None else None
+        self.shadow_roots = tuple(shadow_roots) if shadow_roots else ()
 
     def __repr__(self):
-        return '''({by}, {locator}, {description})'''.format(
-            by=self.by, locator=self.locator, description=self.description
+        if self.frames is None and not self.shadow_roots:
+            return '''({by}, {locator}, {description})'''.format(
+                by=self.by, locator=self.locator, description=self.description
+            )
+        return '''({by}, {locator}, {description}, frames={frames}, shadow_roots={shadow_roots})'''.format(
+            by=self.by, locator=self.locator, description=self.description, frames=self.frames,
+            shadow_roots=self.shadow_roots
         )
 
     def build(self, **variables):
         """Formats the locator with specified parameters"""
-        return Locator(self.by, self.locator.format(**variables), self.description)
\ No newline at end of file
+        return Locator(self.by, self.locator.format(**variables), self.description, self.frames, self.shadow_roots)
+
+
+class DynamicLocator(Locator):
+    """
+    Locator template whose '{name}' fields are parsed once, so that building a locator from it is a single join
+
+        >>> row_cell = DynamicLocator('css', 'tr[data-row="{row}"] td.{column}', 'table cell')
+        >>> row_cell.build(row=3, column='price')
+        (css, tr[data-row="3"] td.price, table cell)
+    """
+    def __init__(self, by, locator, description=None, frames=None, shadow_roots=None):
+        super(DynamicLocator, self).__init__(by, locator, description, frames, shadow_roots)
+        self._segments = []
+        self._simple = True
+
+        for literal, field_name, format_spec, conversion in Formatter().parse(locator):
+            if field_name is not None and (format_spec or conversion or not IDENTIFIER.match(field_name)):
+                # Attribute/index lookups, conversions and format specs need the full str.format
+                self._simple = False
+            self._segments.append((literal, field_name))
+
+    def build(self, **variables):
+        """Formats the locator with specified parameters, substituting all of them in one pass"""
+        if not self._simple:
+            return super(DynamicLocator, self).build(**variables)
+
+        parts = []
+        for literal, field_name in self._segments:
+            parts.append(literal)
+            if field_name is not None:
+                try:
+                    value = variables[field_name]
+                except KeyError:
+                    raise KeyError('Missing variable "{}" for locator template {}'.format(field_name, self.locator))
+                parts.append(value if isinstance(value, str) else str(value))
+        return Locator(self.by, ''.join(parts), self.description, self.frames, self.shadow_roots)